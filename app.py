@@ -3,18 +3,15 @@ from utils import *
 from bridges import *
 from ports import *
 from measurements import *
+from store import get_store
+from concurrent.futures import ThreadPoolExecutor
 import argparse
+import time
+import hashlib
 import re
-import yaml
 from pathlib import Path
 
-HOSTS_DATA = "sys_data/hosts.json"
-BRIDGES_DATA = "sys_data/bridges.json"
-CONTAINERS_DATA = "sys_data/containers.json"
-QOS_DATA = "sys_data/qos.json"
-VXLAN_DATA = "sys_data/vxlans.json"
-
-MEASUREMENTS = "measurements_data"
+SCAN_STATE = "sys_data/scan_state.json"
 
 FL_REPO = "https://github.com/Walid-N-bit/fl_app.git"
 
@@ -33,15 +30,25 @@ def args_func():
         action="store_true",
         help="Check interfaces on the host and stores data in a file.",
     )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="with --scan: only update the data that changed since the last scan",
+    )
     parser.add_argument(
         "--build",
-        choices=["bridges", "containers", "vxlans", "qos", "queues"],
+        choices=["bridges", "containers", "vxlans", "qos", "queues", "golden"],
         help="Build the network.",
     )
 
     parser.add_argument(
         "--deploy", action="store_true", help="Deploy FL app in all containers"
     )
+    parser.add_argument(
+        "--redeploy",
+        action="store_true",
+        help="with --deploy: run every deploy step again, even finished ones",
+    )
     parser.add_argument("--train", action="store_true", help="start model training")
     parser.add_argument(
         "--partition",
@@ -56,20 +63,61 @@ def args_func():
         action="store_true",
         help="hard-reset to remote repo on all containers",
     )
+    parser.add_argument(
+        "--mesh",
+        action="store_true",
+        help="measure the throughput between every pair of containers",
+    )
+    parser.add_argument(
+        "--latency",
+        action="store_true",
+        help="measure the round trip time between every pair of containers",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="run one throughput test and print its intervals live",
+    )
+    parser.add_argument(
+        "--qos-test",
+        action="store_true",
+        help="check that every QoS queue limits traffic to its max rate",
+    )
+    parser.add_argument(
+        "--analyze",
+        action="store_true",
+        help="print statistics of the stored measurements",
+    )
     args = parser.parse_args()
     return args
 
 
-def update_host_data():
+def get_host_facts() -> dict:
     """
-    get data about the host. update hosts.json
+    return facts about the host that several collectors need.
+    """
+    return {"hostname": get_hostname(), "ipv4s": get_ipv4s()}
+
+
+def save_collection(name: str, items: list[dict]):
+    """
+    upsert items in a sys_data collection.
+    """
+    store = get_store()
+    with store.transaction():
+        store.collection(name).upsert_many(items)
+
+
+def collect_host_data(facts: dict, links: list[dict] | None = None) -> list[dict]:
+    """
+    return the hosts.json item of this host.
     see data schema in schemas/host.schema.json
+    links: interfaces already read (see get_ifaces). read again if None
     """
-    hostname = get_hostname()
-    ips = get_ipv4s()
     ifaces = []
-    for ip in ips:
-        output = get_iface_data(ip)
+    ifaces_by_ip = get_ifaces_by_ip(links)
+    for ip in facts["ipv4s"]:
+        output = ifaces_by_ip.get(ip, {})
         iface_data = {
             "iface": output.get("ifname"),
             "ipv4": ip,
@@ -78,118 +126,109 @@ def update_host_data():
         }
         ifaces.append(iface_data)
 
-    item = {"hostname": hostname, "ifaces": ifaces}
-    update_json_file(key="hostname", value=hostname, new_item=item, path=HOSTS_DATA)
+    return [{"hostname": facts["hostname"], "ifaces": ifaces}]
 
 
-def update_brs_data():
+def collect_brs_data(facts: dict, rows: dict | None = None) -> list[dict]:
     """
-    return a dict object containing ovs bridges info.
-    :return: ovs brs data
-    :rtype: dict
+    return the bridges.json items of the ovs bridges in this host.
+    rows: OVS rows already read (see get_scan_rows). read again if None
     """
-    hostname = get_hostname()
-    bridges = get_ovs_brs()
+    if rows is None:
+        bridges = get_ovs_brs()
+    else:
+        bridges = sorted(br["name"] for br in rows["Bridge"])
+    items = []
     for br in bridges:
         item = {
             "br_name": br,
-            "hostname": hostname,
+            "hostname": facts["hostname"],
             "controller": CONTROLLER,
         }
-        update_json_file(key="br_name", value=br, new_item=item, path=BRIDGES_DATA)
+        items.append(item)
+    return items
 
 
-def update_container_data():
+def collect_container_data(facts: dict) -> list[dict]:
     """
-    get info about containers then update their data.
-
-    :return: Description
-    :rtype: Literal[True]
+    return the containers.json items. all containers are read with one call.
     """
-    container_names = cmd("sudo lxc list --format=csv -c n").splitlines()
-    data = []
-    for cont in container_names:
-        out = cmd(f"sudo lxc config show {cont}")
-        yaml_data = yaml.safe_load(out)
-        # the output of this is str
-        user_config = yaml_data.get("config").get("user.network-config")
-        user_devices = yaml_data.get("devices")
-        # must be converted to yaml
-        user_config_yaml = yaml.safe_load(user_config)
-
-        # container name = cont
-        br_name = user_devices.get("eth0", {}).get("parent", {})
-        ovs_port = yaml_data.get("config").get("volatile.eth0.host_name", "")
-        ifaces = []
-        vlan = user_config_yaml.get("vlans")
-        vlan_name = [key for key in vlan.keys()][0]
-        vlan_ip_addr = vlan.get(vlan_name).get("addresses", [])
-        vlan_id = vlan.get(vlan_name).get("id")
-        ifaces.append({vlan_name: {"id": vlan_id, "addresses": vlan_ip_addr}})
-
-        ethernets = user_config_yaml.get("ethernets").keys()
-        for eth in ethernets:
-            addr = user_config_yaml.get("ethernets").get(eth).get("addresses", [])
-            ifaces.append({eth: {"addresses": addr}})
+    return get_container_inventory()
 
-        item = {
-            "container": cont,
-            "interfaces": ifaces,
-            "bridge": br_name,
-            "ovs_port": ovs_port,
-        }
-        update_json_file(
-            key="container", value=cont, new_item=item, path=CONTAINERS_DATA
+
+def collect_vxlan_data(facts: dict, rows: dict | None = None) -> list[dict]:
+    """
+    return the vxlans.json items of the VXLANs in this host.
+    rows: OVS rows already read (see get_scan_rows). read again if None
+    """
+    vxlan_data = []
+    for vxlan in get_vxlan_data(rows):
+        item = dict(
+            vxlan=vxlan["name"],
+            host=dict(name=facts["hostname"], addresses=facts["ipv4s"]),
+            remote_host=vxlan["remote_ip"],
+            bridge=vxlan["bridge"],
+            key=vxlan["key"],
+            dst_port=vxlan["dst_port"],
         )
+        vxlan_data.append(item)
+    return vxlan_data
 
 
-def update_vxlan_data():
+def collect_qos_data(facts: dict, rows: dict | None = None) -> list[dict]:
     """
-    get info about VXLANs then update their data.
+    return the qos.json items of the QoS objects in this host.
+    rows: OVS rows and QoS tags already read (see get_scan_rows). read again if None
+    """
+    return get_qos_data(rows)
+
 
-    :return: Description
-    :rtype: Literal[True]
+# collection name -> collector
+COLLECTORS = {
+    "hosts": collect_host_data,
+    "bridges": collect_brs_data,
+    "containers": collect_container_data,
+    "vxlans": collect_vxlan_data,
+    "qos": collect_qos_data,
+}
+
+# max number of collectors running at the same time during a scan
+SCAN_WORKERS = len(COLLECTORS)
+
+
+def update_host_data():
     """
-    all_vxlans = get_vxlans()
-    bridges = get_ovs_brs()
-    vxlan_data = []
+    get data about the host. update hosts.json
+    """
+    save_collection("hosts", collect_host_data(get_host_facts()))
 
-    for br in bridges:
-        ifaces = get_ifaces(br)
-        for iface in ifaces:
-            if iface in all_vxlans:
-                hostname = get_hostname()
-                host_ips = get_ipv4s()
-                options = get_vxlan_options(iface).get("options")
-                item = dict(
-                    vxlan=iface,
-                    host=dict(name=hostname, addresses=host_ips),
-                    remote_host=options.get("remote_ip"),
-                )
-                vxlan_data.append(item)
 
-    add_to_json_file(path=VXLAN_DATA, new_items=vxlan_data)
+def update_brs_data():
+    """
+    get data about the ovs bridges. update bridges.json
+    """
+    save_collection("bridges", collect_brs_data(get_host_facts()))
+
+
+def update_container_data():
+    """
+    get info about containers then update their data.
+    """
+    save_collection("containers", collect_container_data(get_host_facts()))
+
+
+def update_vxlan_data():
+    """
+    get info about VXLANs then update their data.
+    """
+    save_collection("vxlans", collect_vxlan_data(get_host_facts()))
 
 
 def update_qos_data():
     """
     get QoS objects in the host and save their data in a json file.
-
-    :return: Description
-    :rtype: Literal[True]
     """
-    new_data = []
-    qos_objs = get_all_qos()
-    for qos in qos_objs:
-        item = dict(
-            qos_id=qos,
-            tag=get_qos_tag(qos),
-            default_rate=get_qos_default_rate(qos_id=qos),
-            ports=get_qos_ports(qos),
-            queues=get_qos_queues(qos),
-        )
-        new_data.append(item)
-    add_to_json_file(new_items=new_data, path=QOS_DATA)
+    save_collection("qos", collect_qos_data(get_host_facts()))
 
 
 def is_vlan_ip(vlan: str | int, ip: str):
@@ -220,7 +259,7 @@ def net_hosts_ips(vlan: str | int):
     :return: IPv4s of all host machines
     :rtype: list[str]
     """
-    hosts_data = read_json_file(path=HOSTS_DATA)
+    hosts_data = get_store().collection("hosts").all()
     data = []
     for item in hosts_data:
         ifaces = item.get("ifaces")
@@ -231,15 +270,161 @@ def net_hosts_ips(vlan: str | int):
     return data
 
 
-def save_sys_data():
+def save_sys_data(workers: int = SCAN_WORKERS) -> dict[str, float]:
+    """
+    get system info and save it to appropriate json files.
+    collectors query independent subsystems, so they run concurrently
+    and share the host facts. results are saved in one transaction.
+
+    :param workers: max number of collectors running at the same time
+    :type workers: int
+    :return: seconds spent in each collector
+    :rtype: dict[str, float]
+    """
+
+    def timed(collector: Callable, facts: dict):
+        start = time.perf_counter()
+        items = collector(facts)
+        return items, time.perf_counter() - start
+
+    start = time.perf_counter()
+    # facts are fetched again once per scan
+    invalidate_host_facts()
+    facts = get_host_facts()
+    timings = {"host facts": time.perf_counter() - start}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            name: pool.submit(timed, collector, facts)
+            for name, collector in COLLECTORS.items()
+        }
+    results = {}
+    errors = {}
+    for name, future in futures.items():
+        try:
+            results[name], timings[name] = future.result()
+        except Exception as e:
+            errors[name] = e
+
+    store = get_store()
+    with store.transaction():
+        for name, items in results.items():
+            store.collection(name).upsert_many(items)
+    save_host_facts()
+    timings["total"] = time.perf_counter() - start
+
+    print("\nScan timings:")
+    for name, seconds in timings.items():
+        print(f"  {name:<12} {seconds:7.3f}s")
+    for name, e in errors.items():
+        print(f"  {name:<12} FAILED: {e}")
+    return timings
+
+
+# collection -> OVS tables (and stored QoS tags) it is built from
+OVS_SOURCES = {
+    "bridges": ["Bridge"],
+    "vxlans": ["Bridge", "Port", "Interface"],
+    "qos": ["QoS", "Queue", "Port", "qos_tags"],
+}
+
+
+def fingerprint(data) -> str:
     """
-    get system info and save it to appropriate json files
+    return a short hash of json-serializable data.
     """
-    update_host_data()
-    update_brs_data()
-    update_container_data()
-    update_vxlan_data()
-    update_qos_data()
+    text = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def iface_links(links: list[dict]) -> dict[str, list]:
+    """
+    return the MTU, link state and VLAN id of each interface, by name.
+    they change the host data without changing the host facts.
+    """
+    return {
+        link.get("ifname"): [
+            link.get("mtu"),
+            link.get("operstate"),
+            link.get("linkinfo", {}).get("info_data", {}).get("id"),
+        ]
+        for link in links
+    }
+
+
+def save_sys_data_incremental() -> dict[str, float]:
+    """
+    update only the system data that changed since the last scan.
+    fingerprints of the host facts and interfaces, of each OVS table, of the
+    QoS tags and of each container are kept in sys_data/scan_state.json. collectors run only
+    for changed sources, on the rows already read for the fingerprints, and
+    only changed containers are parsed again.
+
+    :return: seconds spent in each step
+    :rtype: dict[str, float]
+    """
+    start = time.perf_counter()
+    timings = {}
+    state = read_json_file(SCAN_STATE) or {}
+    new_state = {}
+    results = {}
+
+    invalidate_host_facts()
+    facts = get_host_facts()
+    links = get_ifaces()
+    new_state["host"] = fingerprint([facts, iface_links(links)])
+    host_changed = state.get("host") != new_state["host"]
+    if host_changed:
+        results["hosts"] = collect_host_data(facts, links)
+    timings["hosts"] = time.perf_counter() - start
+
+    step = time.perf_counter()
+    rows = get_scan_rows()
+    new_state["ovs"] = {table: fingerprint(r) for table, r in rows.items()}
+    old_ovs = state.get("ovs", {})
+    for name, tables in OVS_SOURCES.items():
+        changed = any(old_ovs.get(t) != new_state["ovs"][t] for t in tables)
+        # vxlan items also hold the host facts
+        if changed or (name == "vxlans" and host_changed):
+            results[name] = COLLECTORS[name](facts, rows)
+    timings["ovs"] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    instances = get_instances(state=False)
+    old_lxd = state.get("lxd", {})
+    new_state["lxd"] = {}
+    changed_conts = []
+    for inst in instances:
+        name = inst.get("name")
+        config = [inst.get("expanded_config"), inst.get("expanded_devices")]
+        new_state["lxd"][name] = fingerprint(config)
+        if old_lxd.get(name) != new_state["lxd"][name]:
+            item = parse_container(inst)
+            if item:
+                changed_conts.append(item)
+    removed_conts = [name for name in old_lxd if name not in new_state["lxd"]]
+    timings["containers"] = time.perf_counter() - step
+
+    store = get_store()
+    with store.transaction():
+        for name, items in results.items():
+            store.collection(name).upsert_many(items)
+        store.collection("containers").upsert_many(changed_conts)
+        for name in removed_conts:
+            store.collection("containers").delete(name)
+    save_json_file(data=new_state, path=SCAN_STATE)
+    save_host_facts()
+    timings["total"] = time.perf_counter() - start
+
+    updated = sorted(results)
+    if changed_conts or removed_conts:
+        updated.append("containers")
+    print(f"\nUpdated: {', '.join(updated) or 'nothing, no changes'}")
+    print(f"Containers changed: {len(changed_conts)}, removed: {len(removed_conts)}")
+    print("\nScan timings:")
+    for name, seconds in timings.items():
+        print(f"  {name:<12} {seconds:7.3f}s")
+    return timings
 
 
 def is_yes(message: str):
@@ -261,46 +446,25 @@ def is_yes(message: str):
 
 def run_test():
     """
-    Run a network test between two containers then safe the data to a csv file.
+    Run a network test between two containers then save the data to the
+    measurement store.
     """
-    _, client_out = run_iperf_test(server="cont-1", client="cont-2")
-    parsed_data = parse_iperf(client_out)
-    save_to_csv(
-        path=f"{MEASUREMENTS}/{TIME}.csv", data=parsed_data, headers=DATA_FIELDS
+    from measure_store import MeasurementStore, new_run_id
+
+    result = run_iperf_test(server="cont-1", client="cont-2")
+    if not result.ok:
+        print(f"Test failed: {result.error}")
+        return
+    summary = result.summary
+    print(
+        f"{result.client} -> {result.server}: "
+        f"{summary.bits_per_second_received / 1e6:.1f} Mbit/s "
+        f"({len(result.intervals)} intervals)"
     )
-
-
-def clone_to_container(name: str):
-    """
-    download a repo into a container
-
-    :param name: container name
-    :type name: str
-    """
-    input = f"sudo lxc exec {name} -- git clone {FL_REPO}"
-    output = cmd(input, shell=True)
-    return output
-
-
-def get_nvidia_driver_version():
-    """
-    query the Nvidia driver version on the host machine. return as string.
-    """
-    command = "nvidia-smi --query-gpu=driver_version --format=csv,noheader"
-    output = cmd(command, shell=True).strip().split(".")
-    return output[0]
-
-
-def install_dependencies(name: str, input: tuple):
-    """
-    Install necessary drivers and Python dependencies
-    """
-
-    print(input[0])
-    command = f"sudo lxc exec {name} -- bash -c '{input[1]}'"
-
-    output = cmd(command, shell=True)
-    return output
+    run_id = new_run_id()
+    with MeasurementStore() as store:
+        store.add_result(result, run_id)
+    print(f"Saved as run {run_id}")
 
 
 def main():
@@ -309,7 +473,14 @@ def main():
     if args.test:
         pass
 
-    if args.scan:
+    if not args.scan:
+        # reuse host facts saved by a recent scan
+        load_host_facts()
+
+    if args.scan and args.incremental:
+        save_sys_data_incremental()
+
+    elif args.scan:
         save_sys_data()
 
     elif args.build:
@@ -337,7 +508,32 @@ def main():
                 cont_ids_int = [int(id.strip()) for id in cont_ids_tokens]
                 target_br = input("\nOVS bridge that connects containers: ").strip()
                 vlan = input("\nVLAN: ").strip()
-                create_conts_for_br(br=target_br, cont_ids=cont_ids_int, vlan=vlan)
+                parallel = int(
+                    input(
+                        f"\nContainers to launch at the same time (Default = {PROVISION_WORKERS}): "
+                    ).strip()
+                    or PROVISION_WORKERS
+                )
+                golden = input(
+                    "\nGolden image to clone from (Default = none, fresh ubuntu image): "
+                ).strip()
+                create_conts_for_br(
+                    br=target_br,
+                    cont_ids=cont_ids_int,
+                    vlan=vlan,
+                    parallel=parallel,
+                    golden=golden,
+                )
+
+            case "golden":
+                conts = get_container_names()
+                print(f"\nContainers: {','.join(conts)}")
+                source = input("\nDeployed container to publish: ").strip()
+                alias = (
+                    input(f"\nImage alias (Default = {GOLDEN_IMAGE}): ").strip()
+                    or GOLDEN_IMAGE
+                )
+                print(create_golden_image(source, alias))
 
             case "vxlans":
                 vlan = input("\nProvide the network VLAN: ").strip()
@@ -363,6 +559,7 @@ def main():
 
     elif args.deploy:
         from fl_utils import save_original_toml
+        from deploy import deploy_containers, DEPLOY_WORKERS
 
         conts = get_container_names()
         print(f"\nContainers: {','.join(conts)}")
@@ -372,41 +569,18 @@ def main():
             .strip()
             .split(",")
         )
-        version = get_nvidia_driver_version()
-        inputs = [
-            (
-                "\n### Update and upgrade ###",
-                "sudo apt update -y && sudo apt upgrade -y",
-            ),
-            # (
-            #     "\n### Nvidia driver install ###",
-            #     f"sudo apt install nvidia-utils-{version} -y",
-            # ),
-            (
-                "\n### Python venv and pip install ###",
-                "sudo apt install -y git python3-pip && sudo apt install python3-venv -y",
-            ),
-            ("\n### create venv ###", "cd fl_app && python3 -m venv venv"),
-            (
-                "\n### PyTorch and requirements ###",
-                "source fl_app/venv/bin/activate && pip3 install torch torchvision --index-url https://download.pytorch.org/whl/cu130 && pip install -r fl_app/requirements.txt",
-            ),
-            (
-                "\n ### Checking CUDA... ###",
-                "source fl_app/venv/bin/activate && python3 fl_app/check_cuda.py",
-            ),
-            ("\n ### Rebooting... ###", "sudo reboot"),
-        ]
-
-        for cont in target_conts:
-            print(f"\n##### {cont} ####\n")
-            out1 = clone_to_container(cont)
-            print(out1)
-
-            for i in inputs:
-                out = install_dependencies(cont, i)
-                print(out)
-        save_original_toml(target_conts[0])
+        workers = int(
+            input(
+                f"\nContainers to deploy at the same time (Default = {DEPLOY_WORKERS}): "
+            ).strip()
+            or DEPLOY_WORKERS
+        )
+        reports = deploy_containers(
+            target_conts, FL_REPO, workers=workers, force=args.redeploy
+        )
+        # the original pyproject.toml is only there once the deploy succeeded
+        if any(r["ok"] and r["container"] == target_conts[0] for r in reports):
+            save_original_toml(target_conts[0])
 
     elif args.train:
         from fl_utils import start_fed_training
@@ -431,7 +605,13 @@ def main():
         server = (
             input(f"\nServer container (Default: {conts[0]}): ").strip() or conts[0]
         )
-        update_nodes(conts, server)
+        workers = int(
+            input(
+                f"\nContainers to update at the same time (Default = {MAX_PARALLEL}): "
+            ).strip()
+            or MAX_PARALLEL
+        )
+        update_nodes(conts, FL_REPO, server, workers)
 
     elif args.partition or args.partition == 0:
         from fl_utils import (
@@ -463,25 +643,95 @@ def main():
             print(f"{cont} : {part_info[cont]}")
 
     elif args.reset:
+        from git_mirror import (
+            prepare_mirror,
+            fetch_command,
+            git_all,
+            mirror_head,
+            print_revisions,
+        )
+
         conts = get_container_names()
-        for c in conts:
-            out = cmd(f"lxc exec {c} -- git -C fl_app fetch origin", shell=True)
-            print(out)
-            out = cmd(
-                f"lxc exec {c} -- git -C fl_app reset --hard origin/main", shell=True
-            )
-            print(out)
-        out = cmd(
-            f"lxc exec {conts[0]} -- scp fl_app/pyproject.toml /root/data/pyproject_copy.toml",
-            shell=True,
+        workers = int(
+            input(
+                f"\nContainers to reset at the same time (Default = {MAX_PARALLEL}): "
+            ).strip()
+            or MAX_PARALLEL
+        )
+        if not prepare_mirror(FL_REPO, conts):
+            return
+        reset = f"{fetch_command(FL_REPO)} && git -C fl_app reset --hard origin/main"
+        reports = git_all(conts, reset, workers)
+        print_revisions(reports, expected=mirror_head(FL_REPO))
+        out = lxc_cmd(
+            conts[0],
+            "scp fl_app/pyproject.toml /root/data/pyproject_copy.toml",
+            sudo=False,
         )
         print(out)
-        out = cmd(
-            f"lxc exec {conts[0]} -- scp fl_app/pyproject.toml /root/data/pyproject_original.toml",
-            shell=True,
+        out = lxc_cmd(
+            conts[0],
+            "scp fl_app/pyproject.toml /root/data/pyproject_original.toml",
+            sudo=False,
         )
         print(out)
 
+    elif args.mesh:
+        selected = input(
+            "\nContainers to measure (e.g.: cont-1,cont-2,...) (Default: all): "
+        ).strip()
+        duration = int(
+            input(f"\nSeconds per test (Default = {IPERF_DURATION}): ").strip()
+            or IPERF_DURATION
+        )
+        run_mesh_test(selected.split(",") if selected else None, duration)
+
+    elif args.latency:
+        selected = input(
+            "\nContainers to measure (e.g.: cont-1,cont-2,...) (Default: all): "
+        ).strip()
+        count = int(
+            input(f"\nPings per pair (Default = {PING_COUNT}): ").strip() or PING_COUNT
+        )
+        measure_latency(selected.split(",") if selected else None, count)
+
+    elif args.watch:
+        conts = get_container_names()
+        client = (
+            input(f"\nClient container (Default: {conts[0]}): ").strip() or conts[0]
+        )
+        server = (
+            input(f"\nServer container (Default: {conts[1]}): ").strip() or conts[1]
+        )
+        duration = int(
+            input(f"\nTest length in seconds (Default = {IPERF_DURATION}): ").strip()
+            or IPERF_DURATION
+        )
+        stop_below = float(
+            input(
+                "\nStop when the bitrate is below, in Mbit/s (Default: never): "
+            ).strip()
+            or 0
+        )
+        watch_test(client, server, duration, stop_below * 1e6)
+
+    elif args.qos_test:
+        duration = int(
+            input(f"\nSeconds per queue (Default = {IPERF_DURATION}): ").strip()
+            or IPERF_DURATION
+        )
+        tolerance = float(
+            input(
+                f"\nAccepted deviation in % (Default = {QOS_TOLERANCE * 100:g}): "
+            ).strip()
+            or QOS_TOLERANCE * 100
+        )
+        run_qos_benchmark(duration, tolerance / 100)
+
+    elif args.analyze:
+        selected = input("\nRun ids to analyze (Default: all): ").strip()
+        analyze_measurements(selected.split(",") if selected else None)
+
 
 if __name__ == "__main__":
     main()
@@ -5,6 +5,7 @@ sudo ovs-vsctl get qos c89c4937-de5e-4f6f-96e4-d98001f4f1d6 other_config:max-rat
 """
 
 from utils import *
+from ovsdb import get_ovsdb, as_list
 from typing import Literal
 
 CONTROLLER = "tcp:10.0.1.5:6653"
@@ -18,6 +19,11 @@ def get_port_qos(port: str):
     """
     return QoS object attached to given OVS port name.
     """
+    db = get_ovsdb()
+    if db:
+        rows = db.select("Port", [["name", "==", port]], ["qos"])
+        qos = as_list(rows[0].get("qos")) if rows else []
+        return f"{qos[0]}\n" if qos else "[]\n"
     return cmd(f"{VSCTL} get port {port} qos")
 
 
@@ -28,6 +34,9 @@ def get_ovs_brs():
     :return: list of ovs bridges
     :rtype: list[str]
     """
+    db = get_ovsdb()
+    if db:
+        return sorted(r["name"] for r in db.select("Bridge", columns=["name"]))
     input = f"{VSCTL} list-br"
     output = cmd(input)
     out_lines = output.splitlines()
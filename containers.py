@@ -3,87 +3,145 @@ this module creates LXD containers
 """
 
 from utils import *
-from pathlib import Path
+from lxd import image_source
+from store import get_store
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import yaml
+import time
+import copy
+import re
+
+# C loader is much faster when PyYAML is built with libyaml
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
 DFLT_SERVER = "ubuntu"
 DFLT_IMAGE = "24.04"
 DFLT_PROFILE = "default_profile.yaml"
 
+# alias of the local image new FL nodes are cloned from
+GOLDEN_IMAGE = "fl-golden"
+GOLDEN_SNAPSHOT = "golden"
+
+# max number of containers launched at the same time
+PROVISION_WORKERS = 4
+
 # ===== command functions ===== #
 # functions that return executable commands as strings #
 
 
-def create_container(
-    name: str, profile: str = "", server: str = DFLT_SERVER, image: str = DFLT_IMAGE
-):
+def launch_container(
+    name: str, profile: dict, server: str = DFLT_SERVER, image: str = DFLT_IMAGE
+) -> CmdResult:
     """
-    creates one LXD container using input params.
-    profile must contain the final settings values for the container.
+    create and start a container and return a CmdResult with its exit code.
+    uses the LXD API when available, `lxc launch` otherwise. the profile
+    gives the container's config and devices, the same way
+    `lxc launch ... < profile` reads them.
+
+    :param name: container name
+    :type name: str
+    :param profile: profile data, e.g. from render_profile()
+    :type profile: dict
+    :param server: image server, or "local"
+    :type server: str
+    :param image: image alias
+    :type image: str
+    :rtype: CmdResult
     """
-    # input = f"sudo lxc init {server}:{image} {name}"
-    input = f"sudo lxc launch {server}:{image} {name}"
-    if profile != "":
-        # input = f"sudo lxc init {server}:{image} {name} < {profile}"
-        input = f"sudo lxc launch {server}:{image} {name} < {profile}"
-    print(f"Creating container {name}... ", end="")
-    output = cmd(input, shell=True)
-    print("Finished")
-    return output
+    result = CmdResult(command=f"lxc launch {server}:{image} {name}")
+    start = time.perf_counter()
+    lxd = get_lxd()
+    if lxd:
+        try:
+            lxd.launch(
+                name,
+                source=image_source(server, image),
+                config=profile.get("config"),
+                devices=profile.get("devices"),
+            )
+            result.returncode = 0
+            result.stdout = f"Created and started {name}\n"
+        except LXDError as e:
+            result.stderr = f"Error: {e}\n"
+    else:
+        input = ["sudo", "lxc", "launch", f"{server}:{image}", name]
+        # the profile is read from stdin, no temp file needed
+        stdin = yaml.safe_dump(profile, sort_keys=False) if profile else ""
+        try:
+            proc = subprocess.run(input, input=stdin, capture_output=True, text=True)
+            result.returncode = proc.returncode
+            result.stdout, result.stderr = proc.stdout, proc.stderr
+        except OSError as e:
+            result.stderr = f"Error: {e}\n"
+    result.duration = time.perf_counter() - start
+    return result
+
 
+# placeholders of user.network-config in the profile
+PROFILE_FIELDS = (
+    "eth1_host",
+    "vlan_iface",
+    "vlan_id",
+    "vlan_host",
+    "lxdbr0_ip",
+    "lxdbr0_netmask",
+)
+PROFILE_PATTERN = re.compile("|".join(PROFILE_FIELDS))
 
-def create_temp_profile(file: str):
-    copy_file(file, f"temp_{file}")
-    return f"temp_{file}"
+# profile path -> parsed profile
+_profile_templates = {}
 
 
-def edit_yaml(
+def load_profile_template(path: str = DFLT_PROFILE) -> dict:
+    """
+    return the parsed profile at path. the file is read only once.
+    """
+    if path not in _profile_templates:
+        with open(path, "r") as f:
+            _profile_templates[path] = yaml.load(f, Loader=YAML_LOADER)
+    return _profile_templates[path]
+
+
+def render_profile(
     host_id: int,
     vlan_id: int,
     ovs_br: str,
     path: str = DFLT_PROFILE,
 ) -> dict:
     """
-    create a temporary .yaml profile using the passed params.
-    modify contents of the .yaml file.
-    return the name of the profile.
-    """
-    from ruamel.yaml import YAML
-
-    yaml = YAML()
+    return the profile of one container, rendered in memory from the template.
 
+    :param host_id: container id
+    :type host_id: int
+    :param vlan_id: vlan of the container
+    :type vlan_id: int
+    :param ovs_br: ovs bridge the container is attached to
+    :type ovs_br: str
+    :param path: profile template
+    :type path: str
+    :return: profile data
+    :rtype: dict
+    """
+    # get_iface_info() is cached, lxdbr0 is only queried once
     lxdbr0_ipv4, lxdbr0_netmask = get_iface_info("lxdbr0")
-    lxdbr0_ip = lxdbr0_ipv4.split(".")
-    lxdbr0_ip = ".".join(lxdbr0_ip[:3])
-
-    profile = create_temp_profile(path)
-    # with open(profile, "r") as f:
-    #     profile_data = yaml.safe_load(f)
-    profile_data = yaml.load(Path(profile))
+    lxdbr0_ip = ".".join(lxdbr0_ipv4.split(".")[:3])
+    values = {
+        "eth1_host": f"{host_id}",
+        "vlan_iface": f"vlan{vlan_id}",
+        "vlan_id": f"{vlan_id}",
+        "vlan_host": f"{host_id}",
+        "lxdbr0_ip": lxdbr0_ip,
+        "lxdbr0_netmask": f"{lxdbr0_netmask}",
+    }
 
+    profile_data = copy.deepcopy(load_profile_template(path))
     config = profile_data["config"]["user.network-config"]
-    new_config = (
-        config.replace("eth1_host", f"{host_id}")
-        .replace("vlan_iface", f"vlan{vlan_id}")
-        .replace("vlan_id", f"{vlan_id}")
-        .replace("vlan_host", f"{host_id}")
-        .replace("lxdbr0_ip", f"{lxdbr0_ip}")
-        .replace("lxdbr0_netmask", f"{lxdbr0_netmask}")
-    )
+    new_config = PROFILE_PATTERN.sub(lambda m: values[m.group(0)], config)
     profile_data["config"]["user.network-config"] = new_config
     profile_data["devices"]["eth0"]["host_name"] = f"cont-{host_id}"
     profile_data["devices"]["eth1"]["host_name"] = f"cont-{host_id}-lxdbr0"
     profile_data["devices"]["eth0"]["parent"] = ovs_br
-    print(f"\nCreating profile for 10.0.{vlan_id}.{host_id}...", end=" ")
-    try:
-        # with open(Path(profile), "w") as f:
-        #     yaml.dump(profile_data, f)
-        abs_path = Path(profile).absolute()
-        yaml.dump(profile_data, abs_path)
-        print("Profile created.")
-    except Exception as e:
-        raise e
-
-    return profile
+    return profile_data
 
 
 def list_conts_in_vm(vm: str):
@@ -99,6 +157,28 @@ def list_conts():
     return list of lxc containers in a host and their IP addresses.
     """
     headers = ["name", "status", "ipv4", "ipv6", "type", "snapshot"]
+    lxd = get_lxd()
+    if lxd:
+        rows = []
+        for inst in lxd.instances(recursion=2):
+            addrs = {"inet": [], "inet6": []}
+            networks = (inst.get("state") or {}).get("network") or {}
+            for iface, net in networks.items():
+                for a in net.get("addresses", []):
+                    if a.get("scope") == "global" and a.get("family") in addrs:
+                        addrs[a["family"]].append(f"{a['address']} ({iface})")
+            rows.append(
+                [
+                    inst.get("name"),
+                    inst.get("status", "").upper(),
+                    " ".join(addrs["inet"]),
+                    " ".join(addrs["inet6"]),
+                    inst.get("type", "").upper(),
+                    str(len(inst.get("snapshots") or [])),
+                ]
+            )
+        print("\n".join(",".join(r) for r in sorted(rows)))
+        return
     raw_output = cmd("sudo lxc list -f csv")
 
     print(raw_output)
@@ -108,20 +188,111 @@ def list_conts():
 ####### functions that execute and create data objects #######
 
 
+def create_golden_image(container: str, alias: str = GOLDEN_IMAGE) -> str:
+    """
+    snapshot a deployed container and publish the snapshot as a local image.
+    new containers launched from this image get the FL app and its
+    dependencies without running --deploy again.
+
+    :param container: configured container to publish
+    :type container: str
+    :param alias: alias of the local image
+    :type alias: str
+    :return: command output
+    :rtype: str
+    """
+    print(f"Publishing {container} as image '{alias}'... ", end="")
+    lxd = get_lxd()
+    if lxd:
+        try:
+            lxd.snapshot(container, GOLDEN_SNAPSHOT)
+            lxd.publish(container, alias, snapshot=GOLDEN_SNAPSHOT)
+            output = f"Published {container}/{GOLDEN_SNAPSHOT} as {alias}\n"
+        except LXDError as e:
+            output = f"Error: {e}\n"
+    else:
+        output = cmd(f"sudo lxc snapshot {container} {GOLDEN_SNAPSHOT} --reuse")
+        output += cmd(
+            f"sudo lxc publish {container}/{GOLDEN_SNAPSHOT} --alias {alias} --reuse"
+        )
+    print("Finished")
+    return output
+
+
+def provision_container(id: int, br: str, vlan: int, golden: str = "") -> dict:
+    """
+    create the profile of one container and launch it.
+    if a golden image alias is given, the container is cloned from that
+    local image instead of the default ubuntu image.
+
+    :return: name, ok, seconds and output of the launch
+    :rtype: dict
+    """
+    name = f"cont-{id}"
+    start = time.perf_counter()
+    try:
+        profile = render_profile(host_id=id, vlan_id=vlan, ovs_br=br)
+        if golden:
+            result = launch_container(name, profile, server="local", image=golden)
+        else:
+            result = launch_container(name, profile)
+        # success comes from the exit code (or LXD operation status), not the text
+        ok, output = result.ok, result.output
+    except Exception as e:
+        output = f"Error: {e}"
+        ok = False
+    return dict(name=name, ok=ok, seconds=time.perf_counter() - start, output=output)
+
+
+def save_containers_data():
+    """
+    update containers.json with every container in the host, in one write.
+    """
+    store = get_store()
+    with store.transaction():
+        store.collection("containers").upsert_many(get_container_inventory())
+
+
 def create_conts_for_br(
     br: str,
     cont_ids: list,
     vlan: int,
     vm: str = "",
-):
+    parallel: int = PROVISION_WORKERS,
+    golden: str = "",
+) -> list[dict]:
     """
     create LXD containers for an ovs bridge.
     naming scheme: cont-<cont_id>
+    up to `parallel` containers are launched at the same time.
+    a failed container doesn't stop the others, failures are listed at the end.
+    with a golden image alias, containers are cloned from that image
+    (see create_golden_image).
+
+    :return: result of each container (see provision_container)
+    :rtype: list[dict]
     """
-    # in each loop create a new temp profile for a container id
-    for id in cont_ids:
-        prfl_name = edit_yaml(host_id=id, vlan_id=vlan, ovs_br=br)
-        cont_out = create_container(name=f"cont-{id}", profile=prfl_name)
+    results = []
+    total = len(cont_ids)
+    print(f"\nLaunching {total} containers, {parallel} at a time...")
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as pool:
+        futures = [
+            pool.submit(provision_container, id, br, vlan, golden) for id in cont_ids
+        ]
+        for i, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            status = "done" if result["ok"] else "FAILED"
+            print(
+                f"[{i}/{total}] {result['name']}: {status} ({result['seconds']:.1f}s)"
+            )
+            results.append(result)
+
+    failed = [r for r in results if not r["ok"]]
+    print(f"\nCreated {total - len(failed)}/{total} containers.")
+    for r in failed:
+        print(f"  {r['name']}: {r['output'].strip()}")
+
+    save_containers_data()
 
     check = ""
     if vm != "":
@@ -130,7 +301,8 @@ def create_conts_for_br(
         check = list_conts()
 
     print(check)
-    save_logs([cont_out])
+    save_logs([r["output"] for r in results])
+    return results
 
 
 def get_container_names() -> list[str]:
@@ -140,7 +312,79 @@ def get_container_names() -> list[str]:
     :return: container names
     :rtype: list[str]
     """
-    input = "lxc list -c n -f csv"
-    output = cmd(input)
-    containers = [c for c in output.splitlines() if ("cont-" in c)]
+    lxd = get_lxd()
+    if lxd:
+        names = lxd.instance_names()
+    else:
+        input = "lxc list -c n -f csv"
+        names = cmd(input).splitlines()
+    containers = [c for c in names if ("cont-" in c)]
     return containers
+
+
+# ===== inventory functions ===== #
+
+
+def get_instances(state: bool = True) -> list[dict]:
+    """
+    return all LXD instances with their config and devices,
+    using a single API request or `lxc` call.
+
+    :param state: also return the runtime state (addresses, counters, ...)
+    :type state: bool
+    :return: instances as returned by LXD
+    :rtype: list[dict]
+    """
+    lxd = get_lxd()
+    if lxd:
+        return lxd.instances(recursion=2 if state else 1)
+    if state:
+        output = cmd("sudo lxc list --format=json")
+    else:
+        output = cmd(["sudo", "lxc", "query", "/1.0/instances?recursion=1"])
+    return json.loads(output or "[]")
+
+
+def parse_container(instance: dict) -> dict | None:
+    """
+    build the containers.json item of an instance.
+    see data schema in schemas/container.schema.json
+
+    :param instance: instance data from get_instances()
+    :type instance: dict
+    :return: container item, None if the instance has no network config
+    :rtype: dict | None
+    """
+    config = instance.get("expanded_config") or instance.get("config") or {}
+    devices = instance.get("expanded_devices") or instance.get("devices") or {}
+    # the network config is stored as a yaml string
+    user_config = config.get("user.network-config")
+    if not user_config:
+        return None
+    user_config_yaml = yaml.load(user_config, Loader=YAML_LOADER) or {}
+
+    ifaces = []
+    vlans = user_config_yaml.get("vlans") or {}
+    for vlan_name, vlan in vlans.items():
+        ifaces.append(
+            {vlan_name: {"id": vlan.get("id"), "addresses": vlan.get("addresses", [])}}
+        )
+    ethernets = user_config_yaml.get("ethernets") or {}
+    for eth, eth_data in ethernets.items():
+        ifaces.append({eth: {"addresses": (eth_data or {}).get("addresses", [])}})
+
+    item = {
+        "container": instance.get("name"),
+        "interfaces": ifaces,
+        "bridge": devices.get("eth0", {}).get("parent", {}),
+        "ovs_port": config.get("volatile.eth0.host_name", ""),
+    }
+    return item
+
+
+def get_container_inventory() -> list[dict]:
+    """
+    return the containers.json items of all containers in the host.
+    """
+    items = [parse_container(inst) for inst in get_instances(state=False)]
+    return [item for item in items if item]
@@ -0,0 +1,257 @@
+"""
+this module deploys the FL app in containers.
+the deploy steps run in several containers at the same time. each finished
+step leaves a marker file inside the container, so a rerun skips it.
+"""
+
+from utils import *
+from git_mirror import prepare_mirror, clone_command
+from pkg_cache import (
+    attach_pkg_cache,
+    apt_keep_command,
+    apt_cached,
+    pip_cached_install,
+    cache_size,
+)
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# max number of containers deployed at the same time
+DEPLOY_WORKERS = 8
+# directory inside the container with one marker file per finished step
+DEPLOY_STATE_DIR = "/root/.fl_deploy"
+DEPLOY_LOGS = "logs/deploy"
+TORCH_INDEX = "https://download.pytorch.org/whl/cu130"
+
+
+def deploy_steps(repo: str, cache: bool = True, fill: bool = False) -> list[dict]:
+    """
+    return the deploy steps in order.
+    each step has an id (marker file name), a title and a shell command.
+    steps with mark_first write their marker before running (e.g. reboot).
+
+    :param repo: git url of the FL app
+    :type repo: str
+    :param cache: install packages through the host package cache (pkg_cache.py)
+    :type cache: bool
+    :param fill: download the packages into the cache. without it, the
+        packages are installed from the cache only
+    :type fill: bool
+    :rtype: list[dict]
+    """
+    upgrade = "sudo apt update -y && sudo apt upgrade -y"
+    python = "sudo apt install -y git python3-pip && sudo apt install python3-venv -y"
+    if cache:
+        upgrade = apt_cached(upgrade, fill)
+        python = apt_cached(python, fill)
+        requirements = " && ".join(
+            [
+                "source fl_app/venv/bin/activate",
+                pip_cached_install("torch torchvision", TORCH_INDEX, fill),
+                pip_cached_install("-r fl_app/requirements.txt", fill=fill),
+            ]
+        )
+    else:
+        requirements = f"source fl_app/venv/bin/activate && pip3 install torch torchvision --index-url {TORCH_INDEX} && pip install -r fl_app/requirements.txt"
+    steps = []
+    if cache:
+        steps.append(
+            dict(
+                id="apt-cache",
+                title="Keep apt packages in the host cache",
+                command=apt_keep_command(),
+            )
+        )
+    return steps + [
+        dict(
+            id="clone",
+            title="Cloning FL repo",
+            command=f"[ -d fl_app/.git ] || {{ {clone_command(repo)}; }}",
+        ),
+        dict(
+            id="apt-upgrade",
+            title="Update and upgrade",
+            command=upgrade,
+        ),
+        # dict(
+        #     id="nvidia",
+        #     title="Nvidia driver install",
+        #     command=f"sudo apt install nvidia-utils-{version} -y",
+        # ),
+        dict(
+            id="apt-python",
+            title="Python venv and pip install",
+            command=python,
+        ),
+        dict(
+            id="venv",
+            title="create venv",
+            command="cd fl_app && python3 -m venv venv",
+        ),
+        dict(
+            id="requirements",
+            title="PyTorch and requirements",
+            command=requirements,
+        ),
+        dict(
+            id="cuda-check",
+            title="Checking CUDA...",
+            command="source fl_app/venv/bin/activate && python3 fl_app/check_cuda.py",
+        ),
+        dict(id="reboot", title="Rebooting...", command="sudo reboot", mark_first=True),
+    ]
+
+
+def done_steps(container: str) -> set[str]:
+    """
+    return the ids of the deploy steps already finished in a container.
+    """
+    result = lxc_exec(container, f"ls -1 {DEPLOY_STATE_DIR}")
+    if not result.ok:
+        return set()
+    return set(result.stdout.split())
+
+
+def step_command(step: dict) -> str:
+    """
+    return the command that runs a step and records it as finished.
+    """
+    marker = f"mkdir -p {DEPLOY_STATE_DIR} && touch {DEPLOY_STATE_DIR}/{step['id']}"
+    if step.get("mark_first"):
+        inner = f"{marker} && {step['command']}"
+    else:
+        inner = f"{step['command']} && {marker}"
+    return f"bash -c {shlex.quote(inner)}"
+
+
+def deploy_container(
+    container: str,
+    steps: list[dict],
+    force: bool = False,
+    cache: bool = True,
+    fill: bool = False,
+) -> dict:
+    """
+    run the deploy steps in one container, skipping finished steps.
+    stops at the first step that fails.
+
+    :param container: container name
+    :type container: str
+    :param steps: steps from deploy_steps()
+    :type steps: list[dict]
+    :param force: run every step, even the finished ones
+    :type force: bool
+    :param cache: mount the host package cache in the container first
+    :type cache: bool
+    :param fill: mount the cache read-write, to fill it
+    :type fill: bool
+    :return: container, ok, failed step, steps run and skipped, seconds, output
+    :rtype: dict
+    """
+    start = time.perf_counter()
+    report = dict(container=container, ok=True, failed="", ran=[], skipped=[])
+    done = set() if force else done_steps(container)
+    log_path = f"{DEPLOY_LOGS}/{container}_{TIME}.txt"
+    output = ""
+    if cache:
+        cache_output = attach_pkg_cache(container, readonly=not fill)
+        if cache_output:
+            save_logs(["### Package cache ###\n", cache_output], path=log_path)
+    for step in steps:
+        if step["id"] in done:
+            report["skipped"].append(step["id"])
+            continue
+        print(f"[{container}] {step['title']}")
+        result = lxc_exec(container, step_command(step))
+        save_logs([f"### {step['title']} ###\n", result.output], path=log_path)
+        report["ran"].append(step["id"])
+        # a reboot closes the exec session, so its exit code is not checked
+        if not result.ok and not step.get("mark_first"):
+            report["ok"] = False
+            report["failed"] = step["id"]
+            output = result.output
+            break
+    report["seconds"] = time.perf_counter() - start
+    report["output"] = output
+    return report
+
+
+def deploy_containers(
+    containers: list[str],
+    repo: str,
+    workers: int = DEPLOY_WORKERS,
+    force: bool = False,
+    cache: bool = True,
+) -> list[dict]:
+    """
+    deploy the FL app in several containers at the same time.
+    a failure in one container doesn't stop the others.
+    rerunning only runs the steps that haven't finished yet.
+    with the package cache, the first container is deployed alone to fill
+    the cache, then the others install from it (read-only) in parallel.
+    if the fill failed or left no wheels (e.g. its steps were already done),
+    the others are deployed without the cache.
+
+    :param containers: container names
+    :type containers: list[str]
+    :param repo: git url of the FL app
+    :type repo: str
+    :param workers: max number of containers deployed at the same time
+    :type workers: int
+    :param force: run every step again
+    :type force: bool
+    :param cache: use the host package cache (pkg_cache.py)
+    :type cache: bool
+    :return: report of each container (see deploy_container)
+    :rtype: list[dict]
+    """
+    if not prepare_mirror(repo, containers):
+        return []
+    steps = deploy_steps(repo, cache)
+    reports = []
+    rest = containers
+    if cache and containers:
+        fill_steps = deploy_steps(repo, cache, fill=True)
+        reports.append(
+            deploy_container(containers[0], fill_steps, force, cache, fill=True)
+        )
+        print_deploy_status(reports[0])
+        rest = containers[1:]
+        # installing from an empty wheelhouse fails in every container
+        if rest and (not reports[0]["ok"] or not cache_size()["wheels"]):
+            print("Package cache not filled, deploying without it")
+            cache = False
+            steps = deploy_steps(repo, cache)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(deploy_container, c, steps, force, cache) for c in rest]
+        for future in as_completed(futures):
+            report = future.result()
+            print_deploy_status(report)
+            reports.append(report)
+
+    reports.sort(key=lambda r: r["container"])
+    print_deploy_summary(reports)
+    return reports
+
+
+def print_deploy_status(report: dict):
+    status = "done" if report["ok"] else f"FAILED at {report['failed']}"
+    print(f"[{report['container']}] {status} ({report['seconds']:.0f}s)")
+
+
+def print_deploy_summary(reports: list[dict]):
+    """
+    print one line per container, then the output of failed steps.
+    """
+    print("\nDeploy summary:")
+    for r in reports:
+        status = "ok" if r["ok"] else f"FAILED at {r['failed']}"
+        print(
+            f"  {r['container']:<12} {status:<24} ran: {len(r['ran'])}"
+            f"  skipped: {len(r['skipped'])}  {r['seconds']:.0f}s"
+        )
+    failed = [r for r in reports if not r["ok"]]
+    for r in failed:
+        tail = "\n".join(r["output"].strip().splitlines()[-10:])
+        print(f"\n--- {r['container']} ({r['failed']}) ---\n{tail}")
+    if failed:
+        print("\nRun --deploy again to resume the failed containers.")
@@ -3,7 +3,14 @@ This module is designed to run this application: https://github.com/Walid-N-bit/
 
 """
 
-from utils import cmd, get_host_id
+from utils import cmd, lxc_cmd, MAX_PARALLEL
+from git_mirror import (
+    prepare_mirror,
+    fetch_command,
+    git_all,
+    mirror_head,
+    print_revisions,
+)
 from containers import get_container_names
 import pandas as pd
 import time
@@ -48,7 +55,7 @@ def wait_for_ports_free(cont: str, ports: list[int], timeout: int = 10) -> bool:
     while time.time() - start < timeout:
         busy = []
         # Run ss once and parse in Python (avoids grep quote hell)
-        res = cmd(f"lxc exec {cont} -- ss -tlnp", shell=True)
+        res = lxc_cmd(cont, "ss -tlnp", sudo=False)
         for port in ports:
             # Match exactly ":9092 " to avoid false positives like :90920
             if f":{port} " in res:
@@ -69,9 +76,9 @@ def cleanup_flower_state(containers: list, server_cont: str):
         print(f"  Cleaning {cont}...")
 
         # 1. Kill by process name (simple, reliable)
-        cmd(f"lxc exec {cont} -- pkill -9 -f 'flower-' 2>/dev/null || true", shell=True)
-        cmd(f"lxc exec {cont} -- pkill -9 -f 'flwr ' 2>/dev/null || true", shell=True)
-        cmd(f"lxc exec {cont} -- pkill -9 -f 'ray::' 2>/dev/null || true", shell=True)
+        lxc_cmd(cont, "pkill -9 -f 'flower-'", sudo=False)
+        lxc_cmd(cont, "pkill -9 -f 'flwr '", sudo=False)
+        lxc_cmd(cont, "pkill -9 -f 'ray::'", sudo=False)
 
         # 2. Kill by port using fuser (if available) or ss+kill fallback
         for port in [9092, 9093, 9094]:
@@ -84,7 +91,7 @@ def cleanup_flower_state(containers: list, server_cont: str):
             pid_cmd = f'lxc exec {cont} -- bash -c \'ss -tlnp 2>/dev/null | grep ":{port} " | grep -oP "pid=\\K[0-9]+" | head -1\''
             pid = cmd(pid_cmd, shell=True).strip()
             if pid and pid.isdigit():
-                cmd(f"lxc exec {cont} -- kill -9 {pid} 2>/dev/null || true", shell=True)
+                lxc_cmd(cont, f"kill -9 {pid}", sudo=False)
 
         # 3. Wait for kernel to release sockets (longer for safety)
         time.sleep(3)
@@ -109,10 +116,9 @@ def count_connected_nodes(
     """
     # Safely count connection events; returns 0 if log doesn't exist yet
     check_cmd = (
-        f"lxc exec {server_cont} -- bash -c "
-        f"'[ -f {log_file} ] && grep -c \"ActivateNode\" {log_file} 2>/dev/null || echo 0'"
+        f"bash -c '[ -f {log_file} ] && grep -c \"ActivateNode\" {log_file} 2>/dev/null || echo 0'"
     )
-    res = cmd(check_cmd, shell=True).strip()
+    res = lxc_cmd(server_cont, check_cmd, sudo=False).strip()
     try:
         return int(res)
     except ValueError:
@@ -309,46 +315,61 @@ def start_fed_training(containers: list, server_cont: str, pyproject_path: str =
 
 def save_original_toml(container: str):
     cont_in = "scp /root/fl_app/pyproject.toml /root/data/pyproject_original.toml"
-    out = cmd(f"lxc exec {container} -- bash -c '{cont_in}'", shell=True)
+    out = lxc_cmd(container, f"bash -c '{cont_in}'", sudo=False)
     print(out)
 
 
 def save_modified_toml(container: str):
     cont_in = "scp /root/fl_app/pyproject.toml /root/data/pyproject_copy.toml"
-    out = cmd(f"lxc exec {container} -- bash -c '{cont_in}'", shell=True)
+    out = lxc_cmd(container, f"bash -c '{cont_in}'", sudo=False)
     print(out)
 
 
 def reset_toml(container):
     cont_in = "scp /root/data/pyproject_original.toml /root/fl_app/pyproject.toml"
-    out = cmd(f"lxc exec {container} -- bash -c '{cont_in}'", shell=True)
+    out = lxc_cmd(container, f"bash -c '{cont_in}'", sudo=False)
     print(out)
 
 
 def restore_modified_tol(container):
     cont_in = "scp /root/data/pyproject_copy.toml /root/fl_app/pyproject.toml"
-    out = cmd(f"lxc exec {container} -- bash -c '{cont_in}'", shell=True)
+    out = lxc_cmd(container, f"bash -c '{cont_in}'", sudo=False)
     print(out)
 
 
-def update_nodes(containers: list, server: str = ""):
+def update_nodes(
+    containers: list, repo: str, server: str = "", workers: int = MAX_PARALLEL
+) -> list[dict]:
     """
     perform git pull and update local repos on clients and server nodes.
+    the repo is fetched once into the host mirror, then the containers
+    pull from the mirror at the same time. prints the commit of each
+    container and flags the ones on another revision.
 
     :param containers: list of container names
     :type containers: list
+    :param repo: git url of the FL app
+    :type repo: str
     :param server: server container name
     :type server: str
+    :param workers: max number of containers updated at the same time
+    :type workers: int
+    :return: reports of git_all()
+    :rtype: list[dict]
     """
+    if not prepare_mirror(repo, containers):
+        return []
     if server:
         save_modified_toml(server)
         reset_toml(server)
-    for cont in containers:
-        out = cmd(f"lxc exec {cont} -- git -C fl_app pull")
-        print(out)
+    pull = f"{fetch_command(repo)} && git -C fl_app merge @{{u}}"
+    reports = git_all(containers, pull, workers)
 
     if server:
         restore_modified_tol(server)
+    # compare with the mirror, not with what most containers are on
+    print_revisions(reports, expected=mirror_head(repo))
+    return reports
 
 
 def partition_data(containers: list, parts_nbr: int, server_cont: str) -> dict:
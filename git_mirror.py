@@ -0,0 +1,256 @@
+"""
+this module keeps a bare mirror of the FL repo on the host.
+the mirror is fetched once per operation and mounted in every container as
+an LXD disk device, so containers clone and pull from a local path instead
+of each reaching the remote.
+"""
+
+from utils import *
+
+GIT_MIRRORS = "git_mirror"
+# mount point of GIT_MIRRORS inside the containers
+MIRROR_MOUNT = "/root/git_mirror"
+MIRROR_DEVICE = "git-mirror"
+# refspec that updates the origin/* branches of a clone from the mirror
+ORIGIN_REFSPEC = "+refs/heads/*:refs/remotes/origin/*"
+
+
+def mirror_name(repo: str) -> str:
+    """
+    return the mirror directory name of a repo url.
+    e.g.: https://github.com/user/fl_app.git -> fl_app.git
+    """
+    name = repo.rstrip("/").rsplit("/", 1)[-1]
+    return name if name.endswith(".git") else f"{name}.git"
+
+
+def mirror_path(repo: str, host: bool = False) -> str:
+    """
+    return the path of a repo's mirror, inside the containers or on the host.
+    """
+    if host:
+        return os.path.abspath(f"{GIT_MIRRORS}/{mirror_name(repo)}")
+    return f"{MIRROR_MOUNT}/{mirror_name(repo)}"
+
+
+def sync_mirror(repo: str) -> CmdResult:
+    """
+    create the host mirror of a repo, or fetch its new commits.
+    this is the only network fetch of a clone/update/reset operation.
+
+    :param repo: git url of the repo
+    :type repo: str
+    :return: result of the git command
+    :rtype: CmdResult
+    """
+    path = mirror_path(repo, host=True)
+    if os.path.isdir(path):
+        input = ["git", "-C", path, "remote", "update", "--prune"]
+    else:
+        os.makedirs(GIT_MIRRORS, exist_ok=True)
+        input = ["git", "clone", "--mirror", repo, path]
+    result = CmdResult(command=" ".join(input))
+    start = time.perf_counter()
+    try:
+        proc = subprocess.run(input, capture_output=True, text=True)
+        result.returncode = proc.returncode
+        result.stdout, result.stderr = proc.stdout, proc.stderr
+    except OSError as e:
+        result.stderr = f"Error: {e}\n"
+    result.duration = time.perf_counter() - start
+    return result
+
+
+def attach_mirror(container: str) -> str:
+    """
+    mount the host mirrors read-only in a container.
+    shift=true makes the files owned by the container root, so git doesn't
+    reject the repo for its owner.
+
+    :param container: container name
+    :type container: str
+    :return: command output
+    :rtype: str
+    """
+    os.makedirs(GIT_MIRRORS, exist_ok=True)
+    options = {
+        "type": "disk",
+        "source": os.path.abspath(GIT_MIRRORS),
+        "path": MIRROR_MOUNT,
+        "readonly": "true",
+        "shift": "true",
+    }
+    lxd = get_lxd()
+    if lxd:
+        try:
+            lxd.add_device(container, MIRROR_DEVICE, options)
+        except LXDError as e:
+            return f"Error: {e}\n"
+        return ""
+    cmd(f"sudo lxc config device remove {container} {MIRROR_DEVICE}")
+    opts = [f"{k}={v}" for k, v in options.items() if k != "type"]
+    return cmd(
+        ["sudo", "lxc", "config", "device", "add", container, MIRROR_DEVICE, "disk"]
+        + opts
+    )
+
+
+def attach_mirror_all(containers: list[str]) -> dict[str, str]:
+    """
+    mount the mirrors in several containers. return the errors by container.
+    """
+    errors = {}
+    for container in containers:
+        out = attach_mirror(container)
+        if out.strip():
+            errors[container] = out
+    return errors
+
+
+def clone_command(repo: str, dest: str = "fl_app") -> str:
+    """
+    return the shell command that clones a repo from its mirror.
+    origin keeps pointing at the real remote.
+    """
+    return (
+        f"git clone {mirror_path(repo)} {dest}"
+        f" && git -C {dest} remote set-url origin {repo}"
+    )
+
+
+def fetch_command(repo: str, dest: str = "fl_app") -> str:
+    """
+    return the shell command that updates the origin/* branches of a clone
+    from the mirror, like `git fetch origin`.
+    """
+    return f"git -C {dest} fetch --prune {mirror_path(repo)} '{ORIGIN_REFSPEC}'"
+
+
+def in_bash(command: str) -> str:
+    """
+    wrap a shell command for lxc exec.
+    """
+    return f"bash -c {shlex.quote(command)}"
+
+
+def prepare_mirror(repo: str, containers: list[str]) -> bool:
+    """
+    fetch the mirror once and mount it in the containers.
+    return False if the mirror couldn't be fetched.
+
+    :param repo: git url of the repo
+    :type repo: str
+    :param containers: containers that will clone or pull from the mirror
+    :type containers: list[str]
+    :rtype: bool
+    """
+    print(f"Fetching {repo} into {mirror_path(repo, host=True)}")
+    result = sync_mirror(repo)
+    if not result.ok:
+        print(f"Mirror fetch failed:\n{result.output}")
+        return False
+    print(f"Mirror up to date ({result.duration:.1f}s)")
+    for container, error in attach_mirror_all(containers).items():
+        print(f"[{container}] {error.strip()}")
+    return True
+
+
+def mirror_head(repo: str, branch: str = "main") -> str:
+    """
+    return the commit of a branch in the host mirror. empty if unknown.
+    """
+    path = mirror_path(repo, host=True)
+    input = ["git", "-C", path, "rev-parse", "--verify", "-q", f"refs/heads/{branch}"]
+    try:
+        proc = subprocess.run(input, capture_output=True, text=True)
+    except OSError:
+        return ""
+    return proc.stdout.strip() if proc.returncode == 0 else ""
+
+
+def with_revision(command: str, dest: str = "fl_app") -> str:
+    """
+    return a shell command that runs `command`, then prints the HEAD commit
+    of the clone on a HEAD=<hash> line. the exit code is the one of `command`.
+    """
+    head = f'echo "HEAD=$(git -C {dest} rev-parse HEAD 2>/dev/null)"'
+    return f"{{ {command}; }}; status=$?; {head}; exit $status"
+
+
+def parse_revision(output: str) -> str:
+    """
+    return the commit printed by with_revision(). empty if missing.
+    """
+    for line in reversed(output.splitlines()):
+        if line.startswith("HEAD="):
+            return line[len("HEAD=") :].strip()
+    return ""
+
+
+def git_all(
+    containers: list[str], command: str, workers: int = MAX_PARALLEL
+) -> list[dict]:
+    """
+    run a git command in the FL repo of several containers at the same time
+    and collect the resulting commit of each.
+
+    :param containers: container names
+    :type containers: list[str]
+    :param command: shell command run in each container
+    :type command: str
+    :param workers: max number of containers running the command at once
+    :type workers: int
+    :return: container, ok, commit, seconds and output of each container
+    :rtype: list[dict]
+    """
+    results = lxc_cmd_all(
+        containers, in_bash(with_revision(command)), limit=max(1, workers)
+    )
+    reports = []
+    for container, result in results.items():
+        reports.append(
+            dict(
+                container=container,
+                ok=result.ok,
+                commit=parse_revision(result.stdout),
+                seconds=result.duration,
+                output=result.output,
+            )
+        )
+    return sorted(reports, key=lambda r: r["container"])
+
+
+def print_revisions(reports: list[dict], expected: str = ""):
+    """
+    print one row per container with its commit.
+    containers on another commit than `expected` (or than most containers,
+    if not given) are flagged as drift.
+
+    :param reports: reports from git_all()
+    :type reports: list[dict]
+    :param expected: commit every container should be on
+    :type expected: str
+    """
+    from tabulate import tabulate
+
+    commits = [r["commit"] for r in reports if r["commit"]]
+    if not expected and commits:
+        expected = max(set(commits), key=commits.count)
+    rows = []
+    for r in reports:
+        if not r["ok"]:
+            status = "FAILED"
+        elif r["commit"] != expected:
+            status = "DRIFT"
+        else:
+            status = "ok"
+        rows.append([r["container"], status, r["commit"][:10], f"{r['seconds']:.1f}s"])
+    print(tabulate(rows, headers=["Container", "Status", "Commit", "Time"]))
+    drift = [r for r in rows if r[1] != "ok"]
+    print(f"\nExpected commit: {expected[:10] or 'unknown'}")
+    if drift:
+        print(f"{len(drift)} of {len(rows)} containers are not on the expected commit.")
+    for r in reports:
+        if not r["ok"]:
+            tail = "\n".join(r["output"].strip().splitlines()[-5:])
+            print(f"\n--- {r['container']} ---\n{tail}")
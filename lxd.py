@@ -0,0 +1,348 @@
+"""
+this module is a small client for the LXD REST API.
+it talks to the LXD daemon over its unix socket with keep-alive connections
+(one per thread), so container operations don't have to start a new `lxc`
+process each time.
+"""
+
+import os
+import json
+import socket
+import threading
+import http.client
+from urllib.parse import quote
+
+LXD_SOCKS = [
+    "/var/snap/lxd/common/lxd/unix.socket",
+    "/var/lib/lxd/unix.socket",
+]
+
+# image servers known by the lxc client, by remote name
+REMOTES = {
+    "ubuntu": "https://cloud-images.ubuntu.com/releases",
+    "ubuntu-daily": "https://cloud-images.ubuntu.com/daily",
+    "images": "https://images.lxd.canonical.com",
+}
+
+
+class LXDError(Exception):
+    """
+    error returned by the LXD daemon, or a failed operation.
+    """
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection over a unix socket.
+    """
+
+    def __init__(self, socket_path: str, timeout: float | None = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+def config_value(value) -> str:
+    """
+    return a config or device value as the string LXD expects.
+    yaml files may give numbers and booleans (e.g. mtu: 1400).
+    """
+    if type(value) == bool:
+        return "true" if value else "false"
+    return str(value)
+
+
+def image_source(server: str, image: str) -> dict:
+    """
+    return the API source object for an image given as <server>:<image>.
+    an empty or "local" server means an image alias on this host.
+    """
+    if server in ("", "local"):
+        return {"type": "image", "alias": image}
+    return {
+        "type": "image",
+        "mode": "pull",
+        "server": REMOTES.get(server, server),
+        "protocol": "simplestreams",
+        "alias": image,
+    }
+
+
+class LXDClient:
+    """
+    client for the LXD REST API over a unix socket.
+    """
+
+    def __init__(self, socket_path: str, timeout: float | None = 30):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        # each thread gets its own connection, so a long request
+        # (e.g. waiting for a launch) doesn't block the other threads
+        self._local = threading.local()
+
+    @property
+    def conn(self) -> UnixHTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        self.conn.close()
+
+    # ===== transport ===== #
+
+    def request_raw(self, method: str, url: str, body=None) -> tuple[int, bytes]:
+        """
+        send a request and return status code and raw body.
+        the request is sent again once if the kept-alive connection was dropped.
+        socket errors and timeouts are raised as LXDError.
+        """
+        headers = {}
+        if body is not None and type(body) != bytes:
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        conn = self.conn
+        for attempt in range(2):
+            try:
+                conn.request(method, url, body=body, headers=headers)
+                resp = conn.getresponse()
+                return resp.status, resp.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                # a timed out request is not sent again, the daemon may
+                # still be running it
+                if attempt == 1 or isinstance(e, TimeoutError):
+                    raise LXDError(f"{method} {url}: {e}")
+
+    def request(self, method: str, url: str, body=None) -> dict:
+        """
+        send a request and return the decoded response envelope.
+        """
+        status, data = self.request_raw(method, url, body)
+        resp = json.loads(data or b"{}")
+        if resp.get("type") == "error" or status >= 400:
+            raise LXDError(f"{method} {url}: {resp.get('error') or status}")
+        return resp
+
+    def wait(self, resp: dict, timeout: int = -1) -> dict:
+        """
+        wait for a background operation to finish and return its metadata.
+        """
+        if resp.get("type") != "async":
+            return resp.get("metadata")
+        op = resp.get("operation")
+        # wait in short steps, so no single request outlives the socket timeout
+        step = 20
+        waited = 0
+        while True:
+            wait_for = step if timeout < 0 else min(step, max(timeout - waited, 0))
+            url = f"{op}/wait?timeout={wait_for}"
+            metadata = self.request("GET", url).get("metadata")
+            waited += wait_for
+            if metadata.get("status") != "Running":
+                break
+            if timeout >= 0 and waited >= timeout:
+                raise LXDError(f"{op}: still running after {timeout}s")
+        if metadata.get("status") != "Success":
+            raise LXDError(f"{op}: {metadata.get('err') or metadata.get('status')}")
+        return metadata
+
+    # ===== instances ===== #
+
+    def instances(self, recursion: int = 1) -> list:
+        """
+        return all instances.
+        recursion=0 gives URLs, 1 gives config, 2 also gives state.
+        """
+        url = f"/1.0/instances?recursion={recursion}"
+        return self.request("GET", url).get("metadata")
+
+    def instance_names(self) -> list[str]:
+        return sorted(url.rsplit("/", 1)[-1] for url in self.instances(recursion=0))
+
+    def instance(self, name: str) -> dict:
+        """
+        return the config of an instance, like `lxc config show`.
+        """
+        return self.request("GET", f"/1.0/instances/{quote(name)}").get("metadata")
+
+    def instance_state(self, name: str) -> dict:
+        url = f"/1.0/instances/{quote(name)}/state"
+        return self.request("GET", url).get("metadata")
+
+    def set_state(self, name: str, action: str, timeout: int = -1):
+        """
+        change the state of an instance (start, stop, restart, ...).
+        """
+        body = {"action": action, "timeout": 30, "force": False}
+        resp = self.request("PUT", f"/1.0/instances/{quote(name)}/state", body)
+        return self.wait(resp, timeout)
+
+    def create(
+        self,
+        name: str,
+        source: dict,
+        config: dict | None = None,
+        devices: dict | None = None,
+        profiles: list[str] | None = None,
+        timeout: int = -1,
+    ) -> dict:
+        """
+        create an instance without starting it, like `lxc init`.
+        """
+        body = {
+            "name": name,
+            "source": source,
+            "config": {k: config_value(v) for k, v in (config or {}).items()},
+            "devices": {
+                dev: {k: config_value(v) for k, v in opts.items()}
+                for dev, opts in (devices or {}).items()
+            },
+        }
+        if profiles is not None:
+            body["profiles"] = profiles
+        resp = self.request("POST", "/1.0/instances", body)
+        return self.wait(resp, timeout)
+
+    def launch(
+        self,
+        name: str,
+        source: dict,
+        config: dict | None = None,
+        devices: dict | None = None,
+        profiles: list[str] | None = None,
+        timeout: int = -1,
+    ) -> dict:
+        """
+        create and start an instance, like `lxc launch`.
+        """
+        self.create(name, source, config, devices, profiles, timeout)
+        return self.set_state(name, "start", timeout)
+
+    def add_device(self, name: str, device: str, options: dict) -> dict:
+        """
+        add (or replace) a device of an instance, like `lxc config device add`.
+        """
+        opts = {k: config_value(v) for k, v in options.items()}
+        url = f"/1.0/instances/{quote(name)}"
+        resp = self.request("PATCH", url, {"devices": {device: opts}})
+        return self.wait(resp)
+
+    def snapshot(self, name: str, snapshot: str, timeout: int = -1) -> dict:
+        """
+        take a snapshot of an instance. an existing snapshot with the
+        same name is replaced.
+        """
+        url = f"/1.0/instances/{quote(name)}/snapshots"
+        try:
+            self.wait(self.request("DELETE", f"{url}/{quote(snapshot)}"), timeout)
+        except LXDError:
+            pass
+        resp = self.request("POST", url, {"name": snapshot, "stateful": False})
+        return self.wait(resp, timeout)
+
+    def publish(
+        self, name: str, alias: str, snapshot: str = "", timeout: int = -1
+    ) -> dict:
+        """
+        publish an instance (or one of its snapshots) as a local image,
+        like `lxc publish --reuse`. an existing alias is moved to the new image.
+        """
+        if snapshot:
+            source = {"type": "snapshot", "name": f"{name}/{snapshot}"}
+        else:
+            source = {"type": "instance", "name": name}
+        try:
+            self.request("DELETE", f"/1.0/images/aliases/{quote(alias)}")
+        except LXDError:
+            pass
+        body = {"source": source, "aliases": [{"name": alias}]}
+        return self.wait(self.request("POST", "/1.0/images", body), timeout)
+
+    def exec(
+        self,
+        name: str,
+        command: list[str],
+        env: dict | None = None,
+        cwd: str = "/root",
+        timeout: int = -1,
+    ) -> tuple[int, str, str]:
+        """
+        run a command in an instance and wait for it, using record-output.
+
+        :param name: instance name
+        :type name: str
+        :param command: command and its arguments
+        :type command: list[str]
+        :param env: extra environment variables
+        :type env: dict | None
+        :param cwd: working directory inside the instance
+        :type cwd: str
+        :param timeout: seconds to wait for the command. -1 waits forever
+        :type timeout: int
+        :return: exit code, stdout, stderr
+        :rtype: tuple[int, str, str]
+        """
+        body = {
+            "command": command,
+            "environment": {"HOME": "/root", "USER": "root", **(env or {})},
+            "cwd": cwd,
+            "interactive": False,
+            "wait-for-websocket": False,
+            "record-output": True,
+        }
+        resp = self.request("POST", f"/1.0/instances/{quote(name)}/exec", body)
+        metadata = self.wait(resp, timeout).get("metadata") or {}
+        logs = metadata.get("output") or {}
+        out = [""] * 3
+        for fd, url in logs.items():
+            _, data = self.request_raw("GET", url)
+            out[int(fd)] = data.decode(errors="replace")
+            self.request_raw("DELETE", url)
+        return metadata.get("return", -1), out[1], out[2]
+
+
+_client = None
+_unavailable = False
+
+
+def find_socket() -> str | None:
+    """
+    return the first LXD socket that exists. LXD_SOCK overrides the search.
+    """
+    paths = [os.environ["LXD_SOCK"]] if os.environ.get("LXD_SOCK") else LXD_SOCKS
+    return next((p for p in paths if os.path.exists(p)), None)
+
+
+def get_lxd() -> LXDClient | None:
+    """
+    return a shared LXD API client.
+    return None if the socket can't be used, so callers can fall back to the
+    lxc CLI. set LXD_DISABLE=1 to always use the CLI.
+    """
+    global _client, _unavailable
+    if _unavailable or os.environ.get("LXD_DISABLE"):
+        return None
+    if _client is None:
+        path = find_socket()
+        try:
+            if path is None:
+                raise LXDError("no LXD socket found")
+            client = LXDClient(path)
+            client.request("GET", "/1.0")
+            _client = client
+        except (OSError, LXDError):
+            _unavailable = True
+            return None
+    return _client
@@ -0,0 +1,349 @@
+"""
+this module stores iperf3 intervals in a columnar format.
+values are normalized at ingest (bytes, bits per second) and every row is
+tagged with its run id, pair (client, server), queue and timestamp.
+
+rows are appended in batches. each batch is written as one chunk file:
+    chunk-<n>.parquet when pyarrow is installed
+    chunk-<n>.npy (numpy structured array) otherwise
+index.json lists the chunks with their runs, so a load can skip chunks.
+"""
+
+import os
+import csv
+import time
+import uuid
+import numpy as np
+import pandas as pd
+from utils import read_json_file, save_json_file
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+MEASURE_STORE = "measurements_data/store"
+# rows buffered before a chunk is written
+CHUNK_ROWS = 50_000
+NO_QUEUE = -1
+
+# column -> numpy dtype
+COLUMNS = {
+    "run_id": "U32",
+    "client": "U64",
+    "server": "U64",
+    "queue": "i8",
+    "timestamp": "f8",
+    "start": "f8",
+    "end": "f8",
+    "bytes": "i8",
+    "bits_per_second": "f8",
+    "retransmits": "f8",
+    "snd_cwnd": "f8",
+    "rtt_us": "f8",
+    "jitter_ms": "f8",
+    "lost_packets": "f8",
+    "packets": "f8",
+    "omitted": "?",
+}
+DTYPE = np.dtype(list(COLUMNS.items()))
+# value of a column missing from a row, by dtype kind. NaN for floats
+DEFAULTS = {
+    c: {"U": "", "i": 0, "f": np.nan, "b": False}[np.dtype(t).kind]
+    for c, t in COLUMNS.items()
+}
+DEFAULTS["queue"] = NO_QUEUE
+
+# iperf3 prints bytes with binary prefixes and bits with decimal ones
+BYTE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+BIT_UNITS = {"": 1, "K": 1e3, "M": 1e6, "G": 1e9, "T": 1e12}
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def to_bytes(value: str | float, unit: str) -> int:
+    """
+    convert an iperf3 text value to bytes. e.g.: (1.5, "M") -> 1572864
+    """
+    return int(float(value) * BYTE_UNITS[unit.strip().upper()[:1]])
+
+
+def to_bits(value: str | float, unit: str) -> float:
+    """
+    convert an iperf3 text value to bits. e.g.: (941, "M") -> 941000000.0
+    """
+    return float(value) * BIT_UNITS[unit.strip().upper()[:1]]
+
+
+def number(value) -> float:
+    return np.nan if value is None or value == "" else float(value)
+
+
+def next_chunk(index: list[dict]) -> int:
+    """
+    return the number of the next chunk file, after the ones in the index.
+    """
+    numbers = [int(chunk["file"].split("-")[1].split(".")[0]) for chunk in index]
+    return max(numbers, default=-1) + 1
+
+
+class MeasurementStore:
+    """
+    append-only columnar store of iperf3 intervals in a directory.
+    """
+
+    def __init__(self, directory: str = MEASURE_STORE, chunk_rows: int = CHUNK_ROWS):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.format = "parquet" if pq is not None else "npy"
+        self.rows = []
+
+    @property
+    def index_path(self) -> str:
+        return f"{self.directory}/index.json"
+
+    def index(self) -> list[dict]:
+        """
+        return the chunks: file, format, rows, runs, first and last timestamp.
+        """
+        return read_json_file(self.index_path)
+
+    def runs(self) -> list[str]:
+        return sorted({run for chunk in self.index() for run in chunk["runs"]})
+
+    # ===== ingest ===== #
+
+    def add_row(self, row: dict):
+        """
+        buffer one row (see COLUMNS). a full buffer is written as a chunk.
+        missing columns get their DEFAULTS value.
+        """
+        self.rows.append(tuple(row.get(c, DEFAULTS[c]) for c in COLUMNS))
+        if len(self.rows) >= self.chunk_rows:
+            self.flush()
+
+    def add_result(
+        self,
+        result,
+        run_id: str,
+        queue: int = NO_QUEUE,
+        timestamp: float | None = None,
+    ):
+        """
+        buffer the intervals of a test.
+
+        :param result: test result from measurements.measure()
+        :type result: IperfResult
+        :param run_id: id shared by the tests of one run
+        :type run_id: str
+        :param queue: QoS queue the traffic went through
+        :type queue: int
+        :param timestamp: unix time of the test. now if None
+        :type timestamp: float | None
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        for i in result.intervals:
+            self.add_interval(i, run_id, result.client, result.server, queue, timestamp)
+
+    def add_interval(
+        self,
+        interval,
+        run_id: str,
+        client: str,
+        server: str,
+        queue: int = NO_QUEUE,
+        timestamp: float | None = None,
+    ):
+        """
+        buffer one interval, e.g. from measurements.stream_intervals().
+        """
+        i = interval
+        self.add_row(
+            dict(
+                run_id=run_id,
+                client=client,
+                server=server,
+                queue=queue,
+                timestamp=time.time() if timestamp is None else timestamp,
+                start=i.start,
+                end=i.end,
+                bytes=i.bytes,
+                bits_per_second=i.bits_per_second,
+                retransmits=number(i.retransmits),
+                snd_cwnd=number(i.snd_cwnd),
+                rtt_us=number(i.rtt_us),
+                jitter_ms=number(i.jitter_ms),
+                lost_packets=number(i.lost_packets),
+                packets=number(i.packets),
+                omitted=i.omitted,
+            )
+        )
+
+    def flush(self):
+        """
+        write the buffered rows as a new chunk and add it to the index.
+        """
+        if not self.rows:
+            return
+        data = np.array(self.rows, dtype=DTYPE)
+        self.rows = []
+        self.write_chunk(data)
+
+    def write_chunk(self, data: np.ndarray):
+        """
+        write a structured array (DTYPE) as a new chunk and add it to the index.
+        """
+        index = self.index()
+        index.append(self.write_file(data, next_chunk(index)))
+        save_json_file(data=index, path=self.index_path)
+
+    def write_file(self, data: np.ndarray, number: int) -> dict:
+        """
+        write a structured array (DTYPE) as chunk file number `number`,
+        without adding it to the index. return its index entry.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"chunk-{number:06d}.{self.format}"
+        path = f"{self.directory}/{name}"
+        if self.format == "parquet":
+            table = pa.table(
+                {
+                    c: data[c].tolist() if data[c].dtype.kind == "U" else data[c]
+                    for c in COLUMNS
+                }
+            )
+            pq.write_table(table, path)
+        else:
+            np.save(path, data, allow_pickle=False)
+        return {
+            "file": name,
+            "format": self.format,
+            "rows": len(data),
+            "runs": sorted(set(data["run_id"].tolist())),
+            "first": float(data["timestamp"].min()),
+            "last": float(data["timestamp"].max()),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    # ===== load ===== #
+
+    def load(self, runs: list[str] | None = None) -> pd.DataFrame:
+        """
+        load stored rows into one DataFrame, with a "pair" column (client->server).
+
+        :param runs: only load these run ids. all runs if None
+        :type runs: list[str] | None
+        :rtype: pd.DataFrame
+        """
+        wanted = set(runs) if runs is not None else None
+        arrays, tables = [], []
+        for chunk in self.index():
+            if wanted is not None and not wanted.intersection(chunk["runs"]):
+                continue
+            path = f"{self.directory}/{chunk['file']}"
+            if chunk["format"] == "parquet":
+                tables.append(pq.read_table(path))
+            else:
+                arrays.append(np.load(path, allow_pickle=False))
+
+        frames = []
+        if arrays:
+            frames.append(pd.DataFrame(np.concatenate(arrays)))
+        if tables:
+            frames.append(pa.concat_tables(tables).to_pandas())
+        if not frames:
+            df = pd.DataFrame(np.empty(0, dtype=DTYPE))
+        else:
+            df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        if wanted is not None:
+            df = df[df["run_id"].isin(wanted)].reset_index(drop=True)
+        df["pair"] = df["client"] + "->" + df["server"]
+        return df
+
+    def compact(self):
+        """
+        rewrite small chunks (e.g. one per single test) into full ones,
+        so loading many runs opens few files.
+        the new chunks get new file names and the index is replaced last,
+        so a crash midway leaves the old index and chunks untouched.
+        """
+        old = self.index()
+        if len(old) < 2:
+            return
+        df = self.load().drop(columns="pair")
+        records = df.to_records(index=False).astype(DTYPE)
+        number = next_chunk(old)
+        new = []
+        for i in range(0, len(records), self.chunk_rows):
+            new.append(self.write_file(records[i : i + self.chunk_rows], number))
+            number += 1
+        save_json_file(data=new, path=self.index_path)
+        for chunk in old:
+            os.remove(f"{self.directory}/{chunk['file']}")
+
+    # ===== legacy data ===== #
+
+    def import_csv(
+        self, path: str, run_id: str = "", client: str = "", server: str = ""
+    ):
+        """
+        add a CSV file of measurements_data/ to the store.
+        reads both the old text format (value and unit columns, e.g.
+        bitrate_value=941, bitrate_unit=M) and the interval format.
+
+        :param path: CSV file
+        :type path: str
+        :param run_id: run id of the rows. the file name if empty
+        :type run_id: str
+        :param client: client container of the test, if known
+        :type client: str
+        :param server: server container of the test, if known
+        :type server: str
+        """
+        run_id = run_id or os.path.splitext(os.path.basename(path))[0][:32]
+        timestamp = os.path.getmtime(path)
+        with open(path, newline="") as f:
+            for line in csv.DictReader(f):
+                row = dict(
+                    run_id=run_id,
+                    client=client,
+                    server=server,
+                    queue=NO_QUEUE,
+                    timestamp=timestamp,
+                    start=float(line.get("start_time") or line.get("start")),
+                    end=float(line.get("end_time") or line.get("end")),
+                    omitted=line.get("omitted") == "True",
+                )
+                if "transfer_unit" in line:
+                    row["bytes"] = to_bytes(
+                        line["transfer_amount"], line["transfer_unit"]
+                    )
+                    row["bits_per_second"] = to_bits(
+                        line["bitrate_value"], line["bitrate_unit"]
+                    )
+                    row["retransmits"] = number(line.get("retransmits"))
+                    row["snd_cwnd"] = to_bytes(
+                        line["congestion_window_value"],
+                        line["congestion_window_unit"],
+                    )
+                else:
+                    row["bytes"] = int(line["bytes"])
+                    for c in (
+                        "bits_per_second",
+                        "retransmits",
+                        "snd_cwnd",
+                        "rtt_us",
+                        "jitter_ms",
+                        "lost_packets",
+                        "packets",
+                    ):
+                        row[c] = number(line.get(c))
+                self.add_row(row)
@@ -1,108 +1,321 @@
 from utils import *
+from store import get_store
+from ports import add_queue_flow, del_queue_flow
+from dataclasses import dataclass, field, asdict
 from typing import Literal
+from collections import deque
 import re
 import asyncio
+import json
+import math
 import time
 
-DATA_FIELDS = (
-    "start_time",
-    "end_time",
-    "transfer_amount",
-    "transfer_unit",
-    "bitrate_value",
-    "bitrate_unit",
-    "retransmits",
-    "congestion_window_value",
-    "congestion_window_unit",
+MEASUREMENTS = "measurements_data"
+IPERF_PORT = 5201
+IPERF_DURATION = 10
+# max seconds to wait for the server to listen
+SERVER_READY_TIMEOUT = 10
+# line printed by the iperf3 server once it accepts tests
+SERVER_READY = "Server listening"
+# lines of server output kept for error messages
+SERVER_LOG_LINES = 20
+# max length of one --json-stream line (the end event is the largest)
+STREAM_LINE_LIMIT = 2**20
+# first iperf3 version with --json-stream (ubuntu 24.04 ships 3.16)
+JSON_STREAM_VERSION = (3, 17)
+# e.g.: iperf 3.16 (cJSON 1.7.15)
+IPERF_VERSION = re.compile(r"iperf (\d+)\.(\d+)")
+# interval and end of test lines of iperf3 text output, e.g.:
+# [  5]   0.00-1.00   sec   112 MBytes   941 Mbits/sec    0   1.31 MBytes
+# [  5]   0.00-10.00  sec  1.10 GBytes   941 Mbits/sec   15             sender
+IPERF_TEXT_LINE = re.compile(
+    r"^\[\s*\d+\]\s+(?P<start>[\d.]+)-(?P<end>[\d.]+)\s+sec\s+"
+    r"(?P<bytes>[\d.]+) (?P<bytes_unit>[KMGT]?)Bytes\s+"
+    r"(?P<bits>[\d.]+) (?P<bits_unit>[KMGT]?)bits/sec(?P<rest>.*)$"
 )
-SESSION = "test_session"
+# UDP end of test values, e.g.: 0.018 ms  12/17265 (0.07%)
+IPERF_TEXT_UDP = re.compile(r"([\d.]+) ms\s+(\d+)/(\d+) \(([\d.e+-]+)%\)")
+# containers reach each other on this subnet (see containers' network profile)
+TEST_SUBNET = "10.0.200."
+# ports used by the servers of a mesh. each test of a server takes the next one,
+# so a new server never waits for the previous one to release its port
+PORT_RANGE = 100
 
 
-def iperf(mode: Literal["client", "server"], ip: str = "", port: str | int = ""):
+@dataclass
+class IperfInterval:
+    """
+    one reporting interval of an iperf3 test (all streams summed).
+    TCP tests fill retransmits, snd_cwnd and rtt_us. UDP tests fill packets,
+    and the receiving side also fills jitter_ms and lost_packets.
+    """
+
+    start: float
+    end: float
+    bytes: int
+    bits_per_second: float
+    retransmits: int | None = None
+    snd_cwnd: int | None = None
+    rtt_us: float | None = None
+    jitter_ms: float | None = None
+    lost_packets: int | None = None
+    packets: int | None = None
+    omitted: bool = False
+
+
+@dataclass
+class IperfSummary:
+    """
+    end of test totals of an iperf3 test.
+    """
+
+    protocol: str
+    duration: float
+    bytes_sent: int
+    bytes_received: int
+    bits_per_second_sent: float
+    bits_per_second_received: float
+    retransmits: int | None = None
+    jitter_ms: float | None = None
+    lost_packets: int | None = None
+    packets: int | None = None
+    lost_percent: float | None = None
+    cpu_host: float | None = None
+    cpu_remote: float | None = None
+
+
+@dataclass
+class IperfResult:
+    """
+    result of one client -> server test.
+    """
+
+    client: str
+    server: str
+    port: int
+    intervals: list[IperfInterval] = field(default_factory=list)
+    summary: IperfSummary | None = None
+    error: str = ""
+    duration: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.error and self.summary is not None
+
+
+def iperf(
+    mode: Literal["client", "server"],
+    ip: str = "",
+    port: str | int = "",
+    duration: int = 0,
+    udp: bool = False,
+    bitrate: str = "",
+    json_output: bool = False,
+    one_off: bool = False,
+    json_stream: bool = False,
+) -> str:
     """
     construct iPerf command and return it as a string.
 
     :param mode: mode of execution
     :type mode: Literal["client", "server"]
-    :param port: port for the test. Defaults to 5201 when not assigned.
-    :type port: str | int
     :param ip: ip address of the server host.
     :type ip: str
+    :param port: port for the test. Defaults to 5201 when not assigned.
+    :type port: str | int
+    :param duration: client test length in seconds. iperf3 default if 0
+    :type duration: int
+    :param udp: run a UDP test (client)
+    :type udp: bool
+    :param bitrate: target bitrate, e.g.: 100M (client)
+    :type bitrate: str
+    :param json_output: print the results as JSON (-J)
+    :type json_output: bool
+    :param one_off: exit the server after one test (-1)
+    :type one_off: bool
+    :param json_stream: print one JSON event per line (iperf3 >= 3.17)
+    :type json_stream: bool
     """
     match mode:
         case "client":
-            mode = "-c"
-
+            args = ["-c", ip]
+            if duration:
+                args += ["-t", str(duration)]
+            if udp:
+                args.append("-u")
+            if bitrate:
+                args += ["-b", bitrate]
         case "server":
-            mode = "-s"
+            args = ["-s"]
+            if one_off:
+                args.append("-1")
+    if port:
+        args += ["-p", str(port)]
+    if json_output or json_stream:
+        args.append("-J")
+    if json_stream:
+        args.append("--json-stream")
+    # output reaches the pipe at each line instead of at exit
+    args.append("--forceflush")
+    return " ".join(["sudo", "iperf3", *args])
 
-    command = f"sudo iperf3 {mode} {ip} {port}".strip()
-    return command
 
-
-def parse_iperf(iperf_out: str) -> list[tuple]:
+def parse_interval(data: dict) -> IperfInterval:
+    """
+    parse one entry of the "intervals" list of iperf3 JSON output.
     """
-    parse the output of an iPerf command.
+    total = data.get("sum") or {}
+    streams = data.get("streams") or []
+    cwnds = [s["snd_cwnd"] for s in streams if "snd_cwnd" in s]
+    rtts = [s["rtt"] for s in streams if "rtt" in s]
+    return IperfInterval(
+        start=total.get("start", 0.0),
+        end=total.get("end", 0.0),
+        bytes=total.get("bytes", 0),
+        bits_per_second=total.get("bits_per_second", 0.0),
+        retransmits=total.get("retransmits"),
+        snd_cwnd=sum(cwnds) if cwnds else None,
+        rtt_us=sum(rtts) / len(rtts) if rtts else None,
+        jitter_ms=total.get("jitter_ms"),
+        lost_packets=total.get("lost_packets"),
+        packets=total.get("packets"),
+        omitted=total.get("omitted", False),
+    )
 
-    :param iperf_out: raw output of an iPerf command
-    :type iperf_out: str
-    :return: parsed data according to DATA_FIELDS
-    :rtype: list[tuple]
+
+def parse_summary(end: dict, protocol: str = "TCP") -> IperfSummary:
     """
-    iperf_out = iperf_out.splitlines()
-    data = []
-    data_pattern = r"\[\s*\d+\]\s+(\d+\.\d+)-(\d+\.\d+)\s+sec\s+([\d.]+)\s+([KMGT]?)Bytes\s+([\d.]+)\s+([KMGT]?)bits/sec\s+(\d+)\s+([\d.]+)\s+([KMGT]?)Bytes"
-    for line in iperf_out:
-        match = re.search(data_pattern, line)
-        if match:
-            # --------------------------#
-            # match.groups() is a tuple #
-            # --------------------------#
-            data.append(match.groups())
-    return data
+    parse the "end" object of iperf3 JSON output.
+    """
+    # UDP results are in "sum". newer iperf3 versions also give sum_sent/received
+    udp = end.get("sum") or {}
+    sent = end.get("sum_sent") or udp
+    received = end.get("sum_received") or udp
+    cpu = end.get("cpu_utilization_percent") or {}
+    return IperfSummary(
+        protocol=protocol,
+        duration=sent.get("seconds", 0.0),
+        bytes_sent=sent.get("bytes", 0),
+        bytes_received=received.get("bytes", 0),
+        bits_per_second_sent=sent.get("bits_per_second", 0.0),
+        bits_per_second_received=received.get("bits_per_second", 0.0),
+        retransmits=sent.get("retransmits"),
+        jitter_ms=udp.get("jitter_ms"),
+        lost_packets=udp.get("lost_packets"),
+        packets=udp.get("packets"),
+        lost_percent=udp.get("lost_percent"),
+        cpu_host=cpu.get("host_total"),
+        cpu_remote=cpu.get("remote_total"),
+    )
 
 
-def tmux_create_panes():
+def parse_iperf_json(
+    output: str | dict,
+) -> tuple[list[IperfInterval], IperfSummary | None, str]:
     """
-    create a new tmux session.
-    split a window into two panes.
-    detach session -> return to terminal.
+    parse the JSON output of an iPerf command (iperf3 -J).
+
+    :param output: raw or decoded JSON output
+    :type output: str | dict
+    :return: intervals, summary (None if the test didn't finish), error message
+    :rtype: tuple[list[IperfInterval], IperfSummary | None, str]
     """
-    cmd(f"tmux new-session -d -n {SESSION}")
-    cmd("tmux split-window -v")
-    cmd("tmux detach")
+    if type(output) == str:
+        try:
+            output = json.loads(output)
+        except json.JSONDecodeError:
+            text = output.strip().splitlines()
+            return [], None, text[-1] if text else "no output"
+    protocol = output.get("start", {}).get("test_start", {}).get("protocol", "TCP")
+    intervals = [parse_interval(i) for i in output.get("intervals", [])]
+    end = output.get("end") or {}
+    summary = parse_summary(end, protocol) if end else None
+    return intervals, summary, output.get("error", "")
 
 
-def tmux_run_command(pane: int, command: str):
+def parse_text_line(line: str, udp: bool = False) -> tuple[str, dict] | None:
     """
-    execute a command on a selected tmux pane.
+    parse one line of iperf3 client text output (one stream).
 
-    :param pane: tmux pane number
-    :type pane: int
-    :param command: command to be executed on the pane.
-    :type command: str
+    :param line: output line
+    :type line: str
+    :param udp: the line is from a UDP test
+    :type udp: bool
+    :return: ("interval", fields of IperfInterval), or ("sender"/"receiver",
+        values of the end of test line). None for other lines
+    :rtype: tuple[str, dict] | None
     """
-    cmd(f"tmux select-pane -t {pane}")
-    cmd(f"tmux send-keys 'clear' Enter")
-    input = f"tmux send-keys '{command}' enter"
-    output = cmd(input)
-    # if there's an error, print it
-    if len(output) > 0:
-        print(output)
+    from measure_store import to_bits, to_bytes
+
+    match = IPERF_TEXT_LINE.match(line.strip())
+    if not match:
+        return None
+    values = dict(
+        start=float(match["start"]),
+        end=float(match["end"]),
+        bytes=to_bytes(match["bytes"], match["bytes_unit"]),
+        bits_per_second=to_bits(match["bits"], match["bits_unit"]),
+    )
+    rest = match["rest"].split()
+    kind = rest[-1] if rest and rest[-1] in ("sender", "receiver") else "interval"
+    if udp and kind != "interval":
+        loss = IPERF_TEXT_UDP.search(match["rest"])
+        if loss:
+            values["jitter_ms"] = float(loss[1])
+            values["lost_packets"] = int(loss[2])
+            values["packets"] = int(loss[3])
+            values["lost_percent"] = float(loss[4])
+    elif udp and rest:
+        values["packets"] = int(rest[0])
+    elif rest and rest[0].isdigit():
+        values["retransmits"] = int(rest[0])
+        if kind == "interval" and len(rest) >= 3:
+            values["snd_cwnd"] = to_bytes(rest[1], rest[2][: -len("Bytes")])
+    if kind == "interval":
+        values["omitted"] = "(omitted)" in match["rest"]
+    return kind, values
 
 
-def tmux_capture(pane: int, lines: int):
+def text_summary(sender: dict, receiver: dict, protocol: str) -> IperfSummary:
+    """
+    build a summary from the end of test lines of parse_text_line().
     """
-    capture the output from a selected pane and return it as string.
+    udp = receiver if "jitter_ms" in receiver else sender
+    return IperfSummary(
+        protocol=protocol,
+        duration=sender.get("end", 0.0) - sender.get("start", 0.0),
+        bytes_sent=sender.get("bytes", 0),
+        bytes_received=receiver.get("bytes", 0),
+        bits_per_second_sent=sender.get("bits_per_second", 0.0),
+        bits_per_second_received=receiver.get("bits_per_second", 0.0),
+        retransmits=sender.get("retransmits"),
+        jitter_ms=udp.get("jitter_ms"),
+        lost_packets=udp.get("lost_packets"),
+        packets=udp.get("packets"),
+        lost_percent=udp.get("lost_percent"),
+    )
 
-    :param pane: tmux pane number
-    :type pane: int
-    :param lines: number of lines captured in the selected pane
-    :type lines: int
+
+def parse_iperf_version(output: str) -> tuple[int, int] | None:
+    """
+    return (major, minor) from the output of `iperf3 --version`.
     """
-    input = f"tmux select-pane -t {pane} ; tmux capture-pane -t 1 -p -S -{lines}"
-    output = cmd(input)
-    return output
+    match = IPERF_VERSION.search(output)
+    return (int(match[1]), int(match[2])) if match else None
+
+
+_iperf_versions = {}
+
+
+async def iperf_version(container: str) -> tuple[int, int] | None:
+    """
+    return the iperf3 version of a container. None if unknown.
+    the version is asked once per container.
+    """
+    if container not in _iperf_versions:
+        result = await run_async(lxc_args(container, "iperf3 --version"))
+        _iperf_versions[container] = parse_iperf_version(result.output)
+    return _iperf_versions[container]
 
 
 def iperf_in_container(container: str):
@@ -123,51 +336,1029 @@ def iperf_in_container(container: str):
         print(f"iPerf installed on {container}")
 
 
-def run_iperf_in_container(pane: int, command: str, lines: int = 20, delay: int = 0):
+def lxc_args(container: str, command: str) -> list[str]:
+    """
+    return the argument list that runs a command in a container.
+    """
+    return ["sudo", "lxc", "exec", container, "--", *shlex.split(command)]
+
+
+def server_address(container: str) -> str:
+    server_id = get_host_id(mode="vm", vm=container)
+    return f"{TEST_SUBNET}{server_id}"
+
+
+def container_addresses() -> dict[str, str]:
+    """
+    return the test subnet address of each container in containers.json.
+    """
+    addresses = {}
+    for item in get_store().collection("containers").all():
+        for iface in item.get("interfaces", []):
+            for data in iface.values():
+                for address in data.get("addresses") or []:
+                    if address.startswith(TEST_SUBNET):
+                        addresses[item["container"]] = address.split("/")[0]
+    return addresses
+
+
+async def stop_process(proc: asyncio.subprocess.Process, grace: float = 5):
+    """
+    wait for a process to exit, stop it after grace seconds.
+    """
+    try:
+        await asyncio.wait_for(proc.wait(), grace)
+    except asyncio.TimeoutError:
+        await terminate_process(proc)
+
+
+async def stop_server(
+    proc: asyncio.subprocess.Process, reader: asyncio.Task, grace: float = 5
+):
+    """
+    stop a server started by start_server() and the task reading its output.
+    the reader is cancelled if the output is still open after KILL_GRACE
+    seconds (e.g. an iperf3 left running in the container).
+    """
+    await stop_process(proc, grace)
+    try:
+        await asyncio.wait_for(reader, KILL_GRACE)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def drain(stream: asyncio.StreamReader, log: deque):
+    """
+    read a stream until it closes, keeping the last lines in log.
+    a server that isn't read from would block once the pipe is full.
+    """
+    while line := await stream.readline():
+        log.append(line.decode(errors="replace").rstrip())
+
+
+async def start_server(
+    server: str, port: int, timeout: float = SERVER_READY_TIMEOUT
+) -> tuple[asyncio.subprocess.Process, deque, asyncio.Task]:
+    """
+    start a one-off iperf3 server in a container and wait until it listens.
+
+    :param server: container name
+    :type server: str
+    :param port: server port
+    :type port: int
+    :param timeout: max seconds to wait for the server
+    :type timeout: float
+    :return: server process, its last output lines and the task reading them
+    :rtype: tuple[asyncio.subprocess.Process, deque, asyncio.Task]
+    :raises RuntimeError: the server exited or didn't listen in time
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *lxc_args(server, iperf(mode="server", port=port, one_off=True)),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    log = deque(maxlen=SERVER_LOG_LINES)
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            line = await asyncio.wait_for(proc.stdout.readline(), max(remaining, 0))
+            if not line:
+                raise RuntimeError(f"server exited: {' '.join(log) or 'no output'}")
+            log.append(line.decode(errors="replace").rstrip())
+            if SERVER_READY in log[-1]:
+                break
+    except asyncio.TimeoutError:
+        await terminate_process(proc)
+        raise RuntimeError(f"server not listening after {timeout}s")
+    except BaseException:
+        await stop_process(proc, grace=0)
+        raise
+    return proc, log, asyncio.create_task(drain(proc.stdout, log))
+
+
+async def measure(
+    client: str,
+    server: str,
+    port: int = IPERF_PORT,
+    duration: int = IPERF_DURATION,
+    udp: bool = False,
+    bitrate: str = "",
+    server_ip: str = "",
+) -> IperfResult:
+    """
+    run one iperf3 test from client to server and parse its JSON output.
+    the client starts as soon as the server listens.
+
+    :param client: client container name
+    :type client: str
+    :param server: server container name
+    :type server: str
+    :param port: server port
+    :type port: int
+    :param duration: test length in seconds
+    :type duration: int
+    :param udp: run a UDP test
+    :type udp: bool
+    :param bitrate: target bitrate, e.g.: 100M
+    :type bitrate: str
+    :param server_ip: server address. found from the container name if empty
+    :type server_ip: str
+    :return: intervals and summary of the test
+    :rtype: IperfResult
+    """
+    result = IperfResult(client=client, server=server, port=port)
+    start = time.perf_counter()
+    server_ip = server_ip or server_address(server)
+    try:
+        proc, log, reader = await start_server(server, port)
+    except RuntimeError as e:
+        result.error = f"{server}: {e}"
+        return result
+
+    try:
+        client_cmd = iperf(
+            mode="client",
+            ip=server_ip,
+            port=port,
+            duration=duration,
+            udp=udp,
+            bitrate=bitrate,
+            json_output=True,
+        )
+        out = await run_async(
+            lxc_args(client, client_cmd), timeout=duration + SERVER_READY_TIMEOUT
+        )
+        if out.timed_out:
+            result.error = f"{client}: no result after {out.duration:.0f}s"
+        else:
+            result.intervals, result.summary, result.error = parse_iperf_json(
+                out.stdout or out.stderr
+            )
+    finally:
+        await stop_server(proc, reader)
+    if result.error and log:
+        result.error += f" (server: {log[-1]})"
+    result.duration = time.perf_counter() - start
+    return result
+
+
+async def stream_intervals(
+    client: str,
+    server: str,
+    port: int = IPERF_PORT,
+    duration: int = IPERF_DURATION,
+    udp: bool = False,
+    bitrate: str = "",
+    server_ip: str = "",
+    result: IperfResult | None = None,
+):
+    """
+    run one iperf3 test with --json-stream and yield its intervals as the
+    client prints them. nothing is kept, so memory stays flat for long tests.
+    leaving the loop early stops the test (close the generator, e.g. with
+    contextlib.aclosing, to stop it at once).
+    clients older than JSON_STREAM_VERSION have no --json-stream, their
+    text output (flushed at each line) is parsed instead.
+
+    :param client: client container name
+    :type client: str
+    :param server: server container name
+    :type server: str
+    :param port: server port
+    :type port: int
+    :param duration: test length in seconds
+    :type duration: int
+    :param udp: run a UDP test
+    :type udp: bool
+    :param bitrate: target bitrate, e.g.: 100M
+    :type bitrate: str
+    :param server_ip: server address. found from the container name if empty
+    :type server_ip: str
+    :param result: if given, gets the summary and error of the test
+    :type result: IperfResult | None
+    :raises RuntimeError: the server didn't start
+    """
+    server_ip = server_ip or server_address(server)
+    version = await iperf_version(client)
+    json_stream = version is not None and version >= JSON_STREAM_VERSION
+    proc, log, reader = await start_server(server, port)
+    client_cmd = iperf(
+        mode="client",
+        ip=server_ip,
+        port=port,
+        duration=duration,
+        udp=udp,
+        bitrate=bitrate,
+        json_stream=json_stream,
+    )
+    client_proc = None
+    protocol = "UDP" if udp else "TCP"
+    # end of test lines of the text output
+    totals = {}
+    try:
+        client_proc = await asyncio.create_subprocess_exec(
+            *lxc_args(client, client_cmd),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            limit=STREAM_LINE_LIMIT,
+        )
+        while line := await client_proc.stdout.readline():
+            if not json_stream:
+                text = line.decode(errors="replace")
+                parsed = parse_text_line(text, udp)
+                if parsed is None:
+                    # e.g.: iperf3: error - unable to connect to server
+                    if result is not None and text.startswith("iperf3: "):
+                        result.error = text.strip()
+                elif parsed[0] == "interval":
+                    yield IperfInterval(**parsed[1])
+                else:
+                    totals[parsed[0]] = parsed[1]
+                continue
+            try:
+                msg = json.loads(line)
+            except json.JSONDecodeError:
+                # e.g. an error printed before the test starts
+                if result is not None and line.strip():
+                    result.error = line.decode(errors="replace").strip()
+                continue
+            event, data = msg.get("event"), msg.get("data")
+            if event == "interval":
+                yield parse_interval(data)
+            elif event == "start":
+                protocol = data.get("test_start", {}).get("protocol", protocol)
+            elif result is None:
+                continue
+            elif event == "end":
+                result.summary = parse_summary(data, protocol)
+            elif event == "error":
+                result.error = str(data)
+        await client_proc.wait()
+        if totals and result is not None:
+            sender, receiver = totals.get("sender", {}), totals.get("receiver", {})
+            result.summary = text_summary(sender, receiver, protocol)
+    finally:
+        # the test was stopped early, the server doesn't need to wait for it
+        stopped = client_proc is not None and client_proc.returncode is None
+        if stopped:
+            await terminate_process(client_proc)
+        await stop_server(proc, reader, grace=0 if stopped else 5)
+
+
+def watch_test(
+    client: str,
+    server: str,
+    duration: int = IPERF_DURATION,
+    stop_below: float = 0,
+    port: int = IPERF_PORT,
+    save: bool = True,
+) -> IperfResult:
     """
-    run shell command in a selected tmux pane.
+    run a test and print each interval as it arrives.
+    intervals go to the measurement store as they come (in batches).
 
-    :param pane: tmux pane number
-    :type pane: int
-    :param command: command to be executed
-    :type command: str
-    :param lines: number of output lines to be captured
-    :type lines: int
-    :param delay: time delay in seconds between execution and output capture
-    :type delay: int
+    :param client: client container name
+    :type client: str
+    :param server: server container name
+    :type server: str
+    :param duration: test length in seconds (e.g. hours for a soak test)
+    :type duration: int
+    :param stop_below: stop the test when an interval's bitrate (bits/s) is
+        below this value. 0 never stops early
+    :type stop_below: float
+    :param port: server port
+    :type port: int
+    :param save: add the intervals to the measurement store
+    :type save: bool
+    :return: summary of the test (intervals are not kept)
+    :rtype: IperfResult
     """
-    tmux_run_command(pane, command)
-    time.sleep(delay)
+    from contextlib import aclosing
+    from measure_store import MeasurementStore, new_run_id
 
-    output = tmux_capture(pane, lines)
-    return output
+    result = IperfResult(client=client, server=server, port=port)
+    store = MeasurementStore()
+    run_id = new_run_id()
+    timestamp = time.time()
 
+    async def watch():
+        version = await iperf_version(client)
+        if version is None:
+            raise RuntimeError(f"iperf3 not found in {client}")
+        if version < JSON_STREAM_VERSION:
+            print(
+                f"iperf3 {'.'.join(map(str, version))} in {client} has no"
+                " --json-stream, reading its text output"
+            )
+        stream = stream_intervals(client, server, port, duration, result=result)
+        async with aclosing(stream) as intervals:
+            async for i in intervals:
+                print(
+                    f"{i.start:7.1f}-{i.end:<7.1f} {i.bits_per_second / 1e6:9.1f} Mbit/s"
+                    f"  retr: {i.retransmits if i.retransmits is not None else '-'}"
+                )
+                if save:
+                    store.add_interval(i, run_id, client, server, timestamp=timestamp)
+                if stop_below and not i.omitted and i.bits_per_second < stop_below:
+                    result.error = f"stopped: {i.bits_per_second / 1e6:.1f} Mbit/s"
+                    break
+
+    start = time.perf_counter()
+    try:
+        asyncio.run(watch())
+    except RuntimeError as e:
+        result.error = str(e)
+    finally:
+        store.flush()
+    result.duration = time.perf_counter() - start
+    if result.summary:
+        print(
+            f"\n{client} -> {server}: "
+            f"{result.summary.bits_per_second_received / 1e6:.1f} Mbit/s"
+        )
+    if result.error:
+        print(f"\n{result.error}")
+    if save:
+        print(f"Saved as run {run_id}")
+    return result
 
-def run_iperf_test(client: str, server: str, port: str | int = "") -> list[tuple]:
 
+def run_iperf_test(
+    client: str,
+    server: str,
+    port: int = IPERF_PORT,
+    duration: int = IPERF_DURATION,
+    udp: bool = False,
+    bitrate: str = "",
+) -> IperfResult:
+    """
+    blocking wrapper of measure() for one test.
+    """
     iperf_in_container(container=server)
     iperf_in_container(container=client)
+    return asyncio.run(measure(client, server, port, duration, udp, bitrate))
+
+
+def round_robin(nodes: list[str]) -> list[list[tuple[str, str]]]:
+    """
+    return rounds of (client, server) pairs that cover every ordered pair once.
+    the pairs come from the circle method: the first node stays in place and
+    the others rotate around it, which gives N-1 rounds of disjoint pairs
+    (N rounds if N is odd, one node sits out of each). each of these rounds
+    is run twice, once per direction, so no container is in two tests of a
+    round and a test never shares a NIC with its reverse flow.
+
+    :param nodes: container names
+    :type nodes: list[str]
+    :return: rounds of (client, server) pairs
+    :rtype: list[list[tuple[str, str]]]
+    """
+    # None is the free slot of an odd number of nodes
+    ring = list(nodes) + [None] * (len(nodes) % 2)
+    n = len(ring)
+    rounds = []
+    for _ in range(n - 1):
+        pairs = [(ring[i], ring[n - 1 - i]) for i in range(n // 2)]
+        pairs = [pair for pair in pairs if None not in pair]
+        if pairs:
+            rounds.append(pairs)
+            rounds.append([(server, client) for client, server in pairs])
+        ring = [ring[0], ring[-1], *ring[1:-1]]
+    return rounds
+
+
+async def measure_mesh(
+    nodes: list[str],
+    addresses: dict[str, str] | None = None,
+    duration: int = IPERF_DURATION,
+    base_port: int = IPERF_PORT,
+    limit: int = MAX_PARALLEL,
+) -> list[IperfResult]:
+    """
+    measure every ordered pair of containers, one round at a time.
+    the pairs of a round run concurrently (at most limit at once).
+
+    :param nodes: container names
+    :type nodes: list[str]
+    :param addresses: server address of each container. looked up if missing
+    :type addresses: dict[str, str] | None
+    :param duration: length of each test in seconds
+    :type duration: int
+    :param base_port: first port of the servers
+    :type base_port: int
+    :param limit: max number of tests running at the same time
+    :type limit: int
+    :return: result of every pair
+    :rtype: list[IperfResult]
+    """
+    addresses = dict(addresses or {})
+    for node in nodes:
+        if node not in addresses:
+            addresses[node] = server_address(node)
+    limiter = asyncio.Semaphore(max(1, limit))
+    # next port of each server
+    ports = {node: 0 for node in nodes}
+
+    async def run_pair(client: str, server: str, port: int) -> IperfResult:
+        async with limiter:
+            return await measure(
+                client, server, port, duration, server_ip=addresses[server]
+            )
+
+    results = []
+    rounds = round_robin(nodes)
+    for number, pairs in enumerate(rounds, start=1):
+        tasks = []
+        for client, server in pairs:
+            port = base_port + ports[server] % PORT_RANGE
+            ports[server] += 1
+            tasks.append(run_pair(client, server, port))
+        start = time.perf_counter()
+        round_results = await asyncio.gather(*tasks)
+        failed = len([r for r in round_results if not r.ok])
+        print(
+            f"Round {number}/{len(rounds)}: {len(pairs)} pairs, "
+            f"{failed} failed ({time.perf_counter() - start:.1f}s)"
+        )
+        results += round_results
+    return results
+
+
+def bandwidth_matrix(
+    nodes: list[str], results: list[IperfResult]
+) -> list[list[float | None]]:
+    """
+    return the N x N matrix of received bits per second.
+    row = client, column = server. None on the diagonal and for failed tests.
+    """
+    index = {node: i for i, node in enumerate(nodes)}
+    matrix = [[None] * len(nodes) for _ in nodes]
+    for r in results:
+        if r.ok:
+            row, column = index[r.client], index[r.server]
+            matrix[row][column] = r.summary.bits_per_second_received
+    return matrix
+
+
+def print_matrix(
+    nodes: list[str], matrix: list[list], scale: float = 1e6, digits: int = 1
+):
+    """
+    print a matrix with clients as rows and servers as columns.
+    values are divided by scale (Mbit/s by default).
+    """
+    from tabulate import tabulate
+
+    rows = [
+        [node] + ["-" if v is None else f"{v / scale:.{digits}f}" for v in row]
+        for node, row in zip(nodes, matrix)
+    ]
+    print(tabulate(rows, headers=["client \\ server", *nodes]))
+
+
+def run_mesh_test(
+    nodes: list[str] | None = None,
+    duration: int = IPERF_DURATION,
+    limit: int = MAX_PARALLEL,
+    path: str = "",
+) -> dict:
+    """
+    measure the throughput between every ordered pair of containers
+    and save the bandwidth matrix as json. the intervals of every test
+    are added to the measurement store under one run id.
+
+    :param nodes: container names. all containers in containers.json if None
+    :type nodes: list[str] | None
+    :param duration: length of each test in seconds
+    :type duration: int
+    :param limit: max number of tests running at the same time
+    :type limit: int
+    :param path: json file of the matrix
+    :type path: str
+    :return: run id, nodes, matrix (bits/s, row = client) and errors of failed pairs
+    :rtype: dict
+    """
+    from measure_store import MeasurementStore, new_run_id
+
+    addresses = container_addresses()
+    nodes = nodes or sorted(addresses)
+    start = time.perf_counter()
+    timestamp = time.time()
+    results = asyncio.run(measure_mesh(nodes, addresses, duration, limit=limit))
+    run_id = new_run_id()
+    with MeasurementStore() as store:
+        for r in results:
+            store.add_result(r, run_id, timestamp=timestamp)
+    data = {
+        "run_id": run_id,
+        "time": TIME,
+        "duration": duration,
+        "nodes": nodes,
+        "matrix": bandwidth_matrix(nodes, results),
+        "errors": {f"{r.client}->{r.server}": r.error for r in results if not r.ok},
+    }
+    print(f"\nMeasured {len(results)} pairs in {time.perf_counter() - start:.1f}s\n")
+    print_matrix(nodes, data["matrix"])
+    for pair, error in data["errors"].items():
+        print(f"{pair}: {error}")
+    save_json_file(data=data, path=path or f"{MEASUREMENTS}/matrix_{TIME}.json")
+    return data
+
+
+def interval_stats(df, by: list[str]):
+    """
+    compute the statistics of stored intervals for each group, with pandas
+    group operations only.
+
+    :param df: intervals from MeasurementStore.load()
+    :type df: pd.DataFrame
+    :param by: group columns, e.g.: ["pair", "queue"]
+    :type by: list[str]
+    :return: one row per group. bitrates in bits/s, cwnd in bytes
+    :rtype: pd.DataFrame
+    """
+    df = df[~df["omitted"].astype(bool)]
+    # one test = one client -> server run through one queue
+    test = ["run_id", "pair", "queue", "timestamp"]
+    df = df.sort_values(test + ["start"])
+    tests = df.groupby(test, sort=False)
+    df = df.assign(
+        seconds=df["end"] - df["start"],
+        test_id=tests.ngroup(),
+        # change of bitrate from the previous interval of the same test
+        step=tests["bits_per_second"].diff().abs(),
+    )
+    groups = df.groupby(by)
+    stats = groups.agg(
+        tests=("test_id", "nunique"),
+        intervals=("bits_per_second", "size"),
+        mean_bps=("bits_per_second", "mean"),
+        retransmits=("retransmits", "sum"),
+        seconds=("seconds", "sum"),
+        cwnd_mean=("snd_cwnd", "mean"),
+        interval_jitter_bps=("step", "mean"),
+        udp_jitter_ms=("jitter_ms", "mean"),
+        lost_packets=("lost_packets", "sum"),
+        packets=("packets", "sum"),
+    )
+    rates = groups["bits_per_second"].quantile([0.5, 0.95, 0.99]).unstack()
+    rates.columns = ["p50_bps", "p95_bps", "p99_bps"]
+    cwnd = groups["snd_cwnd"].quantile([0.05, 0.5, 0.95]).unstack()
+    cwnd.columns = ["cwnd_p5", "cwnd_p50", "cwnd_p95"]
+    stats = stats.join(rates).join(cwnd)
+    stats["retransmits_per_s"] = stats["retransmits"] / stats["seconds"]
+    packets = stats["packets"].where(stats["packets"] > 0)
+    stats["loss_percent"] = 100 * stats["lost_packets"] / packets
+    return stats.reset_index()
+
+
+def print_stats(stats, by: list[str], scale: float = 1e6):
+    """
+    print the main statistics of interval_stats(). bitrates in Mbit/s.
+    """
+    from tabulate import tabulate
+
+    columns = {
+        "tests": "tests",
+        "mean_bps": "mean",
+        "p50_bps": "p50",
+        "p95_bps": "p95",
+        "p99_bps": "p99",
+        "interval_jitter_bps": "jitter",
+        "retransmits_per_s": "retr/s",
+        "cwnd_p50": "cwnd p50 (KB)",
+    }
+    table = stats[by + list(columns)].copy()
+    for c in ("mean_bps", "p50_bps", "p95_bps", "p99_bps", "interval_jitter_bps"):
+        table[c] = table[c] / scale
+    table["cwnd_p50"] = table["cwnd_p50"] / 1024
+    table = table.rename(columns=columns)
+    # columns keep their own type (a frame of numbers would print ints as floats)
+    print(tabulate(table.to_dict("list"), headers="keys", floatfmt=".1f"))
+
+
+def analyze_measurements(runs: list[str] | None = None, path: str = "") -> dict:
+    """
+    load the stored measurements and compute per pair and per queue statistics:
+    mean and p50/p95/p99 bitrate, retransmits per second, congestion window
+    distribution, bitrate jitter between intervals, and UDP jitter and loss.
+    prints them as tables and saves them as json.
+
+    :param runs: run ids to analyze. all runs if None
+    :type runs: list[str] | None
+    :param path: json output file
+    :type path: str
+    :return: statistics by "pair" (pair and queue) and by "queue"
+    :rtype: dict
+    """
+    from measure_store import MeasurementStore
+
+    start = time.perf_counter()
+    df = MeasurementStore().load(runs)
+    if df.empty:
+        print("No measurements stored.")
+        return {}
+    by_pair = interval_stats(df, ["pair", "queue"])
+    by_queue = interval_stats(df, ["queue"])
+    seconds = time.perf_counter() - start
+    print(f"\n{len(df)} intervals, {df['run_id'].nunique()} runs ({seconds:.2f}s)\n")
+    print("Per pair (Mbit/s):")
+    print_stats(by_pair, ["pair", "queue"])
+    print("\nPer queue (Mbit/s):")
+    print_stats(by_queue, ["queue"])
+
+    data = {
+        "time": TIME,
+        "runs": sorted(df["run_id"].unique().tolist()),
+        "pair": json.loads(by_pair.to_json(orient="records")),
+        "queue": json.loads(by_queue.to_json(orient="records")),
+    }
+    path = path or f"{MEASUREMENTS}/analysis_{TIME}.json"
+    save_json_file(data=data, path=path)
+    print(f"\nSaved to {path}")
+    return data
+
+
+PING_COUNT = 10
+# seconds between pings (0.2 is the lowest allowed without root)
+PING_INTERVAL = 0.2
+# extra seconds a ping may run after count * interval (-w deadline), so an
+# unreachable target doesn't hold the others' results
+PING_DEADLINE_SLACK = 2
+# extra seconds for lxc exec on top of the ping deadline
+PING_EXEC_MARGIN = 10
+PING_SUMMARY = re.compile(
+    r"(\d+) packets transmitted, (\d+) (?:packets )?received.*?([\d.]+)% packet loss"
+)
+PING_RTT = re.compile(r"= ([\d.]+)/([\d.]+)/([\d.]+)/([\d.]+) ms")
+# marks the start of each target's output in the combined ping output
+PING_MARK = "### ping "
+
+
+@dataclass
+class PingStats:
+    """
+    round trip times (ms) and loss of pings from source to target.
+    """
 
-    server_id = get_host_id(mode="vm", vm=server)
-    server_ip = f"10.0.200.{server_id}"
+    source: str
+    target: str
+    transmitted: int = 0
+    received: int = 0
+    loss_percent: float = 100.0
+    min_ms: float | None = None
+    avg_ms: float | None = None
+    max_ms: float | None = None
+    mdev_ms: float | None = None
+    error: str = ""
 
-    server_cmd = iperf(mode="server", port=port)
-    server_input = f"sudo lxc exec {server} -- {server_cmd}"
+    @property
+    def ok(self) -> bool:
+        return not self.error and self.received > 0
 
-    client_cmd = iperf(mode="client", ip=server_ip, port=port)
-    client_input = f"sudo lxc exec {client} -- {client_cmd}"
 
-    timeout = 12
+def parse_ping(output: str, source: str = "", target: str = "") -> PingStats:
+    """
+    parse the summary lines of a ping command.
+
+    :param output: ping output (-q is enough)
+    :type output: str
+    :return: counts, loss and min/avg/max/mdev round trip times
+    :rtype: PingStats
+    """
+    stats = PingStats(source=source, target=target)
+    summary = PING_SUMMARY.search(output)
+    if not summary:
+        lines = output.strip().splitlines()
+        stats.error = lines[-1] if lines else "no output"
+        return stats
+    stats.transmitted, stats.received = int(summary[1]), int(summary[2])
+    stats.loss_percent = float(summary[3])
+    rtt = PING_RTT.search(output)
+    if rtt:
+        stats.min_ms, stats.avg_ms, stats.max_ms, stats.mdev_ms = map(
+            float, rtt.groups()
+        )
+    return stats
+
+
+def ping_deadline(count: int, interval: float) -> int:
+    """
+    return the -w deadline (seconds) of a ping of count packets.
+    """
+    return math.ceil(count * interval) + PING_DEADLINE_SLACK
+
+
+def ping_all_command(ips: list[str], count: int, interval: float) -> str:
+    """
+    return a shell command that pings every ip at the same time and prints
+    each output after a PING_MARK line.
+    each ping stops at its deadline, so the command ends within one deadline.
+    """
+    deadline = ping_deadline(count, interval)
+    ping = f"ping -q -n -c {count} -i {interval} -w {deadline}"
+    return (
+        "dir=$(mktemp -d); "
+        f'for ip in {" ".join(ips)}; do {ping} $ip > $dir/$ip 2>&1 & done; wait; '
+        f'for ip in {" ".join(ips)}; do echo "{PING_MARK}$ip"; cat $dir/$ip; done; '
+        "rm -rf $dir"
+    )
+
+
+def split_ping_output(output: str) -> dict[str, str]:
+    """
+    split the output of ping_all_command() by target ip.
+    """
+    parts = {}
+    for block in output.split(PING_MARK)[1:]:
+        ip, _, text = block.partition("\n")
+        parts[ip.strip()] = text
+    return parts
+
+
+def measure_latency(
+    nodes: list[str] | None = None,
+    count: int = PING_COUNT,
+    interval: float = PING_INTERVAL,
+    path: str = "",
+) -> dict:
+    """
+    ping between every pair of containers at the same time and save the
+    N x N latency matrix as json, next to the throughput matrices.
+    each container pings all the others in parallel, so the whole matrix
+    takes about count * interval seconds.
+
+    :param nodes: container names. all containers in containers.json if None
+    :type nodes: list[str] | None
+    :param count: pings per pair
+    :type count: int
+    :param interval: seconds between pings
+    :type interval: float
+    :param path: json output file
+    :type path: str
+    :return: run nodes, avg rtt (ms) and loss (%) matrices (row = source),
+        stats of every pair
+    :rtype: dict
+    """
+    addresses = container_addresses()
+    nodes = nodes or sorted(addresses)
+    for node in nodes:
+        if node not in addresses:
+            addresses[node] = server_address(node)
+    start = time.perf_counter()
+    commands = {}
+    for node in nodes:
+        ips = [addresses[n] for n in nodes if n != node]
+        command = ping_all_command(ips, count, interval)
+        commands[node] = f"bash -c {shlex.quote(command)}"
+    # the pings of a node run in parallel, each one stops at the deadline
+    timeout = ping_deadline(count, interval) + PING_EXEC_MARGIN
+    results = lxc_cmd_all(nodes, commands, limit=len(nodes), timeout=timeout)
+
+    index = {node: i for i, node in enumerate(nodes)}
+    rtt = [[None] * len(nodes) for _ in nodes]
+    loss = [[None] * len(nodes) for _ in nodes]
+    pairs = []
+    for node, result in results.items():
+        outputs = split_ping_output(result.stdout)
+        for target in nodes:
+            if target == node:
+                continue
+            text = outputs.get(addresses[target], result.output)
+            stats = parse_ping(text, node, target)
+            if result.timed_out:
+                stats.error = f"no result after {timeout:.0f}s"
+            pairs.append(stats)
+            i, j = index[node], index[target]
+            rtt[i][j] = stats.avg_ms
+            loss[i][j] = stats.loss_percent if not stats.error else None
+
+    data = {
+        "time": TIME,
+        "count": count,
+        "nodes": nodes,
+        "rtt_avg_ms": rtt,
+        "loss_percent": loss,
+        "pairs": [asdict(p) for p in pairs],
+    }
+    print(f"\nPinged {len(pairs)} pairs in {time.perf_counter() - start:.1f}s\n")
+    print("Average RTT (ms):")
+    print_matrix(nodes, rtt, scale=1, digits=3)
+    for p in pairs:
+        if p.error:
+            print(f"{p.source}->{p.target}: {p.error}")
+        elif p.loss_percent:
+            print(f"{p.source}->{p.target}: {p.loss_percent}% loss")
+    save_json_file(data=data, path=path or f"{MEASUREMENTS}/latency_{TIME}.json")
+    return data
+
+
+# a queue conforms if its throughput is within this fraction of its max rate
+QOS_TOLERANCE = 0.05
+QOS_REPORT_KEYS = ("qos_id", "queue", "max_rate", "ovs_port", "client", "server")
+QOS_HEADERS = ["QoS", "Port", "Queue", "Max (Mbit/s)", "Achieved", "Dev.", "Status"]
+
+
+def qos_test_plan(
+    qos_items: list[dict], containers: list[dict]
+) -> tuple[list[list[dict]], list[str]]:
+    """
+    plan one test per queue of qos.json, in rounds that can run at once.
+    a queue is tested with traffic to the container behind its QoS port
+    (the server), from another container of the same bridge (the client).
+    the queues of one port share its rate, so they are tested one per round.
+    no container is in two tests of a round.
 
-    tmux_create_panes()
-    # pane 0 will be used for the server
-    # pane 1 will be used for the client
-    print("Starting server")
-    server_output = run_iperf_in_container(pane=0, command=server_input)
+    :param qos_items: qos.json items
+    :type qos_items: list[dict]
+    :param containers: containers.json items
+    :type containers: list[dict]
+    :return: rounds of tests (qos_id, queue, max_rate, ovs_port, bridge,
+        client, server) and the reasons for the ports that can't be tested
+    :rtype: tuple[list[list[dict]], list[str]]
+    """
+    by_port = {c["ovs_port"]: c for c in containers if c.get("ovs_port")}
+    by_bridge = {}
+    for c in containers:
+        by_bridge.setdefault(c.get("bridge"), []).append(c["container"])
+
+    # the tests of each QoS port, run one after another
+    lanes = []
+    skipped = []
+    for qos in qos_items:
+        for ovs_port in qos.get("ports", []):
+            server = by_port.get(ovs_port)
+            if server is None:
+                skipped.append(f"{ovs_port}: no container behind the port")
+                continue
+            bridge = server.get("bridge")
+            clients = [c for c in by_bridge[bridge] if c != server["container"]]
+            if not clients:
+                skipped.append(f"{ovs_port}: no other container on {bridge}")
+                continue
+            tests = [
+                dict(
+                    qos_id=qos["qos_id"],
+                    queue=int(q["number"]),
+                    max_rate=q["max_rate"],
+                    ovs_port=ovs_port,
+                    bridge=bridge,
+                    server=server["container"],
+                    clients=clients,
+                )
+                for q in qos.get("queues", [])
+                if q.get("max_rate")
+            ]
+            lanes.append(sorted(tests, key=lambda t: t["queue"]))
+
+    rounds = []
+    while any(lanes):
+        # servers are reserved first, so no client is taken from them
+        heads = [lane for lane in lanes if lane]
+        used = {lane[0]["server"] for lane in heads}
+        tests = []
+        for lane in heads:
+            free = [c for c in lane[0]["clients"] if c not in used]
+            if not free:
+                continue
+            test = lane.pop(0)
+            test["client"] = free[0]
+            used.add(test["client"])
+            tests.append(test)
+        if not tests:
+            # every client is a server of this round: test one queue alone
+            test = heads[0].pop(0)
+            test["client"] = test["clients"][0]
+            tests.append(test)
+        rounds.append(tests)
+    for tests in rounds:
+        for test in tests:
+            del test["clients"]
+    return rounds, skipped
 
-    print("Starting client")
-    client_output = run_iperf_in_container(pane=1, command=client_input, delay=timeout)
 
-    cmd("tmux kill-server")
+def qos_status(achieved: float, max_rate: float, tolerance: float) -> str:
+    deviation = (achieved - max_rate) / max_rate
+    if deviation > tolerance:
+        return "OVER"
+    if deviation < -tolerance:
+        return "UNDER"
+    return "ok"
+
+
+def run_qos_benchmark(
+    duration: int = IPERF_DURATION,
+    tolerance: float = QOS_TOLERANCE,
+    base_port: int = IPERF_PORT,
+    path: str = "",
+) -> list[dict]:
+    """
+    check that each queue of qos.json limits traffic to its max rate.
+    for each queue, a flow sends the iperf3 traffic of one test to the queue
+    (set_queue, like add_queue_of()), and the achieved throughput is compared
+    to the queue's max rate. queues of different ports are tested at once.
 
-    return server_output, client_output
+    :param duration: length of each test in seconds
+    :type duration: int
+    :param tolerance: accepted deviation from the max rate (0.05 = 5%)
+    :type tolerance: float
+    :param base_port: first iperf3 port
+    :type base_port: int
+    :param path: json report file
+    :type path: str
+    :return: report of each queue test
+    :rtype: list[dict]
+    """
+    from measure_store import MeasurementStore, new_run_id
+
+    store = get_store()
+    containers = store.collection("containers").all()
+    rounds, skipped = qos_test_plan(store.collection("qos").all(), containers)
+    for reason in skipped:
+        print(f"Skipped {reason}")
+    addresses = container_addresses()
+    run_id = new_run_id()
+    timestamp = time.time()
+    reports = []
+    number = 0
+
+    with MeasurementStore() as results_store:
+        for round_number, tests in enumerate(rounds, start=1):
+
+            async def run_round():
+                return await asyncio.gather(
+                    *[
+                        measure(
+                            t["client"],
+                            t["server"],
+                            t["port"],
+                            duration,
+                            server_ip=t["server_ip"],
+                        )
+                        for t in tests
+                    ]
+                )
+
+            # the flows are removed even if a test fails, so no traffic stays
+            # pinned to a queue
+            flows = []
+            try:
+                for test in tests:
+                    test["port"] = base_port + number % PORT_RANGE
+                    number += 1
+                    ip = addresses.get(test["server"]) or server_address(test["server"])
+                    test["server_ip"] = ip
+                    test["match"] = f"tcp,nw_dst={ip},tp_dst={test['port']}"
+                    flows.append((test["bridge"], test["match"]))
+                    add_queue_flow(test["bridge"], test["match"], test["queue"])
+                results = asyncio.run(run_round())
+            finally:
+                for bridge, match in flows:
+                    del_queue_flow(bridge, match)
+            print(f"Round {round_number}/{len(rounds)}: {len(tests)} queues")
+
+            for test, result in zip(tests, results):
+                results_store.add_result(result, run_id, test["queue"], timestamp)
+                report = {k: test[k] for k in QOS_REPORT_KEYS}
+                if result.ok:
+                    achieved = result.summary.bits_per_second_received
+                    max_rate = test["max_rate"]
+                    report["achieved"] = achieved
+                    report["deviation"] = (achieved - max_rate) / max_rate
+                    report["status"] = qos_status(achieved, max_rate, tolerance)
+                else:
+                    report.update(achieved=None, deviation=None, status="FAILED")
+                    report["error"] = result.error
+                reports.append(report)
+
+    print_qos_report(reports)
+    data = {"run_id": run_id, "time": TIME, "tolerance": tolerance, "queues": reports}
+    save_json_file(data=data, path=path or f"{MEASUREMENTS}/qos_{TIME}.json")
+    return reports
+
+
+def print_qos_report(reports: list[dict]):
+    from tabulate import tabulate
+
+    rows = []
+    for r in reports:
+        achieved = "-" if r["achieved"] is None else f"{r['achieved'] / 1e6:.1f}"
+        deviation = "-" if r["deviation"] is None else f"{r['deviation'] * 100:+.1f}%"
+        rows.append(
+            [
+                r["qos_id"][:8],
+                r["ovs_port"],
+                r["queue"],
+                f"{r['max_rate'] / 1e6:.1f}",
+                achieved,
+                deviation,
+                r["status"],
+            ]
+        )
+    print(tabulate(rows, headers=QOS_HEADERS))
+    for r in reports:
+        if r.get("error"):
+            print(f"{r['ovs_port']} queue {r['queue']}: {r['error']}")
@@ -0,0 +1,230 @@
+"""
+this module contains a small OVSDB client (RFC 7047 JSON-RPC).
+it talks to ovsdb-server over its unix socket and keeps one connection open,
+so reading the database does not start a new ovs-vsctl process every time.
+"""
+
+import os
+import json
+import socket
+import threading
+
+OVSDB_SOCK = os.environ.get("OVSDB_SOCK", "/var/run/openvswitch/db.sock")
+OVS_DB = "Open_vSwitch"
+
+
+class OVSDBError(Exception):
+    """
+    error returned by ovsdb-server, or a broken connection.
+    """
+
+
+def uuid(value: str) -> list:
+    """
+    wrap a uuid string as an OVSDB atom, for use in where clauses.
+    """
+    return ["uuid", value]
+
+
+def to_python(value):
+    """
+    convert an OVSDB value to plain Python.
+    uuid -> str, set -> list, map -> dict.
+    """
+    if type(value) == list and len(value) == 2:
+        kind, data = value
+        if kind in ("uuid", "named-uuid"):
+            return data
+        if kind == "set":
+            return [to_python(v) for v in data]
+        if kind == "map":
+            return {to_python(k): to_python(v) for k, v in data}
+    return value
+
+
+def as_list(value) -> list:
+    """
+    return a set column as a list.
+    OVSDB sends sets with one element as the bare element.
+    """
+    if value is None:
+        return []
+    if type(value) == list:
+        return value
+    return [value]
+
+
+class OVSDBClient:
+    """
+    JSON-RPC client for ovsdb-server over a unix socket.
+    """
+
+    def __init__(self, path: str = OVSDB_SOCK, db: str = OVS_DB, timeout: float = 5):
+        self.path = path
+        self.db = db
+        self.timeout = timeout
+        self.sock = None
+        self._buffer = ""
+        self._next_id = 0
+        self._decoder = json.JSONDecoder()
+        self._lock = threading.Lock()
+
+    def connect(self):
+        if self.sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                raise
+            self.sock = sock
+        return self
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            self._buffer = ""
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ===== transport ===== #
+
+    def _send(self, msg: dict):
+        self.sock.sendall(json.dumps(msg).encode())
+
+    def _recv(self) -> dict:
+        """
+        return the next complete JSON message from the socket.
+        """
+        while True:
+            text = self._buffer.lstrip()
+            if text:
+                try:
+                    msg, end = self._decoder.raw_decode(text)
+                    self._buffer = text[end:]
+                    return msg
+                except json.JSONDecodeError:
+                    pass
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                self.close()
+                raise OVSDBError("connection closed by ovsdb-server")
+            self._buffer += chunk.decode()
+
+    def call(self, method: str, params: list):
+        """
+        send a request and wait for its reply.
+        echo requests from the server are answered while waiting.
+
+        :param method: RPC method name (e.g.: transact, list_dbs)
+        :type method: str
+        :param params: RPC params
+        :type params: list
+        :return: result of the request
+        """
+        with self._lock:
+            return self._call(method, params)
+
+    def _call(self, method: str, params: list):
+        self.connect()
+        self._next_id += 1
+        req_id = self._next_id
+        try:
+            self._send({"method": method, "params": params, "id": req_id})
+            while True:
+                msg = self._recv()
+                if msg.get("method") == "echo":
+                    reply = {"result": msg.get("params"), "error": None}
+                    self._send({**reply, "id": msg.get("id")})
+                    continue
+                if msg.get("id") != req_id:
+                    # notifications (e.g. monitor updates) are ignored here
+                    continue
+                if msg.get("error"):
+                    raise OVSDBError(msg.get("error"))
+                return msg.get("result")
+        except OSError as e:
+            self.close()
+            raise OVSDBError(str(e))
+
+    # ===== database operations ===== #
+
+    def list_dbs(self) -> list[str]:
+        return self.call("list_dbs", [])
+
+    def transact(self, *operations: dict) -> list[dict]:
+        """
+        run operations in one transaction and return their results.
+        """
+        result = self.call("transact", [self.db, *operations])
+        for op in result:
+            if op and op.get("error"):
+                raise OVSDBError(f"{op.get('error')}: {op.get('details', '')}")
+        return result
+
+    def select(
+        self, table: str, where: list | None = None, columns: list[str] | None = None
+    ) -> list[dict]:
+        """
+        return rows of a table as dicts with plain Python values.
+
+        :param table: table name (e.g.: Bridge, Port, QoS)
+        :type table: str
+        :param where: conditions, e.g.: [["name", "==", "br0"]]
+        :type where: list | None
+        :param columns: columns to return. all columns if None
+        :type columns: list[str] | None
+        :return: selected rows
+        :rtype: list[dict]
+        """
+        return self.select_many([(table, where, columns)])[0]
+
+    def select_many(self, queries: list[tuple]) -> list[list[dict]]:
+        """
+        run several selects in one transaction.
+
+        :param queries: (table, where, columns) tuples
+        :type queries: list[tuple]
+        :return: rows of every query, in the same order
+        :rtype: list[list[dict]]
+        """
+        ops = []
+        for table, where, columns in queries:
+            op = {"op": "select", "table": table, "where": where or []}
+            if columns is not None:
+                op["columns"] = columns
+            ops.append(op)
+        results = self.transact(*ops)
+        return [
+            [{k: to_python(v) for k, v in row.items()} for row in res.get("rows", [])]
+            for res in results
+        ]
+
+
+_client = None
+_unavailable = False
+
+
+def get_ovsdb() -> OVSDBClient | None:
+    """
+    return a shared, connected OVSDB client.
+    return None if the socket can't be used (missing, no permission),
+    so callers can fall back to ovs-vsctl.
+    set OVSDB_DISABLE=1 to always use ovs-vsctl.
+    """
+    global _client, _unavailable
+    if _unavailable or os.environ.get("OVSDB_DISABLE"):
+        return None
+    if _client is None:
+        try:
+            _client = OVSDBClient().connect()
+        except OSError:
+            _unavailable = True
+            return None
+    return _client
@@ -0,0 +1,139 @@
+"""
+this module manages a package cache on the host, shared by all containers.
+wheels (pip) and .deb files (apt) are downloaded once into pkg_cache/,
+which is mounted in every container as an LXD disk device.
+only the container that fills the cache mounts it read-write. the others
+mount it read-only and install from it without reaching the network.
+"""
+
+from utils import *
+
+PKG_CACHE = "pkg_cache"
+PKG_CACHE_DEVICE = "pkg-cache"
+# mount point of PKG_CACHE inside the containers
+PKG_CACHE_MOUNT = "/root/pkg_cache"
+WHEELHOUSE = f"{PKG_CACHE_MOUNT}/wheels"
+APT_CACHE = f"{PKG_CACHE_MOUNT}/apt"
+# apt archives dir of each container. it keeps its own lock and partial/
+APT_ARCHIVES = "/var/cache/apt/archives"
+# the apt command deletes downloaded .deb files by default, keep them instead
+APT_KEEP_CONF = "/etc/apt/apt.conf.d/01keep-pkg-cache"
+CACHE_DIRS = ("wheels", "apt")
+
+
+def init_pkg_cache(path: str = PKG_CACHE) -> str:
+    """
+    create the cache directories on the host. return the absolute cache path.
+    """
+    path = os.path.abspath(path)
+    for sub_dir in CACHE_DIRS:
+        os.makedirs(f"{path}/{sub_dir}", exist_ok=True)
+    return path
+
+
+def attach_pkg_cache(
+    container: str, path: str = PKG_CACHE, readonly: bool = True
+) -> str:
+    """
+    mount the host cache in a container as a disk device, like the `data`
+    device in default_profile.yaml. shift=true lets the unprivileged
+    container root write into the host directory.
+
+    :param container: container name
+    :type container: str
+    :param path: host cache directory
+    :type path: str
+    :param readonly: mount read-only. only the container filling the cache
+        should write to it
+    :type readonly: bool
+    :return: command output
+    :rtype: str
+    """
+    path = init_pkg_cache(path)
+    options = {
+        "type": "disk",
+        "source": path,
+        "path": PKG_CACHE_MOUNT,
+        "readonly": str(readonly).lower(),
+        "shift": "true",
+    }
+    lxd = get_lxd()
+    if lxd:
+        try:
+            lxd.add_device(container, PKG_CACHE_DEVICE, options)
+        except LXDError as e:
+            return f"Error: {e}\n"
+        return ""
+    # remove first, so running it again doesn't fail
+    cmd(f"sudo lxc config device remove {container} {PKG_CACHE_DEVICE}")
+    opts = [f"{k}={v}" for k, v in options.items() if k != "type"]
+    return cmd(
+        ["sudo", "lxc", "config", "device", "add", container, PKG_CACHE_DEVICE, "disk"]
+        + opts
+    )
+
+
+def apt_keep_command() -> str:
+    """
+    return the shell command that makes apt keep downloaded packages.
+    """
+    conf = 'Binary::apt::APT::Keep-Downloaded-Packages "true";'
+    return f"echo '{conf}' > {APT_KEEP_CONF}"
+
+
+def apt_cached(command: str, fill: bool = False) -> str:
+    """
+    return a shell command that runs an apt command through the cache.
+    the cached .deb files are linked into the container's own archives dir
+    first, so apt doesn't download them again. when filling the cache, the
+    downloaded files are copied back to it afterwards.
+
+    :param command: apt command, e.g.: sudo apt install -y git
+    :type command: str
+    :param fill: the cache is mounted read-write and gets the new packages
+    :type fill: bool
+    :return: shell command
+    :rtype: str
+    """
+    link = f"{{ ln -sf {APT_CACHE}/*.deb {APT_ARCHIVES}/ 2>/dev/null || true; }}"
+    if not fill:
+        return f"{link} && {command}"
+    save = f"{{ cp -n {APT_ARCHIVES}/*.deb {APT_CACHE}/ 2>/dev/null || true; }}"
+    return f"{link} && {command} && {save}"
+
+
+def pip_cached_install(args: str, index_url: str = "", fill: bool = False) -> str:
+    """
+    return a shell command that installs packages from the wheelhouse.
+    when filling the cache, the packages are downloaded to the wheelhouse
+    first (files already there are not downloaded again). otherwise the
+    index is not contacted at all.
+
+    :param args: packages, or -r <requirements file>
+    :type args: str
+    :param index_url: package index to download from. PyPI if empty
+    :type index_url: str
+    :param fill: download missing packages to the wheelhouse
+    :type fill: bool
+    :return: shell command
+    :rtype: str
+    """
+    install = f"pip install --no-index --find-links {WHEELHOUSE} {args}"
+    if not fill:
+        return install
+    index = f" --index-url {index_url}" if index_url else ""
+    download = f"pip download {args}{index} -d {WHEELHOUSE}"
+    return f"{download} && {install}"
+
+
+def cache_size(path: str = PKG_CACHE) -> dict[str, int]:
+    """
+    return the number of files in each cache directory.
+    """
+    path = os.path.abspath(path)
+    sizes = {}
+    for sub_dir in CACHE_DIRS:
+        full = f"{path}/{sub_dir}"
+        files = os.listdir(full) if os.path.isdir(full) else []
+        sizes[sub_dir] = len([f for f in files if os.path.isfile(f"{full}/{f}")])
+    return sizes
@@ -1,16 +1,79 @@
 from utils import *
+from ovsdb import get_ovsdb, as_list, uuid, to_python
+from store import get_store
 
 VSCTL = "sudo ovs-vsctl"
 QOS = "@newquos"
 QUEUE = "@newq-"
+# priority of the flows that steer test traffic to a queue
+QUEUE_PRIORITY = 40000
 
 QOS_TAGS = "sys_data/qos_tags.json"
 
+# ---------------------- #
+# bulk read functions    #
+# ---------------------- #
+
+
+def list_tables(queries: list[tuple[str, list[str]]]) -> list[list[dict]]:
+    """
+    read several OVSDB tables at once.
+    uses the OVSDB connection if available, else one ovs-vsctl call
+    with one `list` command per table.
+
+    :param queries: (table, columns) pairs
+    :type queries: list[tuple[str, list[str]]]
+    :return: rows of each table, in the same order as queries
+    :rtype: list[list[dict]]
+    """
+    db = get_ovsdb()
+    if db:
+        return db.select_many([(table, None, cols) for table, cols in queries])
+
+    commands = [f"--columns={','.join(cols)} list {table}" for table, cols in queries]
+    input = f"{VSCTL} --format=json -- " + " -- ".join(commands)
+    output = cmd(input).strip()
+
+    # ovs-vsctl prints one json object per command
+    decoder = json.JSONDecoder()
+    results = []
+    pos = 0
+    while pos < len(output):
+        obj, end = decoder.raw_decode(output, pos)
+        headings = obj.get("headings", [])
+        rows = [
+            {h: to_python(v) for h, v in zip(headings, row)}
+            for row in obj.get("data", [])
+        ]
+        results.append(rows)
+        pos = end
+        while pos < len(output) and output[pos].isspace():
+            pos += 1
+    return results
+
+
 # ----------------------- #
 # ports related functions #
 # ----------------------- #
 
 
+def br_port_rows(db, br: str) -> list[dict]:
+    """
+    return the Port rows of a given OVS bridge, read from OVSDB.
+    the bridge's own internal port is left out, like ovs-vsctl list-ports.
+    """
+    brs, ports = db.select_many(
+        [
+            ("Bridge", [["name", "==", br]], ["ports"]),
+            ("Port", None, ["_uuid", "name", "interfaces"]),
+        ]
+    )
+    if not brs:
+        return []
+    port_ids = set(as_list(brs[0].get("ports")))
+    return [p for p in ports if p["_uuid"] in port_ids and p["name"] != br]
+
+
 def get_ports(br: str) -> list[str]:
     """
     get a list of all ports connected to a given OVS bridge
@@ -20,6 +83,9 @@ def get_ports(br: str) -> list[str]:
     :return: list of ports connected to br
     :rtype: list[str]
     """
+    db = get_ovsdb()
+    if db:
+        return sorted(p["name"] for p in br_port_rows(db, br))
     input = f"sudo ovs-vsctl list-ports {br}"
     output = cmd(input).splitlines()
     return output
@@ -34,6 +100,13 @@ def get_ifaces(br: str):
     :return: list of interfaces connected to br
     :rtype: list[str]
     """
+    db = get_ovsdb()
+    if db:
+        iface_ids = set()
+        for port in br_port_rows(db, br):
+            iface_ids.update(as_list(port.get("interfaces")))
+        ifaces = db.select("Interface", columns=["_uuid", "name"])
+        return sorted(i["name"] for i in ifaces if i["_uuid"] in iface_ids)
     input = f"sudo ovs-vsctl list-ifaces {br}"
     output = cmd(input).splitlines()
     return output
@@ -95,6 +168,10 @@ def get_vxlans() -> list[str]:
     :return: list of vxlan interfaces
     :rtype: list[str]
     """
+    db = get_ovsdb()
+    if db:
+        rows = db.select("Interface", [["type", "==", "vxlan"]], ["name"])
+        return [r["name"] for r in rows]
     input = "sudo ovs-vsctl --format=csv --columns=name --no-headings find interface type=vxlan"
     output = cmd(input).splitlines()
     return output
@@ -110,6 +187,10 @@ def get_vxlan_options(vxlan: str) -> dict[dict]:
     :return: options object
     :rtype: dict
     """
+    db = get_ovsdb()
+    if db:
+        rows = db.select("Interface", [["name", "==", vxlan]], ["options"])
+        return dict(name=vxlan, options=rows[0].get("options"))
     input = f"sudo ovs-vsctl --format=json --pretty --columns=options find interface name={vxlan}"
     # the output here in json format
     output = cmd(input)
@@ -119,6 +200,49 @@ def get_vxlan_options(vxlan: str) -> dict[dict]:
     return options
 
 
+def get_vxlan_data(rows: dict[str, list[dict]] | None = None) -> list[dict]:
+    """
+    return all vxlans in the host with their bridge and options.
+    Bridge, Port and Interface tables are read in one call and joined by uuid.
+
+    :param rows: rows already read by table name (e.g. from get_scan_rows()).
+        the tables are read if None
+    :type rows: dict[str, list[dict]] | None
+    :return: vxlan items (name, bridge, remote_ip, key, dst_port)
+    :rtype: list[dict]
+    """
+    if rows is None:
+        br_rows, port_rows, iface_rows = list_tables(
+            [
+                ("Bridge", ["name", "ports"]),
+                ("Port", ["_uuid", "interfaces"]),
+                ("Interface", ["_uuid", "name", "type", "options"]),
+            ]
+        )
+    else:
+        br_rows, port_rows, iface_rows = rows["Bridge"], rows["Port"], rows["Interface"]
+    vxlan_ifaces = {i["_uuid"]: i for i in iface_rows if i.get("type") == "vxlan"}
+    port_ifaces = {p["_uuid"]: as_list(p.get("interfaces")) for p in port_rows}
+
+    data = []
+    for br in br_rows:
+        for port_id in as_list(br.get("ports")):
+            for iface_id in port_ifaces.get(port_id, []):
+                iface = vxlan_ifaces.get(iface_id)
+                if iface is None:
+                    continue
+                options = iface.get("options") or {}
+                item = dict(
+                    name=iface["name"],
+                    bridge=br["name"],
+                    remote_ip=options.get("remote_ip"),
+                    key=options.get("key"),
+                    dst_port=options.get("dst_port"),
+                )
+                data.append(item)
+    return sorted(data, key=lambda item: (item["bridge"], item["name"]))
+
+
 # --------------------- #
 # QoS related functions #
 # --------------------- #
@@ -162,6 +286,38 @@ def add_queue_of(br: str, in_port: int, queue: str):
     return input
 
 
+def add_queue_flow(
+    br: str, match: str, queue: int | str, priority: int = QUEUE_PRIORITY
+):
+    """
+    send the traffic that matches to a queue, e.g.: match="tcp,tp_dst=5201".
+    the flow overrides lower priority flows (e.g. NORMAL forwarding).
+    """
+    input = [
+        "sudo",
+        "ovs-ofctl",
+        "add-flow",
+        br,
+        f"priority={priority},{match},actions=set_queue:{queue},normal",
+    ]
+    return cmd(input)
+
+
+def del_queue_flow(br: str, match: str, priority: int = QUEUE_PRIORITY):
+    """
+    remove a flow added by add_queue_flow().
+    """
+    input = [
+        "sudo",
+        "ovs-ofctl",
+        "--strict",
+        "del-flows",
+        br,
+        f"priority={priority},{match}",
+    ]
+    return cmd(input)
+
+
 # -------------------------------------------- #
 
 
@@ -172,6 +328,9 @@ def get_all_qos() -> list:
     :return: list of all QoS uuids
     :rtype: list
     """
+    db = get_ovsdb()
+    if db:
+        return [r["_uuid"] for r in db.select("QoS", columns=["_uuid"])]
     input = "sudo ovs-vsctl --column=_uuid --format=csv --no-headings list qos"
     output = cmd(input).splitlines()
     return output
@@ -188,6 +347,14 @@ def get_qos_queues(qos_id: str, raw_output: bool = False) -> str | list[dict]:
     :return: queues attached to the QoS (queue number, queue uuid, max rate)
     :rtype: str | list[dict]
     """
+    db = get_ovsdb()
+    if db and not raw_output:
+        rows = db.select("QoS", [["_uuid", "==", uuid(qos_id)]], ["queues"])
+        queues = rows[0].get("queues")
+        return [
+            dict(number=number, id=queue_id, max_rate=get_queue_rate(queue_id))
+            for number, queue_id in queues.items()
+        ]
     input = f"sudo ovs-vsctl --format=json --columns=queues list QoS {qos_id}"
     output = cmd(input)
     output_list = json.loads(output).get("data")[0][0][1]
@@ -212,6 +379,10 @@ def get_qos_default_rate(qos_id: str) -> int:
     :return: default rate
     :rtype: int
     """
+    db = get_ovsdb()
+    if db:
+        rows = db.select("QoS", [["_uuid", "==", uuid(qos_id)]], ["other_config"])
+        return int(rows[0].get("other_config").get("max-rate"))
     input = f"sudo ovs-vsctl get QoS {qos_id} other_config:max-rate"
     output = cmd(input).strip()
     return int(output.strip('"'))
@@ -226,6 +397,10 @@ def get_qos_ports(qos_id: str) -> list:
     :return: list of OVS ports
     :rtype: list
     """
+    db = get_ovsdb()
+    if db:
+        rows = db.select("Port", [["qos", "includes", uuid(qos_id)]], ["name"])
+        return [r["name"] for r in rows]
     input = f"sudo ovs-vsctl --columns=name --format=csv --no-headings find port qos={qos_id}"
     output = cmd(input).splitlines()
     return output
@@ -241,7 +416,9 @@ def tag_qos(qos_id: str):
     """
     tag = input(f"Add a tag to QoS {qos_id}: ").strip() or ""
     item = {"qos_id": qos_id, "tag": tag}
-    update_json_file(key="qos_id", value=qos_id, new_item=item, path=QOS_TAGS)
+    store = get_store()
+    with store.transaction():
+        store.collection("qos_tags").upsert(item)
 
 
 def get_qos_tag(qos_id: str) -> str:
@@ -253,7 +430,7 @@ def get_qos_tag(qos_id: str) -> str:
     :return: QoS tag
     :rtype: str
     """
-    item = search_json_file(key="qos_id", value=qos_id, path=QOS_TAGS) or {}
+    item = get_store().collection("qos_tags").get(qos_id) or {}
     return item.get("tag") or ""
 
 
@@ -264,8 +441,93 @@ def get_queue_rate(queue_id: str):
     :param queue_id: uuid of the Queue
     :type queue_id: str
     """
+    db = get_ovsdb()
+    if db:
+        rows = db.select("Queue", [["_uuid", "==", uuid(queue_id)]], ["other_config"])
+        return int(rows[0].get("other_config").get("max-rate"))
     input = (
         f"sudo ovs-vsctl --format=csv --bare get queue {queue_id} other_config:max-rate"
     )
     output = cmd(input).strip().strip('"')
     return int(output)
+
+
+def get_qos_data(rows: dict[str, list[dict]] | None = None) -> list[dict]:
+    """
+    return the data of all QoS objects in the host, with their ports and queues.
+    QoS, Queue and Port tables are read in one call and joined by uuid,
+    so the cost doesn't grow with the number of queues.
+
+    :param rows: rows already read by table name (e.g. from get_scan_rows()),
+        and the qos_tags items. they are read if None
+    :type rows: dict[str, list[dict]] | None
+    :return: QoS items (qos_id, tag, default_rate, ports, queues)
+    :rtype: list[dict]
+    """
+    if rows is None:
+        qos_rows, queue_rows, port_rows = list_tables(
+            [
+                ("QoS", ["_uuid", "other_config", "queues"]),
+                ("Queue", ["_uuid", "other_config"]),
+                ("Port", ["name", "qos"]),
+            ]
+        )
+        tag_items = get_store().collection("qos_tags").all()
+    else:
+        qos_rows, queue_rows, port_rows = rows["QoS"], rows["Queue"], rows["Port"]
+        tag_items = rows["qos_tags"]
+    tags = {item.get("qos_id"): item.get("tag") for item in tag_items}
+    queue_rates = {
+        q["_uuid"]: q.get("other_config", {}).get("max-rate") for q in queue_rows
+    }
+    qos_ports = {}
+    for port in port_rows:
+        for qos_id in as_list(port.get("qos")):
+            qos_ports.setdefault(qos_id, []).append(port["name"])
+
+    data = []
+    for qos in qos_rows:
+        qos_id = qos["_uuid"]
+        default_rate = qos.get("other_config", {}).get("max-rate")
+        queues = []
+        for number, queue_id in (qos.get("queues") or {}).items():
+            rate = queue_rates.get(queue_id)
+            queues.append(
+                dict(
+                    number=number,
+                    id=queue_id,
+                    max_rate=int(rate) if rate is not None else None,
+                )
+            )
+        item = dict(
+            qos_id=qos_id,
+            tag=tags.get(qos_id) or "",
+            default_rate=int(default_rate) if default_rate is not None else None,
+            ports=qos_ports.get(qos_id, []),
+            queues=queues,
+        )
+        data.append(item)
+    return data
+
+
+# columns the scan collectors read from each table.
+# changing columns like Interface statistics are left out.
+SCAN_COLUMNS = {
+    "Bridge": ["_uuid", "name", "ports"],
+    "Port": ["_uuid", "name", "interfaces", "qos"],
+    "Interface": ["_uuid", "name", "type", "options"],
+    "QoS": ["_uuid", "other_config", "queues"],
+    "Queue": ["_uuid", "other_config"],
+}
+
+
+def get_scan_rows() -> dict[str, list[dict]]:
+    """
+    return the rows of every table in SCAN_COLUMNS, read in one call,
+    and the qos_tags items (QoS tags are kept in the store, not in OVS).
+    """
+    tables = list(SCAN_COLUMNS)
+    results = list_tables([(t, SCAN_COLUMNS[t]) for t in tables])
+    rows = dict(zip(tables, results))
+    rows["qos_tags"] = get_store().collection("qos_tags").all()
+    return rows
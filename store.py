@@ -0,0 +1,277 @@
+"""
+this module keeps the system data collections (hosts, bridges, containers, ...)
+in memory with an index on each collection's key.
+changes are made inside a transaction and written once, atomically.
+
+two backends are available:
+    JsonStore: one json file per collection in sys_data/ (default)
+    SqliteStore: one sqlite database, for large multi-host inventories
+set SYS_DATA_BACKEND=sqlite to use the sqlite backend.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from utils import read_json_file, save_json_file
+
+SYS_DATA = "sys_data"
+SQLITE_DB = f"{SYS_DATA}/sys_data.db"
+
+# collection name -> key that identifies an item
+COLLECTIONS = {
+    "hosts": "hostname",
+    "bridges": "br_name",
+    "containers": "container",
+    "qos": "qos_id",
+    "vxlans": "vxlan",
+    "qos_tags": "qos_id",
+}
+
+
+class Collection:
+    """
+    items of one collection, indexed by their key.
+    """
+
+    def __init__(self, name: str, key: str, items: list[dict]):
+        self.name = name
+        self.key = key
+        self.items = []
+        self.index = {}
+        self.dirty = False
+        for item in items:
+            self._put(item)
+        # duplicates in the loaded file are merged, so write it back clean
+        self.dirty = len(self.items) != len(items)
+
+    def _put(self, item: dict):
+        value = item[self.key]
+        pos = self.index.get(value)
+        if pos is None:
+            self.index[value] = len(self.items)
+            self.items.append(item)
+        else:
+            self.items[pos] = item
+
+    def get(self, value) -> dict | None:
+        pos = self.index.get(value)
+        return self.items[pos] if pos is not None else None
+
+    def all(self) -> list[dict]:
+        return list(self.items)
+
+    def find(self, field: str, value) -> list[dict]:
+        return [item for item in self.items if item.get(field) == value]
+
+    def upsert(self, item: dict):
+        """
+        add an item, or replace the item with the same key.
+        """
+        if self.get(item[self.key]) != item:
+            self._put(item)
+            self.dirty = True
+
+    def upsert_many(self, items: list[dict]):
+        for item in items:
+            self.upsert(item)
+
+    def add(self, items: list[dict]):
+        """
+        add items whose key is not in the collection yet. others are ignored.
+        """
+        for item in items:
+            if item[self.key] not in self.index:
+                self._put(item)
+                self.dirty = True
+
+    def delete(self, value):
+        if value in self.index:
+            self.items = [item for item in self.items if item[self.key] != value]
+            self.index = {item[self.key]: i for i, item in enumerate(self.items)}
+            self.dirty = True
+
+
+class JsonStore:
+    """
+    collections stored as json files (<directory>/<name>.json).
+    files are loaded on first use and kept in memory.
+    """
+
+    def __init__(self, directory: str = SYS_DATA):
+        self.directory = directory
+        self.collections = {}
+        self._depth = 0
+        # a transaction holds the lock, so threads (e.g. scan collectors)
+        # don't share its depth or see its changes half-made
+        self._lock = threading.RLock()
+
+    def path(self, name: str) -> str:
+        return f"{self.directory}/{name}.json"
+
+    def collection(self, name: str) -> Collection:
+        with self._lock:
+            if name not in self.collections:
+                items = read_json_file(self.path(name))
+                self.collections[name] = Collection(name, COLLECTIONS[name], items)
+            return self.collections[name]
+
+    def reload(self):
+        """
+        drop loaded collections, so the next access reads the files again.
+        """
+        self.collections = {}
+
+    def flush(self):
+        """
+        write changed collections to their files.
+        """
+        for name, coll in self.collections.items():
+            if coll.dirty:
+                save_json_file(data=coll.items, path=self.path(name))
+                coll.dirty = False
+
+    @contextmanager
+    def transaction(self):
+        """
+        group changes and write them once when the outermost block ends.
+        nothing is written if the block raises; loaded data is reset instead.
+        one thread at a time runs a transaction.
+        """
+        with self._lock:
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                if self._depth == 1:
+                    self.reload()
+                raise
+            else:
+                if self._depth == 1:
+                    self.flush()
+            finally:
+                self._depth -= 1
+
+
+class SqliteCollection:
+    """
+    one collection stored in a sqlite table.
+    items are kept as json text, indexed by their key.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, name: str, key: str):
+        self.conn = conn
+        self.name = name
+        self.key = key
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{name}" (key TEXT PRIMARY KEY, data TEXT)'
+        )
+
+    def get(self, value) -> dict | None:
+        row = self.conn.execute(
+            f'SELECT data FROM "{self.name}" WHERE key = ?', (str(value),)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def all(self) -> list[dict]:
+        rows = self.conn.execute(f'SELECT data FROM "{self.name}" ORDER BY rowid')
+        return [json.loads(r[0]) for r in rows]
+
+    def find(self, field: str, value) -> list[dict]:
+        """
+        return items with item[field] == value, filtered by sqlite.
+        """
+        rows = self.conn.execute(
+            f'SELECT data FROM "{self.name}" WHERE json_extract(data, ?) = ?',
+            (f"$.{field}", value),
+        )
+        return [json.loads(r[0]) for r in rows]
+
+    def upsert(self, item: dict):
+        self.conn.execute(
+            f'INSERT INTO "{self.name}" (key, data) VALUES (?, ?) '
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+            (str(item[self.key]), json.dumps(item)),
+        )
+
+    def upsert_many(self, items: list[dict]):
+        for item in items:
+            self.upsert(item)
+
+    def add(self, items: list[dict]):
+        self.conn.executemany(
+            f'INSERT OR IGNORE INTO "{self.name}" (key, data) VALUES (?, ?)',
+            [(str(item[self.key]), json.dumps(item)) for item in items],
+        )
+
+    def delete(self, value):
+        self.conn.execute(f'DELETE FROM "{self.name}" WHERE key = ?', (str(value),))
+
+
+class SqliteStore:
+    """
+    collections stored as tables of one sqlite database.
+    """
+
+    def __init__(self, path: str = SQLITE_DB):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.collections = {}
+        self._depth = 0
+        self._lock = threading.RLock()
+
+    def collection(self, name: str) -> SqliteCollection:
+        if name not in self.collections:
+            self.collections[name] = SqliteCollection(
+                self.conn, name, COLLECTIONS[name]
+            )
+        return self.collections[name]
+
+    def flush(self):
+        self.conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                if self._depth == 1:
+                    self.conn.rollback()
+                raise
+            else:
+                if self._depth == 1:
+                    self.conn.commit()
+            finally:
+                self._depth -= 1
+
+    def import_json(self, directory: str = SYS_DATA):
+        """
+        load json collection files (e.g. copied from other hosts) into the database.
+        """
+        with self.transaction():
+            for name in COLLECTIONS:
+                path = f"{directory}/{name}.json"
+                if os.path.exists(path):
+                    self.collection(name).upsert_many(read_json_file(path))
+
+
+_store = None
+
+
+def get_store() -> JsonStore | SqliteStore:
+    """
+    return the shared store of the selected backend.
+    """
+    global _store
+    if _store is None:
+        if os.environ.get("SYS_DATA_BACKEND") == "sqlite":
+            _store = SqliteStore()
+        else:
+            _store = JsonStore()
+    return _store
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+# the modules live at the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# runs its arguments as a child and passes SIGTERM on, like sudo and
+# `lxc exec` do. a SIGKILL stops only the wrapper and leaves the child running
+WRAPPER = """
+import signal, subprocess, sys
+
+child = subprocess.Popen(sys.argv[1:])
+signal.signal(signal.SIGTERM, lambda *_: child.terminate())
+sys.exit(child.wait())
+"""
+
+
+@pytest.fixture
+def wrapper(tmp_path) -> list[str]:
+    """
+    return the argument list that runs a command through the wrapper.
+    """
+    script = tmp_path / "wrapper.py"
+    script.write_text(WRAPPER)
+    return [sys.executable, str(script)]
@@ -0,0 +1,68 @@
+import subprocess
+
+import pytest
+
+import containers
+from lxd import LXDError
+
+
+class FakeLXD:
+    def __init__(self, error: str = ""):
+        self.error = error
+        self.launched = []
+
+    def launch(self, name, source, config=None, devices=None):
+        if self.error:
+            raise LXDError(self.error)
+        self.launched.append((name, source, config, devices))
+
+
+@pytest.fixture
+def profile(monkeypatch):
+    data = {"config": {"user.comment": "no error here"}, "devices": {}}
+    monkeypatch.setattr(containers, "render_profile", lambda **kwargs: data)
+    return data
+
+
+def test_provision_with_api(profile, monkeypatch):
+    lxd = FakeLXD()
+    monkeypatch.setattr(containers, "get_lxd", lambda: lxd)
+    result = containers.provision_container(7, "br0", 10, golden="fl-golden")
+    assert result["ok"] and result["name"] == "cont-7"
+    name, source, config, _ = lxd.launched[0]
+    assert name == "cont-7"
+    assert source == {"type": "image", "alias": "fl-golden"}
+    assert config == profile["config"]
+
+
+def test_provision_api_failure(profile, monkeypatch):
+    monkeypatch.setattr(containers, "get_lxd", lambda: FakeLXD("image not found"))
+    result = containers.provision_container(7, "br0", 10)
+    assert not result["ok"]
+    assert "image not found" in result["output"]
+
+
+@pytest.mark.parametrize(
+    "returncode, output, ok",
+    [
+        # the word "error" in the output of a successful launch
+        (0, "Creating cont-7\nStarting cont-7\nno error\n", True),
+        # a failed launch without the word "error"
+        (1, "Creating cont-7\nThe instance already exists\n", False),
+    ],
+)
+def test_provision_with_cli(profile, monkeypatch, returncode, output, ok):
+    calls = []
+
+    def run(args, **kwargs):
+        calls.append((args, kwargs["input"]))
+        return subprocess.CompletedProcess(args, returncode, output, "")
+
+    monkeypatch.setattr(containers, "get_lxd", lambda: None)
+    monkeypatch.setattr(containers.subprocess, "run", run)
+    result = containers.provision_container(7, "br0", 10)
+    assert result["ok"] == ok
+    assert result["output"] == output
+    args, stdin = calls[0]
+    assert args == ["sudo", "lxc", "launch", "ubuntu:24.04", "cont-7"]
+    assert "no error here" in stdin
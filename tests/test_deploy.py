@@ -0,0 +1,147 @@
+import shlex
+import subprocess
+
+import pytest
+
+import deploy
+
+
+@pytest.fixture
+def fan_out(monkeypatch):
+    """
+    record how deploy_containers() deploys each container.
+    return the calls and the reports to give back, keyed by container.
+    """
+    calls, reports = {}, {}
+
+    def deploy_container(container, steps, force=False, cache=True, fill=False):
+        calls[container] = dict(cache=cache, fill=fill, steps=steps)
+        report = dict(container=container, ok=True, failed="", ran=[], skipped=[])
+        report.update(seconds=0.0, output="", **reports.get(container, {}))
+        return report
+
+    monkeypatch.setattr(deploy, "prepare_mirror", lambda repo, containers: True)
+    monkeypatch.setattr(deploy, "deploy_container", deploy_container)
+    return calls, reports
+
+
+def pip_installs(steps: list[dict]) -> str:
+    return next(s["command"] for s in steps if s["id"] == "requirements")
+
+
+def test_fill_then_read_only(fan_out, monkeypatch):
+    calls, _ = fan_out
+    monkeypatch.setattr(deploy, "cache_size", lambda: {"wheels": 12, "apt": 40})
+    reports = deploy.deploy_containers(["c1", "c2", "c3"], "repo")
+    assert [r["ok"] for r in reports] == [True, True, True]
+    assert calls["c1"]["fill"] and "pip download" in pip_installs(calls["c1"]["steps"])
+    for c in ("c2", "c3"):
+        assert calls[c]["cache"] and not calls[c]["fill"]
+        assert "--no-index" in pip_installs(calls[c]["steps"])
+
+
+@pytest.mark.parametrize(
+    "fill_report, wheels",
+    [
+        # the fill failed
+        (dict(ok=False, failed="requirements"), 3),
+        # the fill container was already deployed, nothing was downloaded
+        (dict(skipped=["requirements"]), 0),
+    ],
+)
+def test_no_cache_without_fill(fan_out, monkeypatch, fill_report, wheels):
+    calls, reports = fan_out
+    reports["c1"] = fill_report
+    monkeypatch.setattr(deploy, "cache_size", lambda: {"wheels": wheels, "apt": 0})
+    deploy.deploy_containers(["c1", "c2", "c3"], "repo")
+    for c in ("c2", "c3"):
+        assert not calls[c]["cache"]
+        assert "--no-index" not in pip_installs(calls[c]["steps"])
+
+
+# each step appends its id to a log, "b" fails while a "fail" file exists
+STEPS = [
+    dict(id="a", title="A", command="echo a >> log"),
+    dict(id="b", title="B", command="echo b >> log && [ ! -e fail ]"),
+    dict(
+        id="reboot",
+        title="Reboot",
+        command="echo reboot >> log; exit 1",
+        mark_first=True,
+    ),
+]
+
+
+@pytest.fixture
+def containers(tmp_path, monkeypatch):
+    """
+    run the commands of each "container" in its own directory.
+    return the directory of a container.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(deploy, "DEPLOY_STATE_DIR", "state")
+    monkeypatch.setattr(deploy, "prepare_mirror", lambda repo, containers: True)
+    monkeypatch.setattr(deploy, "deploy_steps", lambda repo, cache, fill=False: STEPS)
+
+    def lxc_exec(container, command):
+        cwd = tmp_path / container
+        cwd.mkdir(exist_ok=True)
+        proc = subprocess.run(
+            shlex.split(command), cwd=cwd, capture_output=True, text=True
+        )
+        return deploy.CmdResult(command, proc.stdout, proc.stderr, proc.returncode)
+
+    monkeypatch.setattr(deploy, "lxc_exec", lxc_exec)
+    return lambda container: tmp_path / container
+
+
+def run_step(step: dict, cwd) -> int:
+    return subprocess.run(shlex.split(deploy.step_command(step)), cwd=cwd).returncode
+
+
+def test_marker_after_success(containers):
+    cwd = containers("c1")
+    cwd.mkdir()
+    (cwd / "fail").touch()
+    assert run_step(STEPS[1], cwd) != 0
+    assert not (cwd / "state" / "b").exists()
+    (cwd / "fail").unlink()
+    assert run_step(STEPS[1], cwd) == 0
+    assert (cwd / "state" / "b").exists()
+
+
+def test_marker_first_for_reboot(containers):
+    cwd = containers("c1")
+    cwd.mkdir()
+    # the reboot ends the session, its marker must already be there
+    assert run_step(STEPS[2], cwd) != 0
+    assert (cwd / "state" / "reboot").exists()
+
+
+def test_completed_steps_skipped(containers):
+    report = deploy.deploy_container("c1", STEPS, cache=False)
+    assert report["ok"] and report["ran"] == ["a", "b", "reboot"]
+    report = deploy.deploy_container("c1", STEPS, cache=False)
+    assert report["ok"] and report["ran"] == []
+    assert report["skipped"] == ["a", "b", "reboot"]
+    assert (containers("c1") / "log").read_text().split() == ["a", "b", "reboot"]
+    report = deploy.deploy_container("c1", STEPS, force=True, cache=False)
+    assert report["ran"] == ["a", "b", "reboot"]
+
+
+def test_failed_container_does_not_stop_others(containers):
+    containers("c2").mkdir()
+    (containers("c2") / "fail").touch()
+    reports = deploy.deploy_containers(["c1", "c2", "c3"], "repo", cache=False)
+    assert [(r["container"], r["ok"], r["failed"]) for r in reports] == [
+        ("c1", True, ""),
+        ("c2", False, "b"),
+        ("c3", True, ""),
+    ]
+    assert (containers("c3") / "log").read_text().split() == ["a", "b", "reboot"]
+
+    # a rerun resumes c2 at the failed step, the others are done
+    (containers("c2") / "fail").unlink()
+    reports = deploy.deploy_containers(["c1", "c2", "c3"], "repo", cache=False)
+    assert [r["ran"] for r in reports] == [[], ["b", "reboot"], []]
+    assert reports[1]["skipped"] == ["a"]
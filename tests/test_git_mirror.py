@@ -0,0 +1,46 @@
+import subprocess
+
+import fl_utils
+from git_mirror import print_revisions, with_revision, parse_revision
+
+OLD, NEW = "a" * 40, "b" * 40
+
+
+def report(container: str, commit: str, ok: bool = True) -> dict:
+    return dict(container=container, ok=ok, commit=commit, seconds=1.0, output="")
+
+
+def statuses(output: str) -> dict[str, str]:
+    rows = [line.split() for line in output.splitlines() if line.startswith("c")]
+    return {row[0]: row[1] for row in rows}
+
+
+def test_with_revision():
+    command = with_revision("(exit 3)", dest=".")
+    proc = subprocess.run(["bash", "-c", command], capture_output=True, text=True)
+    assert proc.returncode == 3
+    assert proc.stdout.startswith("HEAD=")
+    assert parse_revision(f"pulling...\nHEAD={NEW}\n") == NEW
+    assert parse_revision("fatal: not a git repository") == ""
+
+
+def test_print_revisions_expected(capsys):
+    reports = [report("c1", OLD), report("c2", OLD), report("c3", NEW)]
+    print_revisions(reports, expected=NEW)
+    assert statuses(capsys.readouterr().out) == {
+        "c1": "DRIFT",
+        "c2": "DRIFT",
+        "c3": "ok",
+    }
+
+
+def test_update_nodes_uses_mirror_head(monkeypatch, capsys):
+    # most containers are stale: the up-to-date one must not be flagged
+    reports = [report("c1", OLD), report("c2", OLD), report("c3", NEW, ok=True)]
+    monkeypatch.setattr(fl_utils, "prepare_mirror", lambda repo, containers: True)
+    monkeypatch.setattr(fl_utils, "git_all", lambda *args: reports)
+    monkeypatch.setattr(fl_utils, "mirror_head", lambda repo: NEW)
+    fl_utils.update_nodes(["c1", "c2", "c3"], "https://example.com/fl_app.git")
+    out = capsys.readouterr().out
+    assert statuses(out)["c3"] == "ok"
+    assert f"Expected commit: {NEW[:10]}" in out
@@ -0,0 +1,262 @@
+import asyncio
+import json
+import os
+import time
+from contextlib import aclosing
+
+import pytest
+
+from measurements import (
+    IperfInterval,
+    IperfResult,
+    iperf,
+    parse_interval,
+    parse_iperf_json,
+    parse_iperf_version,
+    parse_summary,
+    parse_text_line,
+    stream_intervals,
+    text_summary,
+)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name)) as f:
+        return f.read()
+
+
+def test_parse_interval_tcp():
+    data = json.loads(fixture("iperf3_tcp.json"))["intervals"][0]
+    assert parse_interval(data) == IperfInterval(
+        start=0.0,
+        end=1.000172,
+        bytes=117964800,
+        bits_per_second=943554520.8,
+        retransmits=12,
+        snd_cwnd=1378648,
+        rtt_us=1105,
+    )
+
+
+def test_parse_interval_sums_streams():
+    data = {
+        "streams": [
+            {"snd_cwnd": 1000, "rtt": 100},
+            {"snd_cwnd": 3000, "rtt": 300},
+        ],
+        "sum": {"start": 0, "end": 1, "bytes": 10, "bits_per_second": 80.0},
+    }
+    interval = parse_interval(data)
+    assert interval.snd_cwnd == 4000
+    assert interval.rtt_us == 200
+    assert interval.retransmits is None
+
+
+def test_parse_interval_udp():
+    data = json.loads(fixture("iperf3_udp.json"))["intervals"][1]
+    interval = parse_interval(data)
+    assert interval.packets == 8632
+    assert interval.bytes == 12498920
+    assert interval.snd_cwnd is None and interval.rtt_us is None
+
+
+def test_parse_tcp():
+    intervals, summary, error = parse_iperf_json(fixture("iperf3_tcp.json"))
+    assert error == ""
+    assert [i.end for i in intervals] == [1.000172, 2.000091, 3.000113]
+    assert sum(i.retransmits for i in intervals) == summary.retransmits == 15
+    assert summary.protocol == "TCP"
+    assert summary.bytes_sent == 353894400
+    assert summary.bytes_received == 353894400 - 1310720
+    assert summary.bits_per_second_sent == pytest.approx(943.67e6, rel=1e-3)
+    assert summary.cpu_host == 4.613301
+    assert summary.cpu_remote == 12.038822
+    assert summary.jitter_ms is None
+
+
+def test_parse_udp():
+    intervals, summary, error = parse_iperf_json(fixture("iperf3_udp.json"))
+    assert error == ""
+    assert len(intervals) == 2
+    assert summary.protocol == "UDP"
+    assert summary.bytes_sent == 24999288
+    assert summary.bytes_received == 24981912
+    assert summary.jitter_ms == 0.018734
+    assert summary.lost_packets == 12
+    assert summary.lost_percent == 0.069505
+
+
+def test_parse_udp_sum_only():
+    # older iperf3 versions only give "sum" for UDP tests
+    end = json.loads(fixture("iperf3_udp.json"))["end"]
+    summary = parse_summary({"sum": end["sum"]}, "UDP")
+    assert summary.bytes_sent == summary.bytes_received == 24999288
+    assert summary.lost_packets == 12
+
+
+def test_parse_error():
+    intervals, summary, error = parse_iperf_json(fixture("iperf3_refused.json"))
+    assert intervals == [] and summary is None
+    assert "Connection refused" in error
+
+
+def test_parse_dict():
+    data = json.loads(fixture("iperf3_tcp.json"))
+    assert parse_iperf_json(data) == parse_iperf_json(fixture("iperf3_tcp.json"))
+
+
+def test_parse_not_json():
+    output = "iperf3: error - unable to connect to server\n"
+    assert parse_iperf_json(output) == (
+        [],
+        None,
+        "iperf3: error - unable to connect to server",
+    )
+    assert parse_iperf_json("") == ([], None, "no output")
+
+
+def test_iperf_command():
+    assert iperf("server", port=5202, json_output=True, one_off=True) == (
+        "sudo iperf3 -s -1 -p 5202 -J --forceflush"
+    )
+    assert iperf("client", "10.0.200.12", 5202, 5, udp=True, bitrate="100M") == (
+        "sudo iperf3 -c 10.0.200.12 -t 5 -u -b 100M -p 5202 --forceflush"
+    )
+
+
+def test_parse_text_tcp():
+    lines = fixture("iperf3_tcp.txt").splitlines()
+    parsed = [p for p in (parse_text_line(line) for line in lines) if p]
+    kinds = [kind for kind, _ in parsed]
+    assert kinds == ["interval"] * 3 + ["sender", "receiver"]
+    assert parsed[0][1] == dict(
+        start=0.0,
+        end=1.0,
+        bytes=112 * 1024**2,
+        bits_per_second=944e6,
+        retransmits=12,
+        snd_cwnd=int(1.31 * 1024**2),
+        omitted=False,
+    )
+    summary = text_summary(parsed[3][1], parsed[4][1], "TCP")
+    assert summary.retransmits == 15
+    assert summary.bytes_received == 336 * 1024**2
+    assert summary.bits_per_second_received == 940e6
+
+
+def test_parse_text_udp():
+    lines = fixture("iperf3_udp.txt").splitlines()
+    parsed = [p for p in (parse_text_line(line, udp=True) for line in lines) if p]
+    assert [values["packets"] for _, values in parsed] == [8633, 8632, 17265, 17265]
+    summary = text_summary(parsed[2][1], parsed[3][1], "UDP")
+    assert summary.jitter_ms == 0.019
+    assert summary.lost_packets == 12
+    assert summary.lost_percent == 0.07
+    assert summary.bits_per_second_received == 99.9e6
+
+
+def test_parse_text_omitted():
+    line = "[  5]   0.00-1.00   sec   110 MBytes   921 Mbits/sec    0   1.2 MBytes  (omitted)"
+    kind, values = parse_text_line(line)
+    assert kind == "interval" and values["omitted"]
+
+
+def test_parse_iperf_version():
+    assert parse_iperf_version("iperf 3.16 (cJSON 1.7.15)\nLinux ...") == (3, 16)
+    assert parse_iperf_version("bash: iperf3: command not found") is None
+
+
+FAKE_IPERF = f"""
+import json, os, sys, time
+
+# seconds between two intervals
+delay = float(os.environ.get("FAKE_IPERF_DELAY", 0))
+args = sys.argv[2:]
+if args[0] == "sudo":
+    args = args[1:]
+if args[1:] == ["--version"]:
+    print("iperf " + os.environ["FAKE_IPERF_VERSION"] + " (cJSON 1.7.15)")
+elif "-s" in args:
+    print("Server listening on 5201", flush=True)
+    time.sleep(0.2)
+elif "--json-stream" in args and os.environ["FAKE_IPERF_VERSION"] < "3.17":
+    print("iperf3: unrecognized option '--json-stream'")
+    sys.exit(1)
+elif "--json-stream" in args:
+    with open({os.path.join(FIXTURES, "iperf3_tcp.json")!r}) as f:
+        data = json.load(f)
+    print(json.dumps(dict(event="start", data=data["start"])), flush=True)
+    for interval in data["intervals"]:
+        print(json.dumps(dict(event="interval", data=interval)), flush=True)
+        time.sleep(delay)
+    print(json.dumps(dict(event="end", data=data["end"])))
+else:
+    with open({os.path.join(FIXTURES, "iperf3_tcp.txt")!r}) as f:
+        for line in f:
+            print(line, end="", flush=True)
+            if " sec " in line and "sender" not in line and "receiver" not in line:
+                time.sleep(delay)
+"""
+
+
+@pytest.fixture
+def fake_iperf(tmp_path, monkeypatch, wrapper):
+    """
+    run containers' commands with a local iperf3 stand-in, through a
+    wrapper that behaves like `sudo lxc exec`.
+    """
+    import shlex
+    import sys
+    import measurements
+
+    script = tmp_path / "fake_iperf3.py"
+    script.write_text(FAKE_IPERF)
+
+    def lxc_args(container: str, command: str) -> list[str]:
+        return [*wrapper, sys.executable, str(script), container, *shlex.split(command)]
+
+    monkeypatch.setattr(measurements, "lxc_args", lxc_args)
+    monkeypatch.setattr(measurements, "_iperf_versions", {})
+    return monkeypatch
+
+
+async def collect(**kwargs):
+    result = IperfResult("c1", "c2", 5201)
+    intervals = [
+        i
+        async for i in stream_intervals(
+            "c1", "c2", server_ip="10.0.200.12", result=result, **kwargs
+        )
+    ]
+    return intervals, result
+
+
+@pytest.mark.parametrize("version", ["3.17", "3.16"])
+def test_stream_intervals(fake_iperf, version):
+    fake_iperf.setenv("FAKE_IPERF_VERSION", version)
+    intervals, result = asyncio.run(collect())
+    assert [round(i.end) for i in intervals] == [1, 2, 3]
+    assert [i.retransmits for i in intervals] == [12, 0, 3]
+    assert result.error == ""
+    assert result.summary.retransmits == 15
+
+
+async def first_interval() -> IperfInterval:
+    stream = stream_intervals("c1", "c2", server_ip="10.0.200.12")
+    async with aclosing(stream) as intervals:
+        async for i in intervals:
+            return i
+
+
+@pytest.mark.parametrize("version", ["3.17", "3.16"])
+def test_stream_intervals_stop(fake_iperf, version):
+    fake_iperf.setenv("FAKE_IPERF_VERSION", version)
+    # the whole test takes 6s
+    fake_iperf.setenv("FAKE_IPERF_DELAY", "2")
+    start = time.perf_counter()
+    interval = asyncio.run(first_interval())
+    assert round(interval.end) == 1
+    # the client in the "container" is stopped, not only its wrapper
+    assert time.perf_counter() - start < 2
@@ -0,0 +1,133 @@
+import json
+import shlex
+import subprocess
+
+import pytest
+
+import measurements
+from measurements import parse_ping, ping_all_command, split_ping_output
+
+OK = """PING 10.0.200.12 (10.0.200.12) 56(84) bytes of data.
+
+--- 10.0.200.12 ping statistics ---
+10 packets transmitted, 10 received, 0% packet loss, time 1810ms
+rtt min/avg/max/mdev = 0.041/0.062/0.094/0.015 ms
+"""
+# the target doesn't answer, ping stops at its -w deadline
+NO_REPLY = """PING 10.0.200.13 (10.0.200.13) 56(84) bytes of data.
+
+--- 10.0.200.13 ping statistics ---
+14 packets transmitted, 0 received, 100% packet loss, time 2860ms
+"""
+# no route: the neighbour lookup fails
+UNREACHABLE = """PING 10.0.200.14 (10.0.200.14) 56(84) bytes of data.
+From 10.0.200.11 icmp_seq=1 Destination Host Unreachable
+
+--- 10.0.200.14 ping statistics ---
+14 packets transmitted, 0 received, +3 errors, 100% packet loss, time 2870ms
+"""
+NO_NETWORK = "ping: connect: Network is unreachable\n"
+OUTPUTS = {
+    "10.0.200.11": OK.replace(".12", ".11"),
+    "10.0.200.12": OK,
+    "10.0.200.13": NO_REPLY,
+    "10.0.200.14": UNREACHABLE,
+    "10.0.200.15": NO_NETWORK,
+}
+
+
+def test_parse_ping():
+    stats = parse_ping(OK, "c1", "c2")
+    assert (stats.transmitted, stats.received, stats.loss_percent) == (10, 10, 0.0)
+    assert (stats.min_ms, stats.avg_ms, stats.max_ms) == (0.041, 0.062, 0.094)
+    assert stats.ok and stats.error == ""
+
+
+@pytest.mark.parametrize("output", [NO_REPLY, UNREACHABLE])
+def test_parse_ping_total_loss(output):
+    stats = parse_ping(output)
+    assert (stats.transmitted, stats.received, stats.loss_percent) == (14, 0, 100.0)
+    assert stats.avg_ms is None and stats.error == ""
+    assert not stats.ok
+
+
+def test_parse_ping_error():
+    stats = parse_ping(NO_NETWORK)
+    assert stats.error == NO_NETWORK.strip()
+    assert stats.loss_percent == 100.0 and not stats.ok
+    assert parse_ping("").error == "no output"
+
+
+FAKE_PING = f"""#!/usr/bin/env python3
+import sys
+
+args = sys.argv[1:]
+# every ping must have a deadline
+if "-w" not in args:
+    sys.exit(2)
+outputs = {OUTPUTS!r}
+sys.stdout.write(outputs[args[-1]])
+sys.exit(0 if ", 0% packet loss" in outputs[args[-1]] else 1)
+"""
+
+
+@pytest.fixture
+def fake_ping(tmp_path, monkeypatch):
+    """
+    put a ping stand-in first on PATH.
+    """
+    ping = tmp_path / "bin" / "ping"
+    ping.parent.mkdir()
+    ping.write_text(FAKE_PING)
+    ping.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{ping.parent}:{measurements.os.environ['PATH']}")
+
+
+def run_here(command: str) -> str:
+    args = shlex.split(command)
+    return subprocess.run(args, capture_output=True, text=True).stdout
+
+
+def test_split_ping_output(fake_ping):
+    ips = list(OUTPUTS)
+    outputs = split_ping_output(
+        run_here(f"bash -c {shlex.quote(ping_all_command(ips, 10, 0.2))}")
+    )
+    assert outputs == OUTPUTS
+
+
+def test_ping_deadline():
+    command = ping_all_command(["10.0.200.12"], count=10, interval=0.2)
+    assert "-c 10 -i 0.2 -w 4 " in command
+
+
+def test_measure_latency_dead_peer(fake_ping, monkeypatch, tmp_path):
+    """
+    a peer that doesn't answer only empties its own cells.
+    """
+    addresses = {"c1": "10.0.200.11", "c2": "10.0.200.12", "c3": "10.0.200.13"}
+    calls = {}
+
+    def lxc_cmd_all(vm_names, command, limit=16, timeout=None):
+        calls.update(command=command, timeout=timeout)
+        results = {}
+        for vm in vm_names:
+            results[vm] = measurements.CmdResult(
+                command[vm], stdout=run_here(command[vm])
+            )
+        return results
+
+    monkeypatch.setattr(measurements, "container_addresses", lambda: addresses)
+    monkeypatch.setattr(measurements, "lxc_cmd_all", lxc_cmd_all)
+    path = tmp_path / "latency.json"
+    data = measurements.measure_latency(path=str(path))
+
+    assert calls["timeout"] > measurements.ping_deadline(10, 0.2)
+    assert set(calls["command"]) == {"c1", "c2", "c3"}
+    assert data["rtt_avg_ms"] == [
+        [None, 0.062, None],
+        [0.062, None, None],
+        [0.062, 0.062, None],
+    ]
+    assert data["loss_percent"][0] == [None, 0.0, 100.0]
+    assert json.loads(path.read_text())["nodes"] == ["c1", "c2", "c3"]
@@ -0,0 +1,228 @@
+import json
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+import pytest
+
+from lxd import LXDClient, LXDError
+
+OP = "/1.0/operations/op1"
+LOGS = "/1.0/instances/c1/logs"
+
+
+class FakeLXDHandler(BaseHTTPRequestHandler):
+    """
+    LXD daemon stand-in. routes are in FakeLXD.route().
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def handle_one_request(self):
+        super().handle_one_request()
+        if self.server.drop_after_reply:
+            # close a kept-alive connection without telling the client
+            self.server.drop_after_reply = False
+            self.close_connection = True
+
+    def do_any(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        self.server.requests.append((self.command, self.path, body))
+        status, data = self.server.route(self.command, self.path, body)
+        if type(data) != bytes:
+            data = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_any
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeLXD(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str):
+        super().__init__(path, FakeLXDHandler)
+        self.requests = []
+        self.drop_after_reply = False
+        # number of waits answered "Running" before the operation finishes
+        self.running_waits = 1
+        self.delay = 0
+
+    def handle_error(self, request, client_address):
+        # timed out clients close the socket before the reply is written
+        pass
+
+    def route(self, method: str, path: str, body) -> tuple[int, dict | bytes]:
+        url = urlparse(path)
+        if self.delay:
+            time.sleep(self.delay)
+        if method == "GET" and url.path == "/1.0/instances":
+            names = ["/1.0/instances/c2", "/1.0/instances/c1"]
+            return 200, {"type": "sync", "status_code": 200, "metadata": names}
+        if method == "POST" and url.path == "/1.0/instances/c1/exec":
+            return 202, {"type": "async", "operation": OP, "metadata": {}}
+        if method == "GET" and url.path == f"{OP}/wait":
+            if self.running_waits:
+                self.running_waits -= 1
+                return 200, {"type": "sync", "metadata": {"status": "Running"}}
+            output = {"1": f"{LOGS}/exec_out", "2": f"{LOGS}/exec_err"}
+            metadata = {
+                "status": "Success",
+                "metadata": {"return": 3, "output": output},
+            }
+            return 200, {"type": "sync", "metadata": metadata}
+        if url.path == f"{LOGS}/exec_out":
+            return 200, b"hello\n" if method == "GET" else {"type": "sync"}
+        if url.path == f"{LOGS}/exec_err":
+            return 200, b"oops\n" if method == "GET" else {"type": "sync"}
+        if method == "POST" and url.path == "/1.0/instances/broken/exec":
+            return 202, {"type": "async", "operation": "/1.0/operations/op2"}
+        if method == "GET" and url.path == "/1.0/operations/op2/wait":
+            metadata = {"status": "Failure", "err": "instance is not running"}
+            return 200, {"type": "sync", "metadata": metadata}
+        return 404, {"type": "error", "error": "not found", "error_code": 404}
+
+
+@pytest.fixture
+def server(tmp_path):
+    fake = FakeLXD(str(tmp_path / "unix.socket"))
+    thread = threading.Thread(target=fake.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield fake
+    fake.shutdown()
+    fake.server_close()
+
+
+@pytest.fixture
+def client(server, tmp_path):
+    c = LXDClient(str(tmp_path / "unix.socket"), timeout=2)
+    yield c
+    c.close()
+
+
+def test_request(client, server):
+    assert client.instance_names() == ["c1", "c2"]
+    assert server.requests == [("GET", "/1.0/instances?recursion=0", None)]
+
+
+def test_request_error(client):
+    with pytest.raises(LXDError, match="not found"):
+        client.instance("nope")
+
+
+def test_wait_in_steps(client, server):
+    server.running_waits = 2
+    resp = client.request("POST", "/1.0/instances/c1/exec", {"command": ["true"]})
+    metadata = client.wait(resp)
+    assert metadata["status"] == "Success"
+    waits = [path for _, path, _ in server.requests if "/wait" in path]
+    assert waits == [f"{OP}/wait?timeout=20"] * 3
+
+
+def test_wait_timeout(client, server):
+    server.running_waits = 5
+    resp = client.request("POST", "/1.0/instances/c1/exec", {"command": ["true"]})
+    with pytest.raises(LXDError, match="still running after 5s"):
+        client.wait(resp, timeout=5)
+    waits = [path for _, path, _ in server.requests if "/wait" in path]
+    assert waits == [f"{OP}/wait?timeout=5"]
+
+
+def test_wait_failure(client):
+    resp = client.request("POST", "/1.0/instances/broken/exec", {})
+    with pytest.raises(LXDError, match="instance is not running"):
+        client.wait(resp)
+
+
+def test_exec(client, server):
+    code, out, err = client.exec("c1", ["echo", "hello"], env={"A": "1"})
+    assert (code, out, err) == (3, "hello\n", "oops\n")
+    method, path, body = server.requests[0]
+    assert (method, path) == ("POST", "/1.0/instances/c1/exec")
+    assert body["command"] == ["echo", "hello"]
+    assert body["environment"]["A"] == "1"
+    assert body["record-output"] is True
+    # the output logs are removed once read
+    deleted = [path for method, path, _ in server.requests if method == "DELETE"]
+    assert sorted(deleted) == [f"{LOGS}/exec_err", f"{LOGS}/exec_out"]
+
+
+def test_dropped_connection_is_retried(client, server):
+    client.instance_names()
+    server.drop_after_reply = True
+    client.instance_names()
+    assert client.instance_names() == ["c1", "c2"]
+    assert len(server.requests) == 3
+
+
+def test_timeout_raises_lxd_error(server, tmp_path):
+    client = LXDClient(str(tmp_path / "unix.socket"), timeout=0.2)
+    server.delay = 0.5
+    with pytest.raises(LXDError, match="timed out"):
+        client.instance_names()
+    # a timed out request is not sent again
+    time.sleep(0.6)
+    assert len(server.requests) == 1
+    client.close()
+
+
+def test_missing_socket(tmp_path):
+    client = LXDClient(str(tmp_path / "missing.socket"), timeout=1)
+    with pytest.raises(LXDError):
+        client.instance_names()
+
+
+def test_lxc_exec_uses_api(client, monkeypatch):
+    import utils
+
+    monkeypatch.setattr(utils, "get_lxd", lambda: client)
+    result = utils.lxc_exec("c1", "echo 'hello world'")
+    assert (result.returncode, result.stdout, result.stderr) == (3, "hello\n", "oops\n")
+    assert not result.ok
+
+
+def test_lxc_exec_timeout(server, tmp_path, monkeypatch):
+    import utils
+
+    client = LXDClient(str(tmp_path / "unix.socket"), timeout=0.2)
+    monkeypatch.setattr(utils, "get_lxd", lambda: client)
+    server.delay = 0.5
+    result = utils.lxc_exec("c1", "sleep 1")
+    assert result.timed_out
+    assert "timed out" in result.stderr
+    client.close()
+
+
+def test_lxc_cmd_all_uses_api(client, server, monkeypatch):
+    import utils
+
+    monkeypatch.setattr(utils, "get_lxd", lambda: client)
+    results = utils.lxc_cmd_all(["c1"], "bash -c 'git -C fl_app pull'")
+    assert results["c1"].stdout == "hello\n"
+    _, path, body = server.requests[0]
+    assert path == "/1.0/instances/c1/exec"
+    assert body["command"] == ["bash", "-c", "git -C fl_app pull"]
+
+
+def test_lxc_cmd_all_cli(monkeypatch):
+    import utils
+
+    calls = []
+
+    def run_parallel(inputs, limit, timeout):
+        calls.append(inputs)
+        return [utils.CmdResult(command=str(i), returncode=0) for i in inputs]
+
+    monkeypatch.setattr(utils, "get_lxd", lambda: None)
+    monkeypatch.setattr(utils, "run_parallel", run_parallel)
+    results = utils.lxc_cmd_all(["c1", "c2"], "bash -c 'echo a b'")
+    assert sorted(results) == ["c1", "c2"]
+    assert calls[0][1] == ["sudo", "lxc", "exec", "c2", "--", "bash", "-c", "echo a b"]
@@ -0,0 +1,126 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import measure_store
+from measure_store import MeasurementStore, NO_QUEUE
+from measurements import IperfResult, parse_iperf_json, interval_stats
+from measurements import analyze_measurements
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def iperf_result(name: str, client: str, server: str) -> IperfResult:
+    with open(os.path.join(FIXTURES, name)) as f:
+        intervals, summary, error = parse_iperf_json(f.read())
+    return IperfResult(client, server, 5201, intervals, summary, error)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # the store is in its default directory, relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    with MeasurementStore(chunk_rows=4) as s:
+        s.add_result(iperf_result("iperf3_tcp.json", "c1", "c2"), "run1", 1, 100.0)
+        s.add_result(iperf_result("iperf3_udp.json", "c2", "c1"), "run1", 2, 100.0)
+        s.add_result(iperf_result("iperf3_tcp.json", "c1", "c2"), "run2", 1, 200.0)
+    return s
+
+
+def test_missing_columns_get_defaults(tmp_path):
+    s = MeasurementStore(str(tmp_path / "store"))
+    s.add_row(dict(run_id="r", client="c1", server="c2", start=0.0, end=1.0))
+    s.flush()
+    row = s.load().iloc[0]
+    assert row["queue"] == NO_QUEUE
+    assert row["bytes"] == 0
+    assert np.isnan(row["bits_per_second"])
+    assert row["omitted"] == False
+    assert row["pair"] == "c1->c2"
+
+
+def test_round_trip(store):
+    df = store.load()
+    assert len(df) == 3 + 2 + 3
+    # the buffer is written in chunks of chunk_rows
+    assert [chunk["rows"] for chunk in store.index()] == [4, 4]
+    assert store.runs() == ["run1", "run2"]
+    tcp = df[(df["run_id"] == "run1") & (df["queue"] == 1)]
+    assert tcp["bytes"].tolist() == [117964800, 118489088, 117440512]
+    assert tcp["retransmits"].tolist() == [12, 0, 3]
+    udp = df[df["queue"] == 2]
+    assert udp["pair"].unique().tolist() == ["c2->c1"]
+    assert udp["packets"].tolist() == [8633, 8632]
+    assert udp["snd_cwnd"].isna().all()
+    assert len(store.load(["run2"])) == 3
+
+
+def test_round_trip_stats(store):
+    stats = interval_stats(store.load(), ["pair", "queue"]).set_index("pair")
+    tcp = stats.loc["c1->c2"]
+    assert tcp["tests"] == 2
+    assert tcp["intervals"] == 6
+    assert tcp["retransmits"] == 30
+    assert tcp["p50_bps"] == pytest.approx(943554520.8)
+    assert stats.loc["c2->c1", "packets"] == 8633 + 8632
+
+
+def test_analyze(store, tmp_path):
+    path = str(tmp_path / "analysis.json")
+    data = analyze_measurements(["run1"], path=path)
+    assert data["runs"] == ["run1"]
+    assert {(r["pair"], r["queue"]) for r in data["pair"]} == {
+        ("c1->c2", 1),
+        ("c2->c1", 2),
+    }
+    with open(path) as f:
+        assert json.load(f)["runs"] == ["run1"]
+
+
+def test_compact(store):
+    before = store.load()
+    old_files = {chunk["file"] for chunk in store.index()}
+    store.chunk_rows = 100
+    store.compact()
+    index = store.index()
+    assert len(index) == 1
+    # new file names, old files removed
+    assert index[0]["file"] not in old_files
+    assert sorted(os.listdir(store.directory)) == [index[0]["file"], "index.json"]
+    assert store.load().equals(before)
+
+
+def test_compact_crash_keeps_old_data(store, monkeypatch):
+    before = store.load()
+    index = store.index()
+
+    def crash(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(measure_store, "save_json_file", crash)
+    store.chunk_rows = 100
+    with pytest.raises(OSError):
+        store.compact()
+    assert store.index() == index
+    assert store.load().equals(before)
+
+
+def test_import_csv(tmp_path):
+    path = tmp_path / "old.csv"
+    path.write_text(
+        "start_time,end_time,transfer_amount,transfer_unit,bitrate_value,"
+        "bitrate_unit,retransmits,congestion_window_value,"
+        "congestion_window_unit,omitted\n"
+        "0.00,1.00,112,MBytes,941,Mbits/sec,3,1.31,MBytes,False\n"
+    )
+    s = MeasurementStore(str(tmp_path / "store"))
+    s.import_csv(str(path), client="c1", server="c2")
+    s.flush()
+    row = s.load().iloc[0]
+    assert row["run_id"] == "old"
+    assert row["bytes"] == 112 * 1024**2
+    assert row["bits_per_second"] == 941e6
+    assert row["snd_cwnd"] == int(1.31 * 1024**2)
+    assert row["queue"] == NO_QUEUE
@@ -0,0 +1,37 @@
+from itertools import permutations
+
+import pytest
+
+from measurements import round_robin, bandwidth_matrix, IperfResult, IperfSummary
+
+
+@pytest.mark.parametrize("n", [2, 3, 4, 5, 8])
+def test_round_robin(n):
+    nodes = [f"c{i}" for i in range(n)]
+    rounds = round_robin(nodes)
+    # N-1 rounds of disjoint pairs (N if odd), once per direction
+    assert len(rounds) == 2 * (n - 1 + n % 2)
+    pairs = [pair for pairs in rounds for pair in pairs]
+    # every ordered pair once
+    assert sorted(pairs) == sorted(permutations(nodes, 2))
+    for pairs in rounds:
+        # no container is in two tests of a round, so a test never runs
+        # with its reverse flow
+        used = [node for pair in pairs for node in pair]
+        assert len(used) == len(set(used))
+        assert len(pairs) == n // 2
+
+
+def test_round_robin_small():
+    assert round_robin([]) == []
+    assert round_robin(["c0"]) == []
+    assert round_robin(["c0", "c1"]) == [[("c0", "c1")], [("c1", "c0")]]
+
+
+def test_bandwidth_matrix():
+    summary = IperfSummary("TCP", 10, 0, 0, 0.0, 9e8)
+    results = [
+        IperfResult("c0", "c1", 5201, summary=summary),
+        IperfResult("c1", "c0", 5201, error="refused"),
+    ]
+    assert bandwidth_matrix(["c0", "c1"], results) == [[None, 9e8], [None, None]]
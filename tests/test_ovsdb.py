@@ -0,0 +1,176 @@
+import json
+import socket
+import threading
+
+import pytest
+
+from ovsdb import OVSDBClient, OVSDBError, to_python, as_list
+
+BRIDGE_ROW = {
+    "_uuid": ["uuid", "1a2b"],
+    "name": "br0",
+    "ports": ["set", [["uuid", "p1"], ["uuid", "p2"]]],
+    "external_ids": ["map", [["owner", "fl"]]],
+    "mirrors": ["set", []],
+}
+
+
+class FakeOVSDB:
+    """
+    ovsdb-server stand-in on a unix socket.
+    replies to transact with the rows of `tables` and records the requests.
+    sends an echo request and a notification before each reply, and splits
+    the reply in two writes, like a real server may.
+    """
+
+    def __init__(self, path: str, tables: dict):
+        self.tables = tables
+        self.requests = []
+        self.echo_replies = []
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(1)
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        conn, _ = self.server.accept()
+        decoder = json.JSONDecoder()
+        buffer = ""
+        with conn:
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    return
+                buffer += chunk.decode()
+                while buffer.strip():
+                    try:
+                        msg, end = decoder.raw_decode(buffer.lstrip())
+                    except json.JSONDecodeError:
+                        break
+                    buffer = buffer.lstrip()[end:]
+                    if msg.get("id") == "echo":
+                        self.echo_replies.append(msg)
+                        continue
+                    self.requests.append(msg)
+                    self.reply(conn, msg)
+
+    def reply(self, conn, msg: dict):
+        conn.sendall(
+            json.dumps({"method": "echo", "params": [], "id": "echo"}).encode()
+        )
+        conn.sendall(
+            json.dumps({"method": "update", "params": [], "id": None}).encode()
+        )
+        if msg["method"] == "transact":
+            result = []
+            for op in msg["params"][1:]:
+                if op["table"] not in self.tables:
+                    result.append({"error": "unknown table", "details": op["table"]})
+                    continue
+                rows = self.tables[op["table"]]
+                if "columns" in op:
+                    rows = [{c: r[c] for c in op["columns"]} for r in rows]
+                result.append({"rows": rows})
+            data = json.dumps({"id": msg["id"], "result": result, "error": None})
+        else:
+            data = json.dumps({"id": msg["id"], "result": None, "error": "unknown"})
+        half = len(data) // 2
+        conn.sendall(data[:half].encode())
+        conn.sendall(data[half:].encode())
+
+    def close(self):
+        self.server.close()
+
+
+@pytest.fixture
+def server(tmp_path):
+    fake = FakeOVSDB(str(tmp_path / "db.sock"), {"Bridge": [BRIDGE_ROW]})
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def client(server, tmp_path):
+    with OVSDBClient(str(tmp_path / "db.sock"), timeout=2) as c:
+        yield c
+
+
+def test_to_python():
+    assert to_python(["uuid", "abc"]) == "abc"
+    assert to_python(["set", [["uuid", "a"], ["uuid", "b"]]]) == ["a", "b"]
+    assert to_python(["map", [["k", ["uuid", "v"]]]]) == {"k": "v"}
+    assert to_python(["set", []]) == []
+    assert to_python("br0") == "br0"
+    assert to_python(5) == 5
+
+
+def test_as_list():
+    assert as_list(None) == []
+    assert as_list("a") == ["a"]
+    assert as_list(["a", "b"]) == ["a", "b"]
+
+
+def test_select(client, server):
+    rows = client.select("Bridge", [["name", "==", "br0"]])
+    assert rows == [
+        {
+            "_uuid": "1a2b",
+            "name": "br0",
+            "ports": ["p1", "p2"],
+            "external_ids": {"owner": "fl"},
+            "mirrors": [],
+        }
+    ]
+    method, params = server.requests[0]["method"], server.requests[0]["params"]
+    assert method == "transact"
+    assert params == [
+        "Open_vSwitch",
+        {"op": "select", "table": "Bridge", "where": [["name", "==", "br0"]]},
+    ]
+    # the echo request of the server was answered
+    assert server.echo_replies == [{"result": [], "error": None, "id": "echo"}]
+
+
+def test_select_columns(client, server):
+    assert client.select("Bridge", columns=["name"]) == [{"name": "br0"}]
+    assert server.requests[0]["params"][1]["columns"] == ["name"]
+
+
+def test_select_many_is_one_transaction(client, server):
+    names, ports = client.select_many(
+        [("Bridge", None, ["name"]), ("Bridge", None, ["ports"])]
+    )
+    assert names == [{"name": "br0"}]
+    assert ports == [{"ports": ["p1", "p2"]}]
+    assert len(server.requests) == 1
+
+
+def test_request_ids_increase(client, server):
+    client.select("Bridge")
+    client.select("Bridge")
+    assert [r["id"] for r in server.requests] == [1, 2]
+
+
+def test_operation_error(client):
+    with pytest.raises(OVSDBError, match="unknown table"):
+        client.select("Nope")
+
+
+def test_closed_connection(tmp_path):
+    path = str(tmp_path / "db.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+
+    def close_on_accept():
+        conn, _ = server.accept()
+        conn.recv(65536)
+        conn.close()
+
+    threading.Thread(target=close_on_accept, daemon=True).start()
+    client = OVSDBClient(path, timeout=2).connect()
+    with pytest.raises(OVSDBError, match="connection closed"):
+        client.list_dbs()
+    assert client.sock is None
+    server.close()
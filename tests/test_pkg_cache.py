@@ -0,0 +1,151 @@
+import os
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+import pkg_cache
+from pkg_cache import apt_cached, attach_pkg_cache, cache_size, pip_cached_install
+
+WHEEL = "demo_pkg-1.0-py3-none-any.whl"
+
+
+def build_wheel(path: str):
+    dist_info = "demo_pkg-1.0.dist-info"
+    files = {
+        "demo_pkg/__init__.py": "VALUE = 42\n",
+        f"{dist_info}/METADATA": "Metadata-Version: 2.1\nName: demo-pkg\nVersion: 1.0\n",
+        f"{dist_info}/WHEEL": "Wheel-Version: 1.0\nRoot-Is-Purelib: true\nTag: py3-none-any\n",
+    }
+    record = "".join(f"{name},,\n" for name in files) + f"{dist_info}/RECORD,,\n"
+    with zipfile.ZipFile(path, "w") as whl:
+        for name, data in {**files, f"{dist_info}/RECORD": record}.items():
+            whl.writestr(name, data)
+
+
+@pytest.fixture
+def index(tmp_path) -> str:
+    """
+    return the url of a local package index with one package, demo-pkg.
+    """
+    project = tmp_path / "index" / "demo-pkg"
+    project.mkdir(parents=True)
+    build_wheel(str(project / WHEEL))
+    (project / "index.html").write_text(f'<a href="{WHEEL}">{WHEEL}</a>\n')
+    return (tmp_path / "index").as_uri()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch) -> str:
+    """
+    return a host cache directory, used as the container's mount point.
+    """
+    path = pkg_cache.init_pkg_cache(str(tmp_path / "pkg_cache"))
+    monkeypatch.setattr(pkg_cache, "WHEELHOUSE", f"{path}/wheels")
+    monkeypatch.setattr(pkg_cache, "APT_CACHE", f"{path}/apt")
+    monkeypatch.setattr(pkg_cache, "APT_ARCHIVES", str(tmp_path / "archives"))
+    os.makedirs(tmp_path / "archives")
+    return path
+
+
+def run(command: str, tmp_path, target: str = "site") -> subprocess.CompletedProcess:
+    """
+    run a cache command with bash, pip installs into tmp_path/target.
+    """
+    env = dict(
+        os.environ,
+        PIP_TARGET=str(tmp_path / target),
+        PIP_DISABLE_PIP_VERSION_CHECK="1",
+        PIP_NO_CACHE_DIR="1",
+        PATH=f"{os.path.dirname(sys.executable)}:{os.environ['PATH']}",
+    )
+    return subprocess.run(
+        ["bash", "-c", command], env=env, capture_output=True, text=True
+    )
+
+
+def test_pip_fill_then_offline_install(index, cache, tmp_path):
+    proc = run(pip_cached_install("demo-pkg", index, fill=True), tmp_path)
+    assert proc.returncode == 0, proc.stderr
+    assert os.listdir(f"{cache}/wheels") == [WHEEL]
+    assert (tmp_path / "site" / "demo_pkg" / "__init__.py").exists()
+    assert cache_size(cache) == {"wheels": 1, "apt": 0}
+
+    # the other containers don't get the index
+    command = pip_cached_install("demo-pkg")
+    assert "download" not in command and index not in command
+    proc = run(command, tmp_path, target="site2")
+    assert proc.returncode == 0, proc.stderr
+    assert (tmp_path / "site2" / "demo_pkg" / "__init__.py").exists()
+
+
+def test_pip_install_from_empty_cache_fails(cache, tmp_path):
+    assert cache_size(cache)["wheels"] == 0
+    assert run(pip_cached_install("demo-pkg"), tmp_path).returncode != 0
+
+
+def fake_apt(archives: str, package: str) -> str:
+    """
+    return a command that "downloads" a package unless it is in archives.
+    """
+    deb = f"{archives}/{package}.deb"
+    return f"{{ [ -e {deb} ] && echo cached || touch {deb}; }}"
+
+
+def test_apt_fill_and_reuse(cache, tmp_path):
+    archives = pkg_cache.APT_ARCHIVES
+    proc = run(apt_cached(fake_apt(archives, "git"), fill=True), tmp_path)
+    assert proc.returncode == 0
+    assert os.listdir(f"{cache}/apt") == ["git.deb"]
+
+    # another container starts with empty archives and reuses the cached file
+    os.remove(f"{archives}/git.deb")
+    proc = run(apt_cached(fake_apt(archives, "git")), tmp_path)
+    assert proc.stdout == "cached\n"
+    assert os.path.islink(f"{archives}/git.deb")
+
+
+def test_apt_failure_is_not_hidden(cache, tmp_path):
+    assert run(apt_cached("false", fill=True), tmp_path).returncode != 0
+    assert run(apt_cached("false"), tmp_path).returncode != 0
+
+
+class FakeLXD:
+    def __init__(self):
+        self.devices = {}
+
+    def add_device(self, name, device, options):
+        self.devices[(name, device)] = options
+
+
+@pytest.mark.parametrize("readonly", [True, False])
+def test_attach_pkg_cache(tmp_path, monkeypatch, readonly):
+    lxd = FakeLXD()
+    monkeypatch.setattr(pkg_cache, "get_lxd", lambda: lxd)
+    path = str(tmp_path / "cache")
+    assert attach_pkg_cache("c1", path, readonly=readonly) == ""
+    options = lxd.devices[("c1", pkg_cache.PKG_CACHE_DEVICE)]
+    assert options["source"] == path
+    assert options["path"] == pkg_cache.PKG_CACHE_MOUNT
+    assert options["readonly"] == str(readonly).lower()
+    assert sorted(os.listdir(path)) == ["apt", "wheels"]
+
+
+def test_attach_pkg_cache_cli(tmp_path, monkeypatch):
+    commands = []
+    monkeypatch.setattr(pkg_cache, "get_lxd", lambda: None)
+    monkeypatch.setattr(pkg_cache, "cmd", lambda input: commands.append(input) or "")
+    attach_pkg_cache("c1", str(tmp_path / "cache"))
+    assert commands[0].startswith("sudo lxc config device remove c1")
+    assert commands[1][:8] == [
+        "sudo",
+        "lxc",
+        "config",
+        "device",
+        "add",
+        "c1",
+        pkg_cache.PKG_CACHE_DEVICE,
+        "disk",
+    ]
+    assert "readonly=true" in commands[1]
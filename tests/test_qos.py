@@ -0,0 +1,237 @@
+import json
+
+import pytest
+
+import measure_store
+import measurements
+import ports
+from measurements import IperfResult, IperfSummary, qos_status, qos_test_plan
+
+MBIT = 1_000_000
+
+
+def qos(qos_id: str, ports: list[str], rates: dict[str, int]) -> dict:
+    """
+    return a qos.json item with a queue of each max-rate, keyed by number.
+    """
+    queues = [
+        {"number": number, "queue_id": f"{qos_id}-{number}", "max_rate": rate}
+        for number, rate in rates.items()
+    ]
+    return {"qos_id": qos_id, "ports": ports, "queues": queues}
+
+
+def container(name: str, bridge: str, ovs_port: str = "") -> dict:
+    return {"container": name, "bridge": bridge, "ovs_port": ovs_port}
+
+
+CONTAINERS = [
+    container("c1", "br0", "veth1"),
+    container("c2", "br0", "veth2"),
+    container("c3", "br0"),
+    container("c4", "br1", "veth4"),
+]
+
+
+def planned(rounds: list[list[dict]]) -> list[list[tuple]]:
+    return [[(t["ovs_port"], t["queue"], t["client"]) for t in r] for r in rounds]
+
+
+def test_plan_from_queue_rates():
+    items = [
+        # queue 0 has no max-rate, it is not tested
+        qos("q1", ["veth1"], {"2": 20 * MBIT, "1": 10 * MBIT, "0": 0}),
+        qos("q2", ["veth2"], {"1": 30 * MBIT}),
+    ]
+    rounds, skipped = qos_test_plan(items, CONTAINERS)
+    assert skipped == []
+    # the queues of a port are tested one per round, in queue order
+    # c1 and c2 serve the queues of their port, so c3 is the only client
+    # of the first rounds
+    assert planned(rounds) == [
+        [("veth1", 1, "c3")],
+        [("veth1", 2, "c3")],
+        [("veth2", 1, "c1")],
+    ]
+    first = rounds[0][0]
+    assert first["max_rate"] == 10 * MBIT
+    assert (first["qos_id"], first["server"], first["bridge"]) == ("q1", "c1", "br0")
+    assert "clients" not in first
+
+
+def test_plan_containers_not_shared():
+    conts = CONTAINERS + [container("c5", "br0"), container("c6", "br0")]
+    items = [qos("q1", ["veth1", "veth2"], {"1": 10 * MBIT, "2": 20 * MBIT})]
+    rounds, _ = qos_test_plan(items, conts)
+    assert len(rounds) == 2
+    for tests in rounds:
+        used = [c for t in tests for c in (t["client"], t["server"])]
+        assert len(used) == len(set(used))
+        assert {t["ovs_port"] for t in tests} == {"veth1", "veth2"}
+
+
+def test_plan_skipped_ports():
+    items = [qos("q1", ["veth4", "veth9"], {"1": 10 * MBIT})]
+    rounds, skipped = qos_test_plan(items, CONTAINERS)
+    assert rounds == []
+    assert skipped == [
+        "veth4: no other container on br1",
+        "veth9: no container behind the port",
+    ]
+
+
+@pytest.mark.parametrize(
+    "achieved, status",
+    [
+        (100 * MBIT, "ok"),
+        (104.9 * MBIT, "ok"),
+        (95.1 * MBIT, "ok"),
+        (106 * MBIT, "OVER"),
+        (90 * MBIT, "UNDER"),
+    ],
+)
+def test_qos_status(achieved, status):
+    assert qos_status(achieved, 100 * MBIT, 0.05) == status
+
+
+def test_queue_flow_commands(monkeypatch):
+    commands = []
+    monkeypatch.setattr(ports, "cmd", lambda input: commands.append(input) or "")
+    match = "tcp,nw_dst=10.0.200.11,tp_dst=5201"
+    ports.add_queue_flow("br0", match, 2)
+    ports.del_queue_flow("br0", match)
+    assert commands == [
+        [
+            "sudo",
+            "ovs-ofctl",
+            "add-flow",
+            "br0",
+            f"priority={ports.QUEUE_PRIORITY},{match},actions=set_queue:2,normal",
+        ],
+        [
+            "sudo",
+            "ovs-ofctl",
+            "--strict",
+            "del-flows",
+            "br0",
+            f"priority={ports.QUEUE_PRIORITY},{match}",
+        ],
+    ]
+
+
+class FakeCollection:
+    def __init__(self, items: list[dict]):
+        self.items = items
+
+    def all(self) -> list[dict]:
+        return self.items
+
+
+class FakeStore:
+    def __init__(self, **collections):
+        self.collections = collections
+
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self.collections[name])
+
+
+class FakeMeasurementStore:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def add_result(self, *args):
+        pass
+
+
+@pytest.fixture
+def benchmark(monkeypatch):
+    """
+    run the benchmark on two ports of br0, with fake tests and flows.
+    return the flow commands and the bitrate measured for each server.
+    """
+    items = [
+        qos("q1", ["veth1"], {"1": 10 * MBIT}),
+        qos("q2", ["veth2"], {"1": 100 * MBIT}),
+    ]
+    # with c5, both ports are tested in one round
+    conts = CONTAINERS + [container("c5", "br0")]
+    fake_store = FakeStore(qos=items, containers=conts)
+    flows = []
+    rates = {}
+
+    async def measure(client, server, port, duration, server_ip=""):
+        result = IperfResult(client, server, port)
+        if rates[server] is None:
+            result.error = "unable to connect to server"
+        elif isinstance(rates[server], Exception):
+            raise rates[server]
+        else:
+            result.summary = IperfSummary("TCP", duration, 0, 0, 0, rates[server])
+        return result
+
+    monkeypatch.setattr(measurements, "get_store", lambda: fake_store)
+    monkeypatch.setattr(
+        measurements,
+        "container_addresses",
+        lambda: {"c1": "10.0.200.11", "c2": "10.0.200.12"},
+    )
+    monkeypatch.setattr(measurements, "measure", measure)
+    monkeypatch.setattr(
+        measurements,
+        "add_queue_flow",
+        lambda br, match, queue: flows.append(("add", br, match, queue)),
+    )
+    monkeypatch.setattr(
+        measurements,
+        "del_queue_flow",
+        lambda br, match: flows.append(("del", br, match)),
+    )
+    monkeypatch.setattr(measure_store, "MeasurementStore", FakeMeasurementStore)
+    return flows, rates
+
+
+def test_benchmark_report(benchmark, tmp_path):
+    flows, rates = benchmark
+    rates.update(c1=10.2 * MBIT, c2=None)
+    path = tmp_path / "qos.json"
+    reports = measurements.run_qos_benchmark(duration=1, path=str(path))
+    by_port = {r["ovs_port"]: r for r in reports}
+    assert by_port["veth1"]["status"] == "ok"
+    assert by_port["veth1"]["deviation"] == pytest.approx(0.02)
+    assert by_port["veth2"]["status"] == "FAILED"
+    assert by_port["veth2"]["error"] == "unable to connect to server"
+    assert json.loads(path.read_text())["queues"] == reports
+    # every flow added is removed
+    added = {f[2] for f in flows if f[0] == "add"}
+    assert added == {f[2] for f in flows if f[0] == "del"} and len(added) == 2
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        # the test fails
+        dict(c2=OSError("lost the LXD socket")),
+        # the second flow of the round is never added
+        dict(address=LookupError("no address for c2")),
+    ],
+)
+def test_benchmark_removes_flows_on_error(benchmark, monkeypatch, tmp_path, error):
+    flows, rates = benchmark
+    rates.update(c1=10 * MBIT, c2=error.get("c2", 100 * MBIT))
+    if "address" in error:
+
+        def server_address(container):
+            raise error["address"]
+
+        monkeypatch.setattr(
+            measurements, "container_addresses", lambda: {"c1": "10.0.200.11"}
+        )
+        monkeypatch.setattr(measurements, "server_address", server_address)
+    with pytest.raises(Exception) as raised:
+        measurements.run_qos_benchmark(duration=1, path=str(tmp_path / "qos.json"))
+    assert raised.value in error.values()
+    added = [f[2] for f in flows if f[0] == "add"]
+    assert added and added == [f[2] for f in flows if f[0] == "del"]
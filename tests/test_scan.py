@@ -0,0 +1,117 @@
+import pytest
+
+import app
+import ports
+import store
+
+ROWS = {
+    "Bridge": [{"_uuid": "b1", "name": "br0", "ports": ["p1", "p2"]}],
+    "Port": [
+        {"_uuid": "p1", "name": "vx0", "interfaces": ["i1"], "qos": []},
+        {"_uuid": "p2", "name": "cont-1", "interfaces": ["i2"], "qos": "q1"},
+    ],
+    "Interface": [
+        {
+            "_uuid": "i1",
+            "name": "vx0",
+            "type": "vxlan",
+            "options": {"remote_ip": "10.0.0.2", "key": "5", "dst_port": "4789"},
+        },
+        {"_uuid": "i2", "name": "cont-1", "type": "", "options": {}},
+    ],
+    "QoS": [
+        {
+            "_uuid": "q1",
+            "other_config": {"max-rate": "1000000000"},
+            "queues": {"1": "u1"},
+        }
+    ],
+    "Queue": [{"_uuid": "u1", "other_config": {"max-rate": "100000000"}}],
+    "qos_tags": [],
+}
+
+
+@pytest.fixture
+def scan(tmp_path, monkeypatch):
+    """
+    run incremental scans on fixed OVS rows, in an empty sys_data/.
+    OVS must not be read again by the collectors.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(store, "_store", None)
+    rows = {table: list(r) for table, r in ROWS.items()}
+    facts = {"hostname": "host1", "ipv4s": ["10.0.0.1"]}
+    monkeypatch.setattr(app, "get_scan_rows", lambda: rows)
+    monkeypatch.setattr(app, "get_host_facts", lambda: facts)
+    monkeypatch.setattr(app, "get_ifaces", lambda: [])
+    monkeypatch.setattr(app, "get_instances", lambda state: [])
+    monkeypatch.setattr(app, "invalidate_host_facts", lambda: None)
+    monkeypatch.setattr(app, "save_host_facts", lambda: None)
+
+    def read_ovs(*args):
+        raise AssertionError("OVS read again")
+
+    monkeypatch.setattr(ports, "list_tables", read_ovs)
+    monkeypatch.setattr(app, "get_ovs_brs", read_ovs)
+    return rows
+
+
+def updated(capsys) -> str:
+    return capsys.readouterr().out.split("Updated: ")[1].splitlines()[0]
+
+
+def test_incremental_scan(scan, capsys):
+    app.save_sys_data_incremental()
+    assert updated(capsys) == "bridges, hosts, qos, vxlans"
+    qos = store.get_store().collection("qos").get("q1")
+    assert qos["ports"] == ["cont-1"]
+    assert qos["queues"] == [dict(number="1", id="u1", max_rate=100000000)]
+    vxlan = store.get_store().collection("vxlans").get("vx0")
+    assert (vxlan["bridge"], vxlan["key"], vxlan["dst_port"]) == ("br0", "5", "4789")
+
+    app.save_sys_data_incremental()
+    assert updated(capsys) == "nothing, no changes"
+
+
+def test_incremental_scan_tag_change(scan, capsys):
+    app.save_sys_data_incremental()
+    capsys.readouterr()
+    scan["qos_tags"] = [{"qos_id": "q1", "tag": "gold"}]
+    app.save_sys_data_incremental()
+    assert updated(capsys) == "qos"
+    assert store.get_store().collection("qos").get("q1")["tag"] == "gold"
+
+
+def link(name: str, mtu: int = 1500, state: str = "UP", vlan: int | None = None):
+    data = {"ifname": name, "mtu": mtu, "operstate": state, "addr_info": []}
+    if vlan is not None:
+        data["linkinfo"] = {"info_kind": "vlan", "info_data": {"id": vlan}}
+    if name == "eth0":
+        data["addr_info"] = [{"family": "inet", "local": "10.0.0.1"}]
+    return data
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda links: links[0].update(mtu=9000),
+        lambda links: links[1].update(operstate="DOWN"),
+        lambda links: links[1]["linkinfo"]["info_data"].update(id=20),
+        lambda links: links.append(link("eth2")),
+        lambda links: links.pop(1),
+    ],
+)
+def test_incremental_scan_link_change(scan, monkeypatch, capsys, change):
+    links = [link("eth0"), link("eth0.10", vlan=10)]
+    monkeypatch.setattr(app, "get_ifaces", lambda: links)
+    app.save_sys_data_incremental()
+    capsys.readouterr()
+    # counters and address lifetimes don't count as changes
+    links[0]["stats64"] = {"rx": {"bytes": 1}}
+    app.save_sys_data_incremental()
+    assert updated(capsys) == "nothing, no changes"
+    change(links)
+    app.save_sys_data_incremental()
+    assert "hosts" in updated(capsys).split(", ")
+    host = store.get_store().collection("hosts").get("host1")
+    assert host["ifaces"][0]["mtu"] == links[0]["mtu"]
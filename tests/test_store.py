@@ -0,0 +1,54 @@
+import threading
+import time
+
+import pytest
+
+from store import JsonStore, SqliteStore
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "json":
+        return JsonStore(str(tmp_path))
+    return SqliteStore(str(tmp_path / "sys_data.db"))
+
+
+def test_transaction_writes_once(tmp_path):
+    store = JsonStore(str(tmp_path))
+    with store.transaction():
+        store.collection("bridges").upsert({"br_name": "br0"})
+        with store.transaction():
+            store.collection("bridges").upsert({"br_name": "br1"})
+        assert (tmp_path / "bridges.json").read_text().strip() == "[]"
+    assert JsonStore(str(tmp_path)).collection("bridges").all() == [
+        {"br_name": "br0"},
+        {"br_name": "br1"},
+    ]
+
+
+def test_transaction_rollback(store):
+    with store.transaction():
+        store.collection("bridges").upsert({"br_name": "br0"})
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.collection("bridges").upsert({"br_name": "br1"})
+            raise RuntimeError
+    assert store.collection("bridges").all() == [{"br_name": "br0"}]
+
+
+def test_transactions_from_threads(store, tmp_path):
+    def write(n: int):
+        with store.transaction():
+            store.collection("bridges").upsert({"br_name": f"br{n}"})
+            time.sleep(0.001)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert store._depth == 0
+    if isinstance(store, JsonStore):
+        store = JsonStore(str(tmp_path))
+    names = sorted(item["br_name"] for item in store.collection("bridges").all())
+    assert names == sorted(f"br{n}" for n in range(16))
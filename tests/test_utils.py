@@ -0,0 +1,89 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from utils import gather_cmds, run_async
+
+# writes its pid to the file given as argument, then sleeps
+SLEEPER = """
+import os, sys, time
+
+with open(sys.argv[1], "w") as f:
+    f.write(str(os.getpid()))
+time.sleep(30)
+"""
+
+
+@pytest.fixture
+def sleeper(tmp_path, wrapper):
+    """
+    return the arguments of a long command run through the wrapper,
+    and the file its pid is written to.
+    """
+    pid_file = tmp_path / "pid"
+    return [*wrapper, sys.executable, "-c", SLEEPER, str(pid_file)], pid_file
+
+
+def running(pid_file) -> bool:
+    try:
+        os.kill(int(pid_file.read_text()), 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_run_async():
+    result = asyncio.run(run_async(["sh", "-c", "echo out; echo err >&2; exit 3"]))
+    assert (result.stdout, result.stderr, result.returncode) == ("out\n", "err\n", 3)
+    assert not result.ok and not result.timed_out
+
+
+def test_run_async_stdin():
+    result = asyncio.run(run_async("cat", stdin="data"))
+    assert result.ok and result.stdout == "data"
+
+
+def test_run_async_timeout(sleeper):
+    args, pid_file = sleeper
+    start = time.perf_counter()
+    result = asyncio.run(run_async(args, timeout=1))
+    assert result.timed_out and not result.ok
+    assert time.perf_counter() - start < 5
+    # the command behind the wrapper is stopped too
+    assert not running(pid_file)
+
+
+def test_run_async_cancel(sleeper):
+    args, pid_file = sleeper
+
+    async def cancel():
+        task = asyncio.create_task(run_async(args))
+        while not pid_file.exists():
+            await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    start = time.perf_counter()
+    asyncio.run(cancel())
+    assert time.perf_counter() - start < 5
+    assert not running(pid_file)
+
+
+def test_gather_cmds_order_and_timeout():
+    inputs = [["sh", "-c", "sleep 0.3; echo a"], ["sleep", "5"], ["echo", "c"]]
+    results = asyncio.run(gather_cmds(inputs, timeout=1))
+    assert [r.stdout for r in results] == ["a\n", "", "c\n"]
+    assert [r.ok for r in results] == [True, False, True]
+    assert results[1].timed_out
+
+
+def test_gather_cmds_limit():
+    start = time.perf_counter()
+    results = asyncio.run(gather_cmds([["sleep", "0.3"]] * 4, limit=2))
+    assert all(r.ok for r in results)
+    # two rounds of two commands
+    assert time.perf_counter() - start >= 0.6
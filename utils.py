@@ -4,18 +4,34 @@ this module contains helper functions that perform various small tasks
 
 import os
 import csv
+import tempfile
 import subprocess
 import signal
+import asyncio
+import shlex
+import time
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable, Literal
 from datetime import datetime
 import re
 import json
 from getpass import getpass
+from lxd import get_lxd, LXDError
 
 
 TIME = datetime.now().strftime("%d-%m-%Y_%Hh-%Mm")
 DFLT_LOG_PATH = f"logs/{TIME}.txt"
 
+# max number of subprocesses the async executor runs at the same time
+MAX_PARALLEL = 16
+# seconds a stopped subprocess gets to exit before it is killed
+KILL_GRACE = 3
+
+# seconds a cached host fact stays valid
+FACTS_TTL = 300
+HOST_FACTS = "sys_data/host_facts.json"
+
 
 def file_exists(path: str):
     """
@@ -59,7 +75,9 @@ def load_csv_data(path: str):
         return "Specified path does not exist"
 
 
-def cmd(input: str | list, passwd: bool = False, shell: bool = False) -> str:
+def cmd(
+    input: str | list, passwd: bool = False, shell: bool = False, stdin: str = None
+) -> str:
     """
     take input and run as a command on shell. return output.
 
@@ -69,6 +87,8 @@ def cmd(input: str | list, passwd: bool = False, shell: bool = False) -> str:
     :type passwd: bool
     :param shell: set as true if you need shell functionalities (like > or --)
     :type shell: bool
+    :param stdin: text sent to the command's standard input
+    :type stdin: str
     :return: command output
     :rtype: str
     """
@@ -88,40 +108,279 @@ def cmd(input: str | list, passwd: bool = False, shell: bool = False) -> str:
         pw = getpass()
         out, _ = proc.communicate(input=pw)
     else:
-        out, _ = proc.communicate()
+        out, _ = proc.communicate(input=stdin)
     return out
 
 
-async def async_cmd(input: str) -> str:
+@dataclass
+class CmdResult:
     """
-    take input and run as a command. return output.
+    structured result of a command run by the async executor.
     """
 
-    proc = subprocess.Popen(
-        input, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=True, text=True
-    )
-    out, _ = proc.communicate()
-    return out
+    command: str
+    stdout: str = ""
+    stderr: str = ""
+    returncode: int | None = None
+    duration: float = 0.0
+    timed_out: bool = False
+    cancelled: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out and not self.cancelled
+
+    @property
+    def output(self) -> str:
+        """
+        stdout followed by stderr, same as the text returned by cmd().
+        """
+        return self.stdout + self.stderr
+
+
+async def run_async(
+    input: str | list,
+    shell: bool = False,
+    timeout: float | None = None,
+    stdin: str | None = None,
+    limiter: asyncio.Semaphore | None = None,
+) -> CmdResult:
+    """
+    run a command with asyncio subprocesses and return a CmdResult.
+    the process is stopped if it exceeds timeout or if the task is cancelled.
+
+    :param input: input command
+    :type input: str | list
+    :param shell: run the command through the shell
+    :type shell: bool
+    :param timeout: max seconds the command may run. None means no limit
+    :type timeout: float | None
+    :param stdin: text sent to the command's standard input
+    :type stdin: str | None
+    :param limiter: semaphore bounding the number of running commands
+    :type limiter: asyncio.Semaphore | None
+    :return: stdout, stderr, exit code and wall time of the command
+    :rtype: CmdResult
+    """
+    if limiter is None:
+        limiter = asyncio.Semaphore(1)
+    text = input if type(input) == str else shlex.join(input)
+    result = CmdResult(command=text)
+
+    async with limiter:
+        start = time.perf_counter()
+        stdin_pipe = subprocess.PIPE if stdin is not None else subprocess.DEVNULL
+        if shell:
+            proc = await asyncio.create_subprocess_shell(
+                text,
+                stdin=stdin_pipe,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        else:
+            args = input.split() if type(input) == str else input
+            proc = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=stdin_pipe,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        data = stdin.encode() if stdin is not None else None
+        try:
+            out, err = await asyncio.wait_for(proc.communicate(data), timeout)
+            result.stdout = out.decode(errors="replace")
+            result.stderr = err.decode(errors="replace")
+        except asyncio.TimeoutError:
+            result.timed_out = True
+            await terminate_process(proc)
+        except asyncio.CancelledError:
+            result.cancelled = True
+            await terminate_process(proc)
+            raise
+        finally:
+            result.returncode = proc.returncode
+            result.duration = time.perf_counter() - start
+    return result
+
+
+async def terminate_process(
+    proc: asyncio.subprocess.Process, grace: float = KILL_GRACE
+):
+    """
+    stop a running subprocess and reap it.
+    it gets SIGTERM first: sudo and `lxc exec` pass it on to the command in
+    the container, SIGKILL would only stop the wrapper. SIGKILL follows if it
+    is still running after grace seconds.
+    waits are bounded, a command left running keeps the pipes open and
+    proc.wait() would not return until it exits.
+    """
+    for stop in (proc.terminate, proc.kill):
+        if proc.returncode is not None:
+            return
+        try:
+            stop()
+        except ProcessLookupError:
+            pass
+        try:
+            await asyncio.wait_for(proc.wait(), grace)
+            return
+        except asyncio.TimeoutError:
+            pass
+
+
+async def gather_cmds(
+    inputs: list[str | list],
+    limit: int = MAX_PARALLEL,
+    shell: bool = False,
+    timeout: float | None = None,
+) -> list[CmdResult]:
+    """
+    run many commands concurrently, at most limit at a time.
+    results are returned in the same order as inputs.
+    """
+    limiter = asyncio.Semaphore(max(1, limit))
+    tasks = [
+        run_async(i, shell=shell, timeout=timeout, limiter=limiter) for i in inputs
+    ]
+    return await asyncio.gather(*tasks)
+
+
+def run_parallel(
+    inputs: list[str | list],
+    limit: int = MAX_PARALLEL,
+    shell: bool = False,
+    timeout: float | None = None,
+) -> list[CmdResult]:
+    """
+    blocking wrapper of gather_cmds() for code that is not async.
+    """
+    return asyncio.run(gather_cmds(inputs, limit=limit, shell=shell, timeout=timeout))
+
+
+async def async_cmd(input: str, timeout: float | None = None) -> str:
+    """
+    take input and run as a command. return output.
+    """
+    result = await run_async(input, shell=True, timeout=timeout)
+    return result.output
 
 
-def lxc_cmd(vm_name: str, command: str):
+def lxc_cmd(vm_name: str, command: str, sudo: bool = True):
     """
     execute a command inside a given VM or container from the host.
+    uses the LXD API when its socket is available, the lxc CLI otherwise.
+
+    :param vm_name: VM or container name
+    :type vm_name: str
+    :param command: command to execute. quoted arguments are kept together
+    :type command: str
+    :param sudo: run the lxc CLI with sudo
+    :type sudo: bool
+    :return: command output (stdout then stderr)
+    :rtype: str
     """
-    input = f"sudo lxc exec {vm_name} -- {command}"
-    out = cmd(input)
-    return out
+    return lxc_exec(vm_name, command, sudo=sudo).output
+
+
+def lxc_exec(
+    vm_name: str, command: str, sudo: bool = True, timeout: float | None = None
+) -> CmdResult:
+    """
+    execute a command inside a given VM or container and return a CmdResult
+    with its exit code. uses the LXD API when available, the lxc CLI otherwise.
+
+    :param vm_name: VM or container name
+    :type vm_name: str
+    :param command: command to execute. quoted arguments are kept together
+    :type command: str
+    :param sudo: run the lxc CLI with sudo
+    :type sudo: bool
+    :param timeout: max seconds to wait for the command
+    :type timeout: float | None
+    :return: stdout, stderr, exit code and wall time of the command
+    :rtype: CmdResult
+    """
+    result = CmdResult(command=f"lxc exec {vm_name} -- {command}")
+    start = time.perf_counter()
+    lxd = get_lxd()
+    if lxd:
+        try:
+            wait = int(timeout) if timeout is not None else -1
+            code, result.stdout, result.stderr = lxd.exec(
+                vm_name, shlex.split(command), timeout=wait
+            )
+            result.returncode = code
+        except LXDError as e:
+            result.stderr = f"Error: {e}\n"
+            result.timed_out = "still running" in str(e) or "timed out" in str(e)
+    else:
+        input = ["sudo"] if sudo else []
+        input += ["lxc", "exec", vm_name, "--", *shlex.split(command)]
+        try:
+            proc = subprocess.run(
+                input,
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+            )
+            result.returncode = proc.returncode
+            result.stdout, result.stderr = proc.stdout, proc.stderr
+        except subprocess.TimeoutExpired:
+            result.timed_out = True
+        except OSError as e:
+            result.stderr = f"Error: {e}\n"
+    result.duration = time.perf_counter() - start
+    return result
 
 
-async def async_lxc_cmd(vm_name: str, command: str):
+async def async_lxc_cmd(vm_name: str, command: str, timeout: float | None = None):
     """
     execute a command inside a given VM or container from the host.
     """
     input = f"sudo lxc exec {vm_name} -- {command}"
-    out = await async_cmd(input)
+    out = await async_cmd(input, timeout=timeout)
     return out
 
 
+def lxc_cmd_all(
+    vm_names: list[str],
+    command: str | dict[str, str],
+    limit: int = MAX_PARALLEL,
+    timeout: float | None = None,
+) -> dict[str, CmdResult]:
+    """
+    execute a command inside several VMs or containers concurrently.
+    uses the LXD API when available (one connection per worker thread),
+    the lxc CLI otherwise, like lxc_exec().
+
+    :param vm_names: VM or container names
+    :type vm_names: list[str]
+    :param command: command to execute in every VM, or the command of each
+        VM keyed by name
+    :type command: str | dict[str, str]
+    :param limit: max number of commands running at the same time
+    :type limit: int
+    :param timeout: max seconds for each command
+    :type timeout: float | None
+    :return: result of each VM, keyed by name
+    :rtype: dict[str, CmdResult]
+    """
+    commands = command if type(command) == dict else dict.fromkeys(vm_names, command)
+    if get_lxd():
+        with ThreadPoolExecutor(max_workers=max(1, limit)) as pool:
+            results = pool.map(
+                lambda vm: lxc_exec(vm, commands[vm], timeout=timeout), vm_names
+            )
+            return dict(zip(vm_names, results))
+    inputs = [
+        ["sudo", "lxc", "exec", vm, "--", *shlex.split(commands[vm])]
+        for vm in vm_names
+    ]
+    results = run_parallel(inputs, limit=limit, timeout=timeout)
+    return dict(zip(vm_names, results))
+
+
 def timeout_error():
     raise Exception("No output")
 
@@ -194,14 +453,22 @@ def is_installed(package: str, vm: str = ""):
 
 def save_json_file(data: json, path: str):
     """
-    save data into a json file
+    save data into a json file.
+    data is written to a temp file first, then renamed over path,
+    so readers never see a half-written file.
     """
     # f_exists = file_exists(path)
     directory = os.path.dirname(path)
     if directory:
         os.makedirs(directory, exist_ok=True)
-    with open(path, "w") as f:
-        json.dump(data, f, indent=3)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=3)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
 
 
 def read_json_file(path: str) -> list[dict]:
@@ -216,67 +483,61 @@ def read_json_file(path: str) -> list[dict]:
     return data
 
 
-def search_json_file(
-    key: str,
-    value: str | int,
-    path: str,
-) -> dict:
+# ========= host facts cache ========= #
+
+# fact name -> (time fetched, value)
+_host_facts = {}
+
+
+def cached_fact(key: str, fetch: Callable, ttl: float = FACTS_TTL):
     """
-    find a json item = {key: value} in path
+    return a cached host fact, or fetch and cache it if missing or expired.
+    empty values are not cached, so a fact that isn't available yet
+    (e.g. a container still booting) is fetched again next time.
+
+    :param key: fact name (e.g.: hostname, host_id:cont-1)
+    :type key: str
+    :param fetch: function that returns the fact
+    :type fetch: Callable
+    :param ttl: seconds the cached value stays valid
+    :type ttl: float
     """
-    data = read_json_file(path)
-    result = next((item for item in data if item[key] == value), None)
-    return result
+    hit = _host_facts.get(key)
+    now = time.time()
+    if hit and now - hit[0] < ttl:
+        return hit[1]
+    value = fetch()
+    if value:
+        _host_facts[key] = (now, value)
+    return value
 
 
-def update_json_file(key: str, value: str | int, new_item: dict, path: str):
+def invalidate_host_facts(key: str = ""):
     """
-    change a json item in path.
-    if an item exists in the file, change it with the item passed as param.
-    else, add the item to the file.
+    drop one cached host fact, or all of them if no key is given.
     """
-    data = read_json_file(path)
-    new_data = []
-    for item in data:
-        if item[key] == value:
-            # if item already exists in data
-            item = new_item
-        new_data.append(item)
-
-    if new_item not in data:
-        # if item doesn't exist in data
-        new_data.append(new_item)
-    save_json_file(data=new_data, path=path)
+    if key:
+        _host_facts.pop(key, None)
+    else:
+        _host_facts.clear()
 
 
-def add_to_json_file(new_items: list[dict], path: str):
+def save_host_facts(path: str = HOST_FACTS):
     """
-    check a list of dict objects.
-    new objects are added to a json file, existing items are ignored
-
-    :param new_items: new data objects
-    :type new_items: list[dict]
-    :param path: targeted file
-    :type path: str
+    save the cached host facts to a json file.
     """
-    data = read_json_file(path)
-    for item in new_items:
-        item_exists = item in data
-        if not item_exists:
-            data.append(item)
+    data = [{"fact": k, "time": t, "value": v} for k, (t, v) in _host_facts.items()]
     save_json_file(data=data, path=path)
 
 
-def delete_json_item(key: str, value: str | int, path: str):
+def load_host_facts(path: str = HOST_FACTS, ttl: float = FACTS_TTL):
     """
-    remove an item in json file.
+    load host facts saved by save_host_facts(). expired facts are skipped.
     """
-    data = read_json_file(path)
-    new_data = []
-    for item in data:
-        if item[key] != value:
-            new_data.append(item)
-    save_json_file(data=new_data, path=path)
+    now = time.time()
+    for item in read_json_file(path):
+        if now - item["time"] < ttl:
+            _host_facts[item["fact"]] = (item["time"], item["value"])
 
 
 # ========= host info functions ========= #
@@ -287,8 +548,7 @@ def get_hostname():
     return the hostname for the host running this script
     output: str
     """
-    output = cmd(input="hostname")
-    return output.strip()
+    return cached_fact("hostname", lambda: cmd(input="hostname").strip())
 
 
 def get_ipv4s():
@@ -296,10 +556,8 @@ def get_ipv4s():
     return a list of the ips of interfaces of the host running this script
     output: list[str]
     """
-    output = cmd(input="hostname -I")
-    output_as_list = output.split(" ")
-    output_as_list.remove("\n")
-    return output_as_list
+    ips = cached_fact("ipv4s", lambda: cmd(input="hostname -I").split())
+    return list(ips)
 
 
 def get_iface_data(ip: str) -> dict:
@@ -315,6 +573,32 @@ def get_iface_data(ip: str) -> dict:
     return json.loads(output)[0]
 
 
+def get_ifaces() -> list[dict]:
+    """
+    return the data of every interface of the host.
+    all interfaces are read with a single `ip -j -d addr` call.
+    """
+    output = cmd("ip -j -d addr")
+    return json.loads(output or "[]")
+
+
+def get_ifaces_by_ip(links: list[dict] | None = None) -> dict[str, dict]:
+    """
+    return the data of every interface of the host, keyed by each of its
+    addresses.
+
+    :param links: interfaces already read (see get_ifaces). read again if None
+    :type links: list[dict] | None
+    :return: {address: interface data}
+    :rtype: dict[str, dict]
+    """
+    ifaces = {}
+    for iface in get_ifaces() if links is None else links:
+        for addr in iface.get("addr_info", []):
+            ifaces.setdefault(addr.get("local"), iface)
+    return ifaces
+
+
 def get_host_id(mode: Literal["local", "vm"], vm: str = ""):
     """
     get the id number of a host. The rightmost number in a IPv4.
@@ -322,19 +606,23 @@ def get_host_id(mode: Literal["local", "vm"], vm: str = ""):
     must provide a virtual-machine name when using vm mode.
     only works if the interface has the pattern: 10.0.<number>.<number>
     """
-    host_id = ""
-    out = ""
-    if mode == "local":
-        out = cmd("hostname -I")
-    elif mode == "vm":
-        out = lxc_cmd(vm, "hostname -I")
-
-    out_ips = out.split(" ")
-    for ip in out_ips:
-        host_id = id_from_ipv4(ip=ip)
-        if host_id != "":
-            break
-    return host_id
+
+    def fetch():
+        host_id = ""
+        out_ips = []
+        if mode == "local":
+            out_ips = get_ipv4s()
+        elif mode == "vm":
+            out_ips = lxc_cmd(vm, "hostname -I").split(" ")
+
+        for ip in out_ips:
+            host_id = id_from_ipv4(ip=ip)
+            if host_id != "":
+                break
+        return host_id
+
+    key = "host_id:local" if mode == "local" else f"host_id:{vm}"
+    return cached_fact(key, fetch)
 
 
 def id_from_ipv4(ip: str):
@@ -352,9 +640,15 @@ def id_from_ipv4(ip: str):
     return host_id
 
 
-def get_iface_info(iface: str) -> str:
+def get_iface_info(iface: str) -> tuple[str, str]:
+    """
+    return the IPv4 address and netmask of an interface. the result is cached.
+    """
 
-    command = f"ip -o -f inet addr show {iface} | awk '{{print $4}}'"
-    ip, netmask = cmd(command, shell=True).strip().split("/")
+    def fetch():
+        command = f"ip -o -f inet addr show {iface} | awk '{{print $4}}'"
+        ip, netmask = cmd(command, shell=True).strip().split("/")
+        return [ip, netmask]
 
+    ip, netmask = cached_fact(f"iface:{iface}", fetch)
     return ip, netmask